@@ -1,45 +1,173 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context, url_for
 from car_bot import CarPostingBot
 from chat_assistant import get_chat_response, get_api_status
-from image_processor import CarImageProcessor
+from image_processor import CarImageProcessor, get_memory_budget
+from image_store import ImageStore
+from image_jobs import JobQueue
+from upload_spool import UploadSpool
+from post_cache import PostCache, normalize_description
+from http_cache import ResponseCache, ResponseCompressor
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 from functools import lru_cache
+import json
 import os
+import re
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max upload
-app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['UPLOAD_FOLDER'] = os.getenv('CARBOT_UPLOAD_DIR', 'uploads')
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
+BATCH_MAX_ITEMS = int(os.getenv('CARBOT_BATCH_MAX_ITEMS', '10000'))  # descriptions per /api/process-cars call
 
 # Lazy load modules
 _bot = None
 _image_processor = None
+_post_cache = None
+_job_queue = None
+_upload_spool = None
+_response_cache = None
+_response_compressor = None
 
 def get_bot():
     """Lazy load bot module"""
     global _bot
     if _bot is None:
         _bot = CarPostingBot()
+        # The scripts are the same in every post - deflate them once, not per response
+        for script in (_bot.get_inquiry_script(), _bot.get_delivery_script()):
+            get_response_compressor().add_static(app.json.dumps(script).encode('utf-8'))
     return _bot
 
 def get_image_processor():
-    """Lazy load image processor"""
+    """Lazy load image processor (processed photos kept in CARBOT_IMAGE_STORE)"""
     global _image_processor
     if _image_processor is None:
-        _image_processor = CarImageProcessor()
+        _image_processor = CarImageProcessor(image_store=ImageStore.from_env())
     return _image_processor
 
+def get_post_cache():
+    """Lazy load post cache (CARBOT_CACHE_SIZE / CARBOT_CACHE_DB)"""
+    global _post_cache
+    if _post_cache is None:
+        _post_cache = PostCache.from_env()
+    return _post_cache
+
+def get_job_queue():
+    """Lazy load image job queue (CARBOT_JOBS_DIR / CARBOT_JOB_WORKERS / CARBOT_JOB_TTL_HOURS)"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue.from_env(get_image_processor)
+    return _job_queue
+
+def get_upload_spool():
+    """Lazy load upload spool (CARBOT_UPLOAD_DIR / CARBOT_UPLOAD_MB / CARBOT_UPLOAD_TTL_HOURS)"""
+    global _upload_spool
+    if _upload_spool is None:
+        _upload_spool = UploadSpool.from_env(app.config['UPLOAD_FOLDER'])
+    return _upload_spool
+
+def get_response_cache():
+    """Lazy load API response cache (CARBOT_RESPONSE_CACHE_SIZE)"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache.from_env()
+    return _response_cache
+
+def get_response_compressor():
+    """Lazy load response compressor (CARBOT_COMPRESS_MIN_BYTES / CARBOT_COMPRESS_LEVEL)"""
+    global _response_compressor
+    if _response_compressor is None:
+        _response_compressor = ResponseCompressor.from_env()
+    return _response_compressor
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+@app.after_request
+def compress_response(response):
+    """gzip / Brotli for clients that accept it (see ResponseCompressor)"""
+    return get_response_compressor().compress(response)
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/api/process-car', methods=['POST'])
 def process_car():
+    """
+    Process a car description - the post is a pure function of the normalised
+    description and the bot's content version, so that pair is the cache key and
+    the ETag: a resubmitted description is answered from the memo without any
+    work (it's a POST, so If-None-Match does not turn it into a 304)
+
+    "inline_scripts": false returns a compact post whose data.scripts points at
+    /api/scripts/<version> instead of embedding the static scripts (default true
+    keeps the original shape for existing clients)
+    """
+    data = request.get_json(silent=True)
+    description = data.get('description') if isinstance(data, dict) else None
+    if not isinstance(description, str):
+        return _render_process_car()  # let validation explain
+    key = ResponseCache.make_etag('process-car', get_bot().content_version, _inline_scripts(data),
+                                  normalize_description(description))
+    return get_response_cache().respond(key, _render_process_car, cache_control='private, no-cache',
+                                        request_etag=key)
+
+def _description_error(description):
+    """Validation message for a (stripped) description, or None - shared by the single and batch endpoints"""
+    if not description:
+        return 'Please enter a car description'
+    if len(description) < 20:
+        return 'Description too short - please provide more details (minimum 20 characters)'
+    if len(description) > 5000:
+        return 'Description too long - please keep it under 5000 characters'
+    return None
+
+def _post_data(result, inline_scripts):
+    """API shape of a successful generate_full_post result"""
+    post = {
+        'selling_angle': result['selling_angle'],
+        'category': result['category'],
+        'caption': result['caption'],
+        'hashtags': result['hashtags'],
+        'features': result['features_summary'],
+        'posting_instructions': result['posting_instructions'],
+        'car_info': {
+            'make_model': result['car_info']['make_model'],
+            'year': result['car_info']['year'],
+            'mileage': result['car_info']['mileage'],
+            'price': result['car_info']['asking_price'],
+            'engine': result['car_info']['engine'],
+            'transmission': result['car_info']['transmission']
+        }
+    }
+    if inline_scripts:
+        post['inquiry_script'] = result['inquiry_script']
+        post['delivery_script'] = result['delivery_script']
+    else:
+        post['scripts'] = {
+            'version': result['scripts_version'],
+            'url': url_for('static_scripts', version=result['scripts_version'])
+        }
+    return post
+
+def _result_errors(result):
+    """Errors of a failed result as a clean list of strings"""
+    # Ensure errors is a list
+    errors = result.get('errors', [])
+    if not isinstance(errors, list):
+        errors = [str(errors)] if errors else ['An error occurred']
+    
+    # Filter out None/undefined values
+    return [str(e) if e else 'Unknown error' for e in errors if e]
+
+def _inline_scripts(data):
+    return data.get('inline_scripts', True) is not False
+
+def _render_process_car():
     """API endpoint to process car description with comprehensive error handling"""
     try:
         data = request.get_json()
@@ -52,61 +180,26 @@ def process_car():
         description = data.get('description', '').strip()
         
         # Validation
-        if not description:
-            return jsonify({
-                'success': False,
-                'errors': ['Please enter a car description']
-            }), 400
-        
-        if len(description) < 20:
-            return jsonify({
-                'success': False,
-                'errors': ['Description too short - please provide more details (minimum 20 characters)']
-            }), 400
-        
-        if len(description) > 5000:
+        error = _description_error(description)
+        if error:
             return jsonify({
                 'success': False,
-                'errors': ['Description too long - please keep it under 5000 characters']
+                'errors': [error]
             }), 400
         
         bot = get_bot()
-        result = bot.generate_full_post(description)
+        inline_scripts = _inline_scripts(data)
+        result = get_post_cache().generate(bot, description, inline_scripts=inline_scripts)
         
         if result['success']:
             return jsonify({
                 'success': True,
-                'data': {
-                    'selling_angle': result['selling_angle'],
-                    'category': result['category'],
-                    'caption': result['caption'],
-                    'hashtags': result['hashtags'],
-                    'features': result['features_summary'],
-                    'posting_instructions': result['posting_instructions'],
-                    'inquiry_script': result['inquiry_script'],
-                    'delivery_script': result['delivery_script'],
-                    'car_info': {
-                        'make_model': result['car_info']['make_model'],
-                        'year': result['car_info']['year'],
-                        'mileage': result['car_info']['mileage'],
-                        'price': result['car_info']['asking_price'],
-                        'engine': result['car_info']['engine'],
-                        'transmission': result['car_info']['transmission']
-                    }
-                }
+                'data': _post_data(result, inline_scripts)
             })
         else:
-            # Ensure errors is a list
-            errors = result.get('errors', [])
-            if not isinstance(errors, list):
-                errors = [str(errors)] if errors else ['An error occurred']
-            
-            # Filter out None/undefined values
-            errors = [str(e) if e else 'Unknown error' for e in errors if e]
-            
             return jsonify({
                 'success': False,
-                'errors': errors,
+                'errors': _result_errors(result),
                 'message': result.get('message', 'An error occurred')
             }), 400
     
@@ -116,6 +209,105 @@ def process_car():
             'errors': [f'Error processing description: {str(e)}']
         }), 500
 
+@app.route('/api/process-cars', methods=['POST'])
+def process_cars():
+    """
+    Batch version of /api/process-car for bulk listing generation
+    Body: a JSON array of descriptions (strings or {"description": ...} objects),
+    {"descriptions": [...]}, or NDJSON (Content-Type: application/x-ndjson). The body
+    is read in full before the response starts - WSGI servers and buffering proxies
+    can't be relied on to deliver request bytes once the response has begun. The
+    response is NDJSON streamed (gzip per line when accepted) as each item finishes: {"index", "success": true, "data"} or {"index", "success": false, "errors"},
+    then {"summary": {"total", "success", "failed"}}. Scripts are referenced by
+    version unless inline_scripts is true.
+    """
+    inline_scripts = request.args.get('inline_scripts', '').lower() in ('1', 'true', 'yes')
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = _ndjson_items(request.get_data())
+    else:
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            inline_scripts = inline_scripts or body.get('inline_scripts') is True
+            body = body.get('descriptions')
+        items = [(item, None) for item in body] if isinstance(body, list) else []
+    if not items:
+        return jsonify({
+            'success': False,
+            'errors': ['Send a JSON array of descriptions (or NDJSON, one per line)']
+        }), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({
+            'success': False,
+            'errors': [f'Maximum {BATCH_MAX_ITEMS} descriptions per batch']
+        }), 400
+    return Response(stream_with_context(_generate_batch(items, inline_scripts)), mimetype='application/x-ndjson')
+
+def _ndjson_items(body):
+    """(value, error) per non-blank NDJSON line of the request body"""
+    items = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append((json.loads(line), None))
+        except ValueError:
+            items.append((None, 'Invalid JSON line'))
+    return items
+
+def _generate_batch(items, inline_scripts):
+    """One NDJSON line per description, written as soon as its post is generated"""
+    bot = get_bot()
+    post_cache = get_post_cache()
+    counts = {'total': 0, 'success': 0, 'failed': 0}
+    for index, (item, error) in enumerate(items):
+        if error is None:
+            description = item.get('description') if isinstance(item, dict) else item
+            description = description.strip() if isinstance(description, str) else ''
+            error = _description_error(description)
+        
+        if error:
+            line = {'index': index, 'success': False, 'errors': [error]}
+        else:
+            try:
+                result = post_cache.generate(bot, description, inline_scripts=inline_scripts)
+            except Exception as e:
+                result = {'success': False, 'errors': [f'Error processing description: {str(e)}']}
+            if result['success']:
+                line = {'index': index, 'success': True, 'data': _post_data(result, inline_scripts)}
+            else:
+                line = {'index': index, 'success': False, 'errors': _result_errors(result),
+                        'message': result.get('message', 'An error occurred')}
+        counts['total'] += 1
+        counts['success' if line['success'] else 'failed'] += 1
+        yield app.json.dumps(line) + '\n'
+    yield app.json.dumps({'summary': counts}) + '\n'
+
+@app.route('/api/scripts', methods=['GET'])
+def current_scripts():
+    """Version and URL of the current static scripts (revalidated on every use)"""
+    version = get_bot().scripts_version
+    return get_response_cache().respond(f'scripts-current:{version}', lambda: jsonify({
+        'success': True,
+        'version': version,
+        'url': url_for('static_scripts', version=version)
+    }))
+
+@app.route('/api/scripts/<version>', methods=['GET'])
+def static_scripts(version):
+    """
+    Inquiry and delivery scripts shared by every post - immutable per version,
+    so clients and proxies may keep them for a year
+    """
+    bot = get_bot()
+    if version != bot.scripts_version:
+        return jsonify({
+            'success': False,
+            'errors': ['Unknown scripts version - fetch /api/scripts for the current one']
+        }), 404
+    return get_response_cache().respond(
+        f'scripts:{version}', lambda: jsonify({'success': True, 'version': version, **bot.get_static_scripts()}),
+        cache_control='public, max-age=31536000, immutable', request_etag=f'scripts-{version}')
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     """API endpoint for AI chat assistant"""
@@ -138,16 +330,37 @@ def chat():
             'error': f'Error generating response: {str(e)}'
         }), 500
 
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """Post/response/background cache counters and image memory admission metrics"""
+    return jsonify({
+        'success': True,
+        'cache': get_post_cache().stats(),
+        'responses': get_response_cache().stats(),
+        'compression': get_response_compressor().stats(),
+        # Don't load the image processor just to report on it
+        'backgrounds': _image_processor.background_cache.stats() if _image_processor else None,
+        'image_store': _image_processor.image_store.stats() if _image_processor else None,
+        'image_jobs': _job_queue.stats() if _job_queue else None,
+        'uploads': _upload_spool.stats() if _upload_spool else None,
+        # Process-wide image admission control: bytes in flight and tasks waiting
+        'image_memory': get_memory_budget().stats()
+    })
+
 @app.route('/api/chat-status', methods=['GET'])
 def chat_status():
-    """Get chat assistant status and API configuration"""
-    return jsonify(get_api_status())
+    """Get chat assistant status and API configuration (re-read at most once a minute)"""
+    return get_response_cache().respond('chat-status', lambda: jsonify(get_api_status()), ttl=60)
 
 @app.route('/api/image-backgrounds', methods=['GET'])
 def image_backgrounds():
-    """Get available background presets"""
+    """Get available background presets (static - browsers may keep them for an hour)"""
+    return get_response_cache().respond('image-backgrounds', _render_image_backgrounds,
+                                        cache_control='public, max-age=3600')
+
+def _render_image_backgrounds():
     try:
-        backgrounds = image_processor.get_preset_backgrounds()
+        backgrounds = get_image_processor().get_preset_backgrounds()
         return jsonify({
             'success': True,
             'backgrounds': backgrounds
@@ -155,6 +368,172 @@ def image_backgrounds():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/uploads', methods=['POST'])
+def upload_image():
+    """
+    Stream one photo (raw request body, not multipart) into the upload spool
+    Returns its upload_id (SHA-256) for /api/images/jobs. Bad or oversized photos
+    are refused after the first chunk, before the rest of the body is read.
+    """
+    try:
+        result = get_upload_spool().spool(request.stream, request.content_length)
+        return jsonify(_upload_response(result)), 201 if result['success'] else result['status']
+    except RequestEntityTooLarge:
+        return jsonify({'success': False, 'errors': ['Upload too large']}), 413
+    except Exception as e:
+        return jsonify({'success': False, 'errors': [f'Error receiving upload: {str(e)}']}), 500
+
+@app.route('/api/uploads/resumable', methods=['POST'])
+def start_resumable_upload():
+    """Open a resumable upload - send the size as Upload-Length, then PUT the pieces"""
+    try:
+        total = int(request.headers.get('Upload-Length', ''))
+    except ValueError:
+        return jsonify({'success': False, 'errors': ['Upload-Length header required']}), 400
+    result = get_upload_spool().start(total)
+    if not result['success']:
+        return jsonify(_upload_response(result)), result['status']
+    result['upload_url'] = url_for('resumable_upload', upload_id=result['upload_id'])
+    return jsonify(result), 201
+
+@app.route('/api/uploads/resumable/<upload_id>', methods=['GET', 'PUT'])
+def resumable_upload(upload_id):
+    """
+    GET: bytes received so far (resume from there after a dropped connection)
+    PUT: next piece, with Content-Range: bytes <start>-<end>/<total>
+    """
+    spool = get_upload_spool()
+    if request.method == 'GET':
+        offset = spool.offset(upload_id)
+        if offset is None:
+            return jsonify({'success': False, 'errors': ['Upload not found (it may have expired)']}), 404
+        return jsonify({'success': True, 'upload_id': upload_id, 'offset': offset})
+    
+    content_range = request.headers.get('Content-Range', '')
+    match = re.fullmatch(r'bytes (\d+)-\d+/(\d+)', content_range)
+    if not match:
+        return jsonify({'success': False, 'errors': ['Content-Range: bytes <start>-<end>/<total> required']}), 400
+    try:
+        result = spool.append(upload_id, request.stream, int(match.group(1)), int(match.group(2)))
+    except RequestEntityTooLarge:
+        return jsonify({'success': False, 'errors': ['Upload too large']}), 413
+    except Exception as e:
+        return jsonify({'success': False, 'errors': [f'Error receiving upload: {str(e)}']}), 500
+    if not result['success']:
+        return jsonify(_upload_response(result)), result['status']
+    return jsonify(result), 201 if result['complete'] else 200
+
+def _upload_response(result):
+    """Spool result in the API's {'success', 'errors'} shape"""
+    if result['success']:
+        return result
+    response = {'success': False, 'errors': [result['error']]}
+    if 'offset' in result:
+        response['offset'] = result['offset']
+    return response
+
+@app.route('/api/images/jobs', methods=['POST'])
+def create_image_job():
+    """
+    Queue a batch of car photos for background processing - returns a job id immediately
+    Photos come as multipart 'images' or, already streamed to /api/uploads, as JSON
+    {"uploads": [upload_id, ...], "background": ...}
+    """
+    if request.is_json:
+        return _create_image_job_from_uploads(request.get_json(silent=True) or {})
+    try:
+        files = [f for f in request.files.getlist('images') if f and f.filename]
+        if len(files) < 2:
+            return jsonify({
+                'success': False,
+                'errors': [f'Need at least 2 images. You uploaded {len(files)} image(s).']
+            }), 400
+        if len(files) > 25:
+            return jsonify({
+                'success': False,
+                'errors': ['Maximum 25 images allowed. Please reduce your selection.']
+            }), 400
+        rejected = [f.filename for f in files if not allowed_file(f.filename)]
+        if rejected:
+            return jsonify({
+                'success': False,
+                'errors': [f'Unsupported file type: {name} (JPG, PNG, GIF, WebP)' for name in rejected]
+            }), 400
+        
+        job_id = get_job_queue().submit(
+            [(secure_filename(f.filename), f.stream) for f in files],
+            background_preset=request.form.get('background', 'none'),
+            listing_id=request.form.get('listing_id') or None,
+            dealer_id=request.form.get('dealer_id') or None)
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status_url': url_for('image_job_status', job_id=job_id)
+        }), 202
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'errors': [f'Error queueing images: {str(e)}']
+        }), 500
+
+def _create_image_job_from_uploads(body):
+    """Queue a job for photos already in the upload spool"""
+    upload_ids = body.get('uploads') or []
+    if not isinstance(upload_ids, list) or not 2 <= len(upload_ids) <= 25:
+        return jsonify({
+            'success': False,
+            'errors': ['Need between 2 and 25 uploads.']
+        }), 400
+    spool = get_upload_spool()
+    paths = [spool.path(str(upload_id)) for upload_id in upload_ids]
+    missing = [upload_id for upload_id, path in zip(upload_ids, paths) if path is None]
+    if missing:
+        return jsonify({
+            'success': False,
+            'errors': [f'Upload not found (it may have expired): {upload_id}' for upload_id in missing]
+        }), 400
+    
+    streams = [open(path, 'rb') for path in paths]
+    try:
+        job_id = get_job_queue().submit(
+            [(os.path.basename(path), stream) for path, stream in zip(paths, streams)],
+            background_preset=body.get('background', 'none'),
+            listing_id=body.get('listing_id') or None,
+            dealer_id=body.get('dealer_id') or None)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'errors': [f'Error queueing images: {str(e)}']
+        }), 500
+    finally:
+        for stream in streams:
+            stream.close()
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('image_job_status', job_id=job_id)
+    }), 202
+
+@app.route('/api/images/jobs/<job_id>', methods=['GET'])
+def image_job_status(job_id):
+    """Job progress, then per-image results with download URLs"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'errors': ['Job not found (it may have expired)']}), 404
+    
+    if job['result']:
+        for image in job['result']['images']:
+            image['url'] = url_for('image_job_output', job_id=job_id, filename=image['file'])
+    return jsonify({'success': job['status'] != 'failed', 'job': job})
+
+@app.route('/api/images/jobs/<job_id>/images/<filename>', methods=['GET'])
+def image_job_output(job_id, filename):
+    """Download one processed photo"""
+    path = get_job_queue().output_path(job_id, filename)
+    if path is None:
+        return jsonify({'success': False, 'errors': ['Image not found']}), 404
+    return send_file(path)
+
 if __name__ == '__main__':
     print("\n" + "="*70)
     print("� MERCEDES CAR POSTING BOT - LOCALHOST SERVER")
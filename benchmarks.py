@@ -0,0 +1,717 @@
+"""
+Performance Benchmarks - Measure the hot paths of the car posting bot
+Run: python benchmarks.py [name ...]   (no name = run all)
+"""
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+
+def _timeit(func, repeat: int = 5, number: int = 1) -> float:
+    """Best-of-N wall time in seconds for `number` calls of func"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# ==================== CAR BOT ====================
+
+def bench_parse():
+    """Per-description cost of CarPostingBot.parse_car_description"""
+    from car_bot import CarPostingBot
+
+    corpus_path = Path(__file__).parent / 'test_car_bot_corpus.json'
+    with open(corpus_path, encoding='utf-8') as f:
+        descriptions = [entry['description'] for entry in json.load(f)]
+
+    bot = CarPostingBot()
+    rounds = 50
+    elapsed = _timeit(lambda: [bot.parse_car_description(d) for d in descriptions], number=rounds)
+    per_item = elapsed / (rounds * len(descriptions))
+    print(f"parse_car_description: {per_item * 1e6:8.1f} us/description "
+          f"({1 / per_item:,.0f} descriptions/sec, corpus={len(descriptions)})")
+
+
+def bench_stream():
+    """Throughput and peak Python memory of stream_posts over growing JSONL inventories"""
+    import io
+    import tempfile
+    import tracemalloc
+    from car_bot import CarPostingBot, write_posts_jsonl
+
+    corpus_path = Path(__file__).parent / 'test_car_bot_corpus.json'
+    with open(corpus_path, encoding='utf-8') as f:
+        descriptions = [entry['description'] for entry in json.load(f)]
+
+    class _NullWriter(io.TextIOBase):
+        def write(self, s):
+            return len(s)
+
+    bot = CarPostingBot()
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (1000, 10000, 50000):
+            path = Path(tmp) / f'inventory_{size}.jsonl'
+            with open(path, 'w', encoding='utf-8') as f:
+                for i in range(size):
+                    f.write(json.dumps({'description': descriptions[i % len(descriptions)]}) + '\n')
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            counts = write_posts_jsonl(bot.stream_posts(path), _NullWriter())
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"stream_posts {size:>6} listings: {counts['total'] / elapsed:8,.0f} listings/sec, "
+                  f"peak traced memory {peak / 1024:8.1f} KiB")
+
+
+def bench_parallel():
+    """Listings/sec of generate_posts_parallel at 1, 2, 4 and 8 worker processes"""
+    import os
+    from car_bot import CarPostingBot, generate_posts_parallel
+
+    corpus_path = Path(__file__).parent / 'test_car_bot_corpus.json'
+    with open(corpus_path, encoding='utf-8') as f:
+        descriptions = [entry['description'] for entry in json.load(f)]
+    listings = [descriptions[i % len(descriptions)] for i in range(20000)]
+
+    bot = CarPostingBot()
+    start = time.perf_counter()
+    for _ in bot.generate_posts_batch(listings):
+        pass
+    print(f"in-process            : {len(listings) / (time.perf_counter() - start):8,.0f} listings/sec")
+
+    print(f"(machine has {os.cpu_count()} CPUs)")
+    for workers in (1, 2, 4, 8):
+        start = time.perf_counter()
+        for _ in generate_posts_parallel(listings, workers=workers, chunk_size=256):
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"{workers} worker(s)           : {len(listings) / elapsed:8,.0f} listings/sec")
+
+
+def bench_gazetteer():
+    """Gazetteer scan cost per description as the catalogue grows (should stay flat)"""
+    from gazetteer import Gazetteer, load_gazetteer
+
+    corpus_path = Path(__file__).parent / 'test_car_bot_corpus.json'
+    with open(corpus_path, encoding='utf-8') as f:
+        descriptions = [entry['description'] for entry in json.load(f)]
+
+    def synthetic(brand_count):
+        return Gazetteer.from_dict({'brands': [
+            {'name': f'Brand{b}', 'models': [
+                {'name': f'Model{b}x{m}', 'trims': [f'Trim{t}' for t in range(5)]} for m in range(20)]}
+            for b in range(brand_count)]})
+
+    catalogues = [('bundled', load_gazetteer())] + [(f'{n} brands', synthetic(n)) for n in (100, 1000)]
+    for name, gazetteer in catalogues:
+        rounds = 50
+        elapsed = _timeit(lambda: [gazetteer.scan(d) for d in descriptions], number=rounds)
+        print(f"scan with {name:>11} catalogue ({gazetteer.entry_count:>6} entries): "
+              f"{elapsed / (rounds * len(descriptions)) * 1e6:6.1f} us/description")
+
+
+def bench_cache():
+    """generate_full_post cold vs. served from the post cache (memory and SQLite tiers)"""
+    import os
+    import tempfile
+    from car_bot import CarPostingBot
+    from post_cache import PostCache
+
+    corpus_path = Path(__file__).parent / 'test_car_bot_corpus.json'
+    with open(corpus_path, encoding='utf-8') as f:
+        descriptions = [entry['description'] for entry in json.load(f)]
+
+    bot = CarPostingBot()
+    rounds = 20
+    uncached = _timeit(lambda: [bot.generate_full_post(d) for d in descriptions], number=rounds)
+    print(f"uncached generate_full_post: {uncached / (rounds * len(descriptions)) * 1e6:8.1f} us/post")
+
+    cache = PostCache()
+    [cache.generate(bot, d) for d in descriptions]
+    warm = _timeit(lambda: [cache.generate(bot, d) for d in descriptions], number=rounds)
+    print(f"memory cache hit           : {warm / (rounds * len(descriptions)) * 1e6:8.1f} us/post")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'posts.db')
+        [PostCache(db_path=db_path).generate(bot, d) for d in descriptions]
+        start = time.perf_counter()
+        restarted = PostCache(db_path=db_path)  # fresh process: empty memory tier
+        [restarted.generate(bot, d) for d in descriptions]
+        elapsed = time.perf_counter() - start
+        print(f"disk cache hit (restart)   : {elapsed / len(descriptions) * 1e6:8.1f} us/post "
+              f"({restarted.stats()['disk_hits']} disk hits)")
+
+
+# ==================== IMAGE PROCESSOR ====================
+
+def bench_backgrounds():
+    """Render time of every background preset at 1, 4 and 12 MP canvases"""
+    from image_processor import CarImageProcessor
+
+    processor = CarImageProcessor()
+    sizes = [(1000, 1000), (2000, 2000), (4000, 3000)]
+    print(f"{'preset':<18}" + ''.join(f"{w * h / 1e6:>8.0f} MP" for w, h in sizes))
+    for preset in processor.PRESET_BACKGROUNDS:
+        timings = [_timeit(lambda: processor._create_background_by_preset(w, h, preset), repeat=1)
+                   for w, h in sizes]
+        print(f"{preset:<18}" + ''.join(f"{t * 1e3:>8.0f} ms" for t in timings))
+
+
+def _synthetic_photos(count: int, size=(1280, 960), distinct: bool = False):
+    """
+    In-memory JPEG uploads with some texture, so enhance/encode do real work
+    By default they are near-identical (dedupe collapses them); distinct=True paints
+    seeded blocks over each one so every photo has its own perceptual hash
+    """
+    import io
+    import random
+    from PIL import Image, ImageDraw
+
+    photos = []
+    for i in range(count):
+        image = Image.effect_mandelbrot(size, (-2.2 + i * 0.01, -1.2, 1.0, 1.2), 64).convert('RGB')
+        if distinct:
+            rng = random.Random(i)
+            draw = ImageDraw.Draw(image)
+            for _ in range(12):
+                x, y = rng.randrange(size[0]), rng.randrange(size[1])
+                draw.rectangle((x, y, x + size[0] // 4, y + size[1] // 4),
+                               fill=tuple(rng.randrange(256) for _ in range(3)))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=90)
+        photos.append(buffer.getvalue())
+    return photos
+
+
+def bench_pipeline():
+    """25-photo process_images batch, sequential vs. thread-pool pipeline"""
+    import io
+    import os
+    from image_processor import CarImageProcessor
+
+    photos = _synthetic_photos(25)
+    print(f"25 x 1280x960 JPEG uploads, preset=gradient_blue, cpus={os.cpu_count()}")
+    for workers in (1, 2, 4):
+        processor = CarImageProcessor(max_workers=workers)
+        start = time.perf_counter()
+        result = processor.process_images([io.BytesIO(p) for p in photos], 'gradient_blue',
+                                            dedupe=False)  # near-identical fractals
+        elapsed = time.perf_counter() - start
+        print(f"{workers} worker(s): {elapsed:6.2f} s  ({25 / elapsed:5.2f} images/sec, "
+              f"processed={result.get('processed_count')})")
+
+
+def _current_rss_kib() -> int:
+    """Resident set size right now (Linux) - ru_maxrss only reports the peak"""
+    import os
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+
+
+def _pipeline_run(photo: bytes, preset: str, options: dict):
+    """One cover photo through the pipeline in a fresh process: (seconds, peak RSS growth MiB, jpeg)"""
+    import io
+    import resource
+    from PIL import Image
+    from image_processor import CarImageProcessor
+
+    processor = CarImageProcessor(**options)
+    baseline = _current_rss_kib()
+    start = time.perf_counter()
+    outcome = processor._process_one_image(0, 0, Image.open(io.BytesIO(photo)), preset, None)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    return elapsed, peak / 1024, bytes(outcome['bytes'])
+
+
+_out_dir = None  # --out, or a temp dir created on first use
+
+
+def _output_dir():
+    """Where benchmarks write images for visual checks - never the checkout"""
+    global _out_dir
+    if _out_dir is None:
+        import tempfile
+        _out_dir = tempfile.mkdtemp(prefix='carbot-bench-')
+    os.makedirs(_out_dir, exist_ok=True)
+    return _out_dir
+
+
+def bench_decode():
+    """Full-resolution vs. draft decode of a 12 MP phone photo: time, peak RSS, PSNR, side-by-side"""
+    import io
+    import multiprocessing
+    from PIL import Image, ImageChops, ImageStat
+
+    photo = _synthetic_photos(1, size=(4000, 3000))[0]
+    out_dir = _output_dir()
+    context = multiprocessing.get_context('spawn')  # clean RSS baseline per run
+    for preset in ('none', 'gradient_blue'):
+        outputs = {}
+        for draft in (False, True):
+            with context.Pool(1) as pool:
+                elapsed, peak, data = pool.apply(_pipeline_run, (photo, preset, {'draft_decode': draft,
+                                                                                 'frugal_compositing': False}))
+            outputs[draft] = Image.open(io.BytesIO(data)).convert('RGB')
+            print(f"{preset:<14} {'draft' if draft else 'full ':<6}: {elapsed:6.2f} s  peak +{peak:7.1f} MiB")
+
+        mse = sum(ImageStat.Stat(ImageChops.difference(outputs[False], outputs[True])).rms[c] ** 2
+                  for c in range(3)) / 3
+        psnr = float('inf') if mse == 0 else 10 * __import__('math').log10(255 ** 2 / mse)
+        side_by_side = Image.new('RGB', (outputs[False].width * 2, outputs[False].height))
+        side_by_side.paste(outputs[False], (0, 0))
+        side_by_side.paste(outputs[True], (outputs[False].width, 0))
+        path = os.path.join(out_dir, f'decode_check_{preset}.jpg')
+        side_by_side.save(path, quality=92)
+        print(f"{preset:<14} PSNR draft vs full: {psnr:5.1f} dB  (side-by-side: {path})")
+
+
+def bench_enhance():
+    """enhance_image_professional: ImageEnhance chain vs. fused passes - time and full-size allocations"""
+    import io
+    from PIL import Image
+    from image_processor import CarImageProcessor
+
+    processor = CarImageProcessor()
+    photo = Image.open(io.BytesIO(_synthetic_photos(1, size=(2000, 1500))[0])).convert('RGB')
+
+    allocations = [0]
+    original_new, original_image_new = Image.Image._new, Image.new
+
+    def counting_new(self, im):
+        allocations[0] += 1
+        return original_new(self, im)
+
+    def counting_image_new(*args, **kwargs):
+        allocations[0] += 1
+        return original_image_new(*args, **kwargs)
+
+    for name, enhance in (('ImageEnhance chain', processor._enhance_image_reference),
+                          ('fused', processor.enhance_image_professional)):
+        allocations[0] = 0
+        Image.Image._new, Image.new = counting_new, counting_image_new
+        try:
+            enhance(photo)
+        finally:
+            Image.Image._new, Image.new = original_new, original_image_new
+        elapsed = _timeit(lambda: enhance(photo))
+        print(f"{name:<19}: {elapsed * 1e3:6.1f} ms per 3 MP photo, {allocations[0]:2d} full-size images allocated")
+
+
+def bench_compose():
+    """Background compositing on the 3.5x RGBA canvas vs. at output size: time, peak RSS, framing"""
+    import io
+    import multiprocessing
+    from PIL import Image, ImageChops
+
+    photo = _synthetic_photos(1, size=(4000, 3000))[0]
+    context = multiprocessing.get_context('spawn')
+    modes = [('full decode, 3.5x canvas', {'draft_decode': False, 'frugal_compositing': False}),
+             ('full decode, output size', {'draft_decode': False, 'frugal_compositing': True}),
+             ('draft decode, 3.5x canvas', {'draft_decode': True, 'frugal_compositing': False}),
+             ('draft decode, output size', {'draft_decode': True, 'frugal_compositing': True})]
+    outputs = []
+    for name, options in modes:
+        with context.Pool(1) as pool:
+            elapsed, peak, data = pool.apply(_pipeline_run, (photo, 'simple_white', options))
+        outputs.append(Image.open(io.BytesIO(data)).convert('L'))
+        print(f"{name:<26}: {elapsed:6.2f} s  peak +{peak:7.1f} MiB")
+
+    # Framing: bounding box of the (dark) photo on the white background
+    boxes = [ImageChops.invert(image).point(lambda v: 255 if v > 64 else 0).getbbox() for image in outputs]
+    print(f"photo bounding boxes: {boxes}")
+
+
+def bench_quality():
+    """Quality scoring of a 25-photo listing: 256 px batched proxies vs. the old full-resolution scorer"""
+    import io
+    import numpy as np
+    from PIL import Image, ImageFilter
+    from image_processor import CarImageProcessor
+
+    photos = [Image.open(io.BytesIO(data)).convert('RGB') for data in _synthetic_photos(25, size=(2000, 1500))]
+    processor = CarImageProcessor()
+
+    def full_resolution_score(image):  # the scorer this replaced: whole-image arrays + FIND_EDGES
+        pixels = np.array(image)
+        edges = np.array(image.filter(ImageFilter.FIND_EDGES))
+        return np.mean(pixels), np.std(pixels), np.mean(edges)
+
+    old = _timeit(lambda: [full_resolution_score(photo) for photo in photos], repeat=1)
+    proxy_time = _timeit(lambda: [processor.quality_proxy(photo) for photo in photos], repeat=3)
+    proxies = [processor.quality_proxy(photo) for photo in photos]
+    score_time = _timeit(lambda: processor.score_images(proxies), repeat=3)
+    timings = processor.score_images(proxies)['timings_ms']
+
+    print(f"full-resolution scorer : {old / len(photos) * 1e3:7.2f} ms/image (3 MP)")
+    print(f"256 px proxy + batch   : {(proxy_time + score_time) / len(photos) * 1e3:7.2f} ms/image "
+          f"(proxy {proxy_time / len(photos) * 1e3:.2f}, scoring {score_time / len(photos) * 1e3:.2f})")
+    print("per-metric, whole batch: " + ', '.join(f"{name} {ms:.2f} ms" for name, ms in timings.items()))
+
+
+
+def bench_dedupe():
+    """Duplicate detection: 1/8-scale dHash per upload, then lookups against a 1M-fingerprint dealer history"""
+    import io
+    import random
+    import numpy as np
+    from PIL import Image
+    from image_processor import HashIndex, fingerprint_upload
+
+    photo = _synthetic_photos(1, size=(4000, 3000))[0]
+    full_decode = _timeit(lambda: Image.open(io.BytesIO(photo)).load(), repeat=3)
+    fingerprint = _timeit(lambda: fingerprint_upload(io.BytesIO(photo)), repeat=3)
+    print(f"12 MP JPEG: full decode {full_decode * 1e3:7.2f} ms, dHash fingerprint {fingerprint * 1e3:6.2f} ms")
+
+    rng = random.Random(0)
+    codes = [rng.getrandbits(64) for _ in range(1_000_000)]
+    index = HashIndex(radius=6)
+    start = time.perf_counter()
+    for i, code in enumerate(codes):
+        index.add(code, i)
+    print(f"multi-index build: {time.perf_counter() - start:6.2f} s for {len(index):,} fingerprints")
+
+    # Half the queries are near-duplicates of indexed photos, half are new photos
+    queries = [codes[rng.randrange(len(codes))] ^ sum(1 << b for b in rng.sample(range(64), rng.randint(0, 6)))
+               for _ in range(500)] + [rng.getrandbits(64) for _ in range(500)]
+    lookup = _timeit(lambda: [index.search(q) for q in queries], repeat=3) / len(queries)
+
+    array = np.array(codes, dtype=np.uint64)
+    scan = _timeit(lambda: [np.flatnonzero(np.bitwise_count(array ^ np.uint64(q)) <= 6) for q in queries[:50]],
+                   repeat=1) / 50
+    hits = sum(1 for q in queries if index.search(q))
+    print(f"multi-index lookup: {lookup * 1e6:8.1f} us/query ({hits} of {len(queries)} matched)")
+    print(f"numpy linear scan : {scan * 1e6:8.1f} us/query")
+
+
+
+def bench_store():
+    """Re-processing a 10-photo listing: full pipeline vs. content-addressed store hits"""
+    import io
+    import tempfile
+    from PIL import Image
+    from image_processor import CarImageProcessor
+    from image_store import ImageStore
+
+    photos = _synthetic_photos(10, size=(4000, 3000), distinct=True)
+
+    with tempfile.TemporaryDirectory() as root:
+        processor = CarImageProcessor(image_store=ImageStore(root))
+        run = lambda: processor.process_images([io.BytesIO(p) for p in photos], 'gradient_blue', listing_id='L1')
+        start = time.perf_counter()
+        cold = run()
+        cold_time = time.perf_counter() - start
+        warm_time = _timeit(run, repeat=3)
+        print(f"10 x 12 MP JPEG, gradient_blue: first run {cold_time:6.2f} s, store hit {warm_time * 1e3:7.1f} ms "
+              f"(hits={run()['metadata']['store_hits']}, processed={cold.get('processed_count')})")
+        print(f"store: {processor.image_store.stats()}")
+
+
+
+def bench_output():
+    """25-photo batch: every encoding held in the result vs. streamed one at a time by the generator"""
+    import io
+    import os
+    import tracemalloc
+    from image_processor import CarImageProcessor
+
+    photos = _synthetic_photos(25, size=(2000, 1500))
+    processor = CarImageProcessor()
+
+    def held():
+        result = processor.process_images([io.BytesIO(p) for p in photos], 'gradient_blue', dedupe=False)
+        return sum(len(data) for data in result['individual_images'])
+
+    def streamed():
+        written = 0
+        with open(os.devnull, 'wb') as sink:
+            for record in processor.iter_processed_images([io.BytesIO(p) for p in photos], 'gradient_blue',
+                                                          dedupe=False):
+                if record['success']:
+                    written += sink.write(record['data'])
+        return written
+
+    for name, run in (('process_images', held), ('iter_processed_images', streamed)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        total = run()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name:22}: {elapsed:5.2f} s, {total / 1024:7.0f} KiB encoded, "
+              f"peak Python heap {peak / 1024:7.0f} KiB")
+
+
+
+def bench_formats():
+    """Bytes and encode time per output format for 1080x1080 posts, fixed quality and size-targeted"""
+    import io
+    from PIL import Image
+    from image_processor import ImageEncoder, available_formats, encode_image
+
+    posts = [Image.open(io.BytesIO(data)).convert('RGB').resize((1080, 1080))
+             for data in _synthetic_photos(5, size=(2400, 1800))]
+    legacy = _timeit(lambda: [encode_image(post, quality=88) for post in posts], repeat=3) / len(posts)
+    legacy_bytes = sum(len(encode_image(post, quality=88)) for post in posts) // len(posts)
+    print(f"{'jpeg q88 optimize':24}: {legacy_bytes / 1024:6.1f} KiB  {legacy * 1e3:7.1f} ms  (previous output)")
+
+    for fmt in available_formats():
+        encoder = ImageEncoder()
+        for post in posts:
+            encoder.encode(post, fmt)
+        fixed = encoder.stats()[fmt]
+        print(f"{fmt + ' default quality':24}: {fixed['avg_bytes'] / 1024:6.1f} KiB  {fixed['avg_encode_ms']:7.1f} ms")
+
+        encoder = ImageEncoder()
+        for post in posts:  # same preset and size: the first photo searches, the rest reuse its quality
+            encoder.encode(post, fmt, target_bytes=40 * 1024, cache_key=('gradient_blue', post.size))
+        targeted = encoder.stats()[fmt]
+        print(f"{fmt + ' <= 40 KiB':24}: {targeted['avg_bytes'] / 1024:6.1f} KiB  "
+              f"{targeted['avg_encode_ms']:7.1f} ms  ({targeted['trials']} encodes for {len(posts)} photos, "
+              f"{targeted['searches']} searches)")
+
+
+
+def bench_renditions():
+    """Every platform rendition of a 12 MP photo: one decode + pyramid vs. one full run per platform"""
+    import io
+    from image_processor import CarImageProcessor
+
+    photo = _synthetic_photos(1, size=(4000, 3000))[0]
+    processor = CarImageProcessor()
+    platforms = list(processor.RENDITIONS)
+    for preset in ('none', 'villa_green'):
+        per_platform = _timeit(lambda: [processor.render_renditions(io.BytesIO(photo), preset, 'L1', [name])
+                                        for name in platforms], repeat=2)
+        together = _timeit(lambda: processor.render_renditions(io.BytesIO(photo), preset, 'L1'), repeat=2)
+        timings = processor.render_renditions(io.BytesIO(photo), preset, 'L1')['timings_ms']
+        print(f"{preset:12} {len(platforms)} renditions: one run per platform {per_platform:5.2f} s, "
+              f"one decode + pyramid {together:5.2f} s ({per_platform / together:.1f}x)")
+        print(f"{'':12} stages: " + ', '.join(f"{stage} {ms:.0f} ms" for stage, ms in timings.items()))
+
+
+
+def bench_jobs():
+    """25-photo upload: request latency of the job endpoint vs. processing inside the request"""
+    import io
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as root:
+        os.environ['CARBOT_JOBS_DIR'] = os.path.join(root, 'jobs')
+        os.environ['CARBOT_IMAGE_STORE'] = os.path.join(root, 'store')
+        import app as app_module
+        client = app_module.app.test_client()
+        photos = _synthetic_photos(25, size=(2000, 1500), distinct=True)
+
+        inline = _timeit(lambda: app_module.CarImageProcessor().process_images(
+            [io.BytesIO(p) for p in photos], 'gradient_blue'), repeat=1)
+        start = time.perf_counter()
+        response = client.post('/api/images/jobs', content_type='multipart/form-data', data={
+            'images': [(io.BytesIO(p), f'{i}.jpg') for i, p in enumerate(photos)], 'background': 'gradient_blue'})
+        latency = time.perf_counter() - start
+        job = app_module.get_job_queue().wait(response.get_json()['job_id'], timeout=600)
+        print(f"processing inside the request: {inline * 1e3:7.0f} ms")
+        print(f"POST /api/images/jobs          : {latency * 1e3:7.0f} ms  (job {job['status']} after "
+              f"{(job['updated'] - job['created']) * 1e3:.0f} ms in the background)")
+
+
+def bench_uploads():
+    """40 MB non-image upload: multipart form parsing vs. streaming to the spool with header sniffing"""
+    import io
+    import os
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as root:
+        os.environ['CARBOT_UPLOAD_DIR'] = os.path.join(root, 'uploads')
+        os.environ['CARBOT_JOBS_DIR'] = os.path.join(root, 'jobs')
+        import app as app_module
+        client = app_module.app.test_client()
+        body = b'%PDF-1.7\n' + os.urandom(40 * 1024 * 1024)
+
+        multipart = _timeit(lambda: client.post('/api/images/jobs', content_type='multipart/form-data',
+                                                data={'images': [(io.BytesIO(body), 'brochure.jpg')]}), repeat=3)
+        streamed = _timeit(lambda: client.post('/api/uploads', data=body, content_type='image/jpeg'), repeat=3)
+        photo = _synthetic_photos(1, size=(4000, 3000), distinct=True)[0]
+        accepted = _timeit(lambda: client.post('/api/uploads', data=photo, content_type='image/jpeg'), repeat=3)
+        print(f"multipart form, rejected after parsing : {multipart * 1e3:7.1f} ms")
+        print(f"streamed to spool, rejected on header  : {streamed * 1e3:7.1f} ms")
+        print(f"streamed 12 MP photo, hashed + stored  : {accepted * 1e3:7.1f} ms  ({len(photo) // 1024} KiB)")
+        print(f"spool: {app_module.get_upload_spool().stats()}")
+
+
+def bench_responses():
+    """Repeat dashboard requests: rendered every time vs. memoised vs. 304 revalidation"""
+    import app as app_module
+
+    flask_app = app_module.app
+    description = {'description': "2018 Jeep Compass TrailHawk GCC\nDriven 103,000 km. Selling for 30,000 AED."}
+    n = 500
+
+    def post(headers=None):
+        for _ in range(n):
+            with flask_app.test_request_context('/api/process-car', method='POST', json=description, headers=headers):
+                response = flask_app.full_dispatch_request()
+        return response
+
+    app_module._response_cache = app_module.ResponseCache(max_entries=0)  # every request renders
+    rendered = _timeit(post, repeat=3)
+    app_module._response_cache = app_module.ResponseCache()
+    first = post()
+    body = len(first.get_data())
+    memoised = _timeit(post, repeat=3)
+    print(f"POST /api/process-car, rendered (post cache hit): {rendered / n * 1e6:5.0f} us/request, {body} B body")
+    print(f"POST /api/process-car, memoised response        : {memoised / n * 1e6:5.0f} us/request, {body} B body")
+
+    def get(path, headers=None):
+        for _ in range(n):
+            with flask_app.test_request_context(path, headers=headers):
+                response = flask_app.full_dispatch_request()
+        return response
+
+    etag = get('/api/image-backgrounds').headers['ETag']  # 304 is for GET/HEAD only
+    fetched = _timeit(lambda: get('/api/image-backgrounds'), repeat=3)
+    revalidated = _timeit(lambda: get('/api/image-backgrounds', {'If-None-Match': etag}), repeat=3)
+    print(f"GET /api/image-backgrounds, memoised response   : {fetched / n * 1e6:5.0f} us/request")
+    print(f"GET /api/image-backgrounds, If-None-Match -> 304: {revalidated / n * 1e6:5.0f} us/request, 0 B body")
+    print(f"responses: {app_module.get_response_cache().stats()}")
+
+
+def bench_compression():
+    """/api/process-car bytes on the wire and per-response compression time"""
+    import gzip
+    import app as app_module
+    from http_cache import brotli
+
+    client = app_module.app.test_client()
+    descriptions = [
+        "2018 Jeep Compass TrailHawk GCC\nDriven 103,000 km. Selling for 30,000 AED.",
+        "2019 Nissan X-Trail SV GCC, 60,000 km, 55,000 AED, full service history, sunroof",
+        "Toyota Land Cruiser GXR 2016 V8, 140,000 km, asking 135,000 AED, leather seats",
+    ]
+    bodies = [client.post('/api/process-car', json={'description': d}).data for d in descriptions]
+    compressor = app_module.get_response_compressor()
+    n = 200
+
+    plain = sum(len(body) for body in bodies)
+    full = sum(len(gzip.compress(body, 6)) for body in bodies)
+    spliced = sum(len(compressor.gzip(body)) for body in bodies)
+    full_time = _timeit(lambda: [gzip.compress(body, 6) for body in bodies * n], repeat=3) / (n * len(bodies))
+    spliced_time = _timeit(lambda: [compressor.gzip(body) for body in bodies * n], repeat=3) / (n * len(bodies))
+    print(f"{len(bodies)} posts, identity          : {plain:6d} B")
+    print(f"{len(bodies)} posts, gzip per response : {full:6d} B  {full_time * 1e6:5.0f} us/response")
+    print(f"{len(bodies)} posts, gzip + static     : {spliced:6d} B  {spliced_time * 1e6:5.0f} us/response")
+    if brotli is not None:
+        br = sum(len(compressor.encode(body, 'br')) for body in bodies)
+        br_time = _timeit(lambda: [compressor.encode(body, 'br') for body in bodies * n], repeat=3) / (n * len(bodies))
+        print(f"{len(bodies)} posts, brotli            : {br:6d} B  {br_time * 1e6:5.0f} us/response")
+    else:
+        print("brotli not installed - gzip only")
+
+
+def bench_scripts():
+    """/api/process-car with the static scripts inline vs. referenced by version"""
+    import app as app_module
+
+    flask_app = app_module.app
+    description = "2018 Jeep Compass TrailHawk GCC\nDriven 103,000 km. Selling for 30,000 AED."
+    n = 500
+
+    for inline in (True, False):
+        payload = {'description': description, 'inline_scripts': inline}
+        app_module._response_cache = app_module.ResponseCache(max_entries=0)  # time the render, not the memo
+
+        def post():
+            for _ in range(n):
+                with flask_app.test_request_context('/api/process-car', method='POST', json=payload):
+                    response = flask_app.full_dispatch_request()
+            return response
+
+        elapsed = _timeit(post, repeat=3)
+        body = post().get_data()
+        with flask_app.app_context():
+            result = app_module.get_post_cache().generate(app_module.get_bot(), description, inline_scripts=inline)
+            serialise = _timeit(lambda: [flask_app.json.dumps(result) for _ in range(n)], repeat=3)
+        label = 'inline scripts    ' if inline else 'scripts by version'
+        print(f"{label}: {len(body):6d} B/response, {elapsed / n * 1e6:5.0f} us/request, "
+              f"{serialise / n * 1e6:5.1f} us to serialise the post")
+    app_module._response_cache = None
+
+
+def bench_batch():
+    """1000 descriptions: one /api/process-car request each vs. one streamed /api/process-cars call"""
+    import json
+    import app as app_module
+
+    with open('test_car_bot_corpus.json', encoding='utf-8') as f:
+        corpus = [entry['description'] for entry in json.load(f)]
+    descriptions = (corpus * (1000 // len(corpus) + 1))[:1000]
+    client = app_module.app.test_client()
+    client.post('/api/process-cars', json=descriptions)  # warm the post cache for both
+
+    singles = _timeit(lambda: [client.post('/api/process-car', json={'description': d, 'inline_scripts': False})
+                               for d in descriptions], repeat=3)
+
+    def batch():
+        response = client.post('/api/process-cars', json=descriptions, buffered=False)
+        count = sum(1 for _ in response.iter_encoded())
+        response.close()
+        return count
+
+    batched = _timeit(batch, repeat=3)
+    start = time.perf_counter()
+    response = client.post('/api/process-cars', json=descriptions, buffered=False)
+    next(response.iter_encoded())
+    first = time.perf_counter() - start
+    response.close()
+    print(f"1000 x POST /api/process-car     : {singles * 1e3:7.1f} ms")
+    print(f"1 x POST /api/process-cars       : {batched * 1e3:7.1f} ms  (first NDJSON line after {first * 1e3:.1f} ms)")
+
+
+BENCHMARKS = {
+    'parse': bench_parse,
+    'stream': bench_stream,
+    'parallel': bench_parallel,
+    'gazetteer': bench_gazetteer,
+    'cache': bench_cache,
+    'backgrounds': bench_backgrounds,
+    'pipeline': bench_pipeline,
+    'decode': bench_decode,
+    'enhance': bench_enhance,
+    'compose': bench_compose,
+    'quality': bench_quality,
+    'dedupe': bench_dedupe,
+    'store': bench_store,
+    'output': bench_output,
+    'formats': bench_formats,
+    'renditions': bench_renditions,
+    'jobs': bench_jobs,
+    'uploads': bench_uploads,
+    'responses': bench_responses,
+    'compression': bench_compression,
+    'scripts': bench_scripts,
+    'batch': bench_batch,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run performance benchmarks')
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--out', help='directory for images written for visual checks (default: a temp dir)')
+    args = parser.parse_args()
+    _out_dir = args.out
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    for name in args.names or BENCHMARKS:
+        print(f"\n[{name}]")
+        BENCHMARKS[name]()
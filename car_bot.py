@@ -1,6 +1,15 @@
 import re
+import csv
+import json
+import hashlib
 from dataclasses import dataclass
-from typing import Optional, Dict, List
+from pathlib import Path
+from typing import Optional, Dict, List, Iterable, Iterator, TextIO, Tuple
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import os
+
+from gazetteer import Gazetteer, GazetteerMatch, load_gazetteer
 from enum import Enum
 from functools import lru_cache
 
@@ -33,7 +42,13 @@ class CarInfo:
     raw_input: str
 
 class CarPostingBot:
-    
+
+    # Bump whenever parsing/categorization logic changes output (invalidates cached posts)
+    PARSER_VERSION = '5'
+
+    # Result fields that are the same for every car - see get_static_scripts
+    SCRIPT_FIELDS = ('inquiry_script', 'delivery_script')
+
     # Caption Templates - CONVERSION-OPTIMIZED WITH PSYCHOLOGY & URGENCY
     # Each template includes: Emotional benefit, Scarcity/Urgency, Social proof, CTA
     TEMPLATES = {
@@ -208,10 +223,174 @@ Year: {year} | Mileage: {mileage} km | Trans: {transmission} | Price: AED {price
 ⏱️ Popular doesn't mean slow to sell!"""
     }
 
-    def __init__(self):
-        self.popular_models = ['Corolla', 'Civic', 'Accord', 'CR-V', 'Elantra', 'Sunny', 'Altima', 
-                               'Pathfinder', 'Rogue', 'Qashqai', 'X-Trail', 'Compass', 'Wrangler',
-                               '3 Series', '5 Series', 'C-Class', 'E-Class', 'A4', 'A6', 'Golf']
+    # ============================================================================
+    # EXTRACTION ENGINE - all patterns compiled once at class load
+    # ============================================================================
+    FEATURE_KEYWORDS = ['leather seats', 'cruise control', 'alloy rims', 'drl', 'fog lamps',
+                        'parking sensors', 'bluetooth', 'aux', '4x4', 'push-button start',
+                        'keyless entry', 'electronic handbrake', 'touch screen', 'sunroof',
+                        'backup camera', 'gps', 'navigation']
+
+    # Condition phrases in priority order (first one present wins)
+    CONDITION_KEYWORDS = [('good condition', 'Good Condition'),
+                          ('excellent condition', 'Excellent Condition'),
+                          ('fair condition', 'Fair Condition')]
+
+    _YEAR_RE = re.compile(r'\b(\d{4})\b')
+
+    # Brands are located by the gazetteer; these patterns match what follows a brand.
+    # Strategy 1: "YEAR Brand Model" pattern - e.g., "2018 Jeep Compass"
+    # Stop at: year patterns, GCC, with, full, American, trim levels, for, etc.
+    _YEAR_BRAND_MODEL_TAIL_RE = re.compile(
+        r'\s+([A-Za-z0-9]+(?:\s+[A-Za-z0-9]+)?)'
+        r'(?:\s+(?:GCC|with|Full|American|TrailHawk|Limited|LT|SE|Premium|Standard|for|in|—)|\d{4}|$)',
+        re.IGNORECASE)
+    # Strategy 2: "Brand Model YEAR" pattern - e.g., "Jeep Wrangler 2016"
+    _BRAND_MODEL_YEAR_TAIL_RE = re.compile(r'\s+([A-Za-z0-9]+(?:\s+[A-Za-z0-9]+)?)\s+\d{4}', re.IGNORECASE)
+    # Strategy 3: From first line - any "Brand Model" mention
+    _BRAND_MODEL_TAIL_RE = re.compile(
+        r'\s+([A-Za-z0-9]+(?:\s+[A-Za-z0-9]+)?)(?:\s+\d{4}|GCC|with|—|-|for|in|$)', re.IGNORECASE)
+
+    _MODEL_SUFFIX_RE_1 = re.compile(r'\s+(with|Full|American|GCC|Specs|Specs).*', re.IGNORECASE)
+    _MODEL_SUFFIX_RE_2 = re.compile(r'\s+(GCC|with|Full|Limited|LT|SE|Premium|Specs).*', re.IGNORECASE)
+    _MODEL_YEAR_SUFFIX_RE = re.compile(r'\s+\d{4}.*', re.IGNORECASE)
+    _FALLBACK_YEAR_RE = re.compile(r'\d{4}.*', re.IGNORECASE)
+    _CAR_NAME_SUFFIX_RE = re.compile(
+        r'\s+(GCC|with|Full|American|TrailHawk|Limited|LT|SE|Premium|Standard|Specs|Condition).*',
+        re.IGNORECASE)
+    _BASIC_NAME_RE = re.compile(r'([A-Z][a-zA-Z]+)\s+([A-Z][a-zA-Z0-9]+)')
+
+    _MILEAGE_RE = re.compile(r'(\d{2,3}),?(\d{3})\s*(?:kilometers|km)', re.IGNORECASE)
+    _V_ENGINE_RE = re.compile(r'(V[68]|v[68])\s+(\d\.?\d+L)', re.IGNORECASE)
+    _CYLINDER_ENGINE_RE = re.compile(r'(\d\.?\d+L)\s+(\d+-?cylinder)', re.IGNORECASE)
+    _PRICE_RE = re.compile(r'(\d{2,3}),?(\d{3})\s*(?:AED|aed)')
+    _FUEL_RANGE_RE = re.compile(r'(\d+)\s*kilometers?\s*per\s*(?:full\s+)?tank', re.IGNORECASE)
+
+    # Every lowercase keyword the parser looks for. They are all checked
+    # against ONE lowercased copy of the description; substring tests run in C
+    # and beat a combined lookahead regex by ~10x on typical listings.
+    _SCAN_KEYWORDS = frozenset(FEATURE_KEYWORDS) | {kw for kw, _ in CONDITION_KEYWORDS} | {
+        'automatic', 'manual', 'brand-new tires', 'serviced'}
+    _FEATURE_TITLES = [(kw, kw.title()) for kw in FEATURE_KEYWORDS]
+
+    def __init__(self, gazetteer: Optional[Gazetteer] = None):
+        # Brand / model / trim catalogue shared by parsing and categorization
+        self.gazetteer = gazetteer or load_gazetteer()
+        self._content_version = None
+        self._scripts_version = None
+
+    @property
+    def content_version(self) -> str:
+        """
+        Fingerprint of everything that shapes a generated post - parser version,
+        catalogue, caption templates and the static scripts. Cached posts are keyed on it.
+        """
+        if self._content_version is None:
+            digest = hashlib.sha256()
+            for part in (self.PARSER_VERSION, self.gazetteer.fingerprint,
+                         *(f"{category.name}:{template}" for category, template in self.TEMPLATES.items()),
+                         self.get_posting_instructions({'asking_price': None}, CarCategory.MID_RANGE),
+                         self.get_inquiry_script(), self.get_delivery_script()):
+                digest.update(part.encode('utf-8'))
+                digest.update(b'\0')
+            self._content_version = digest.hexdigest()[:16]
+        return self._content_version
+
+    @property
+    def scripts_version(self) -> str:
+        """Fingerprint of the static scripts - compact posts reference them by it"""
+        if self._scripts_version is None:
+            digest = hashlib.sha256()
+            for name, script in self.get_static_scripts().items():
+                digest.update(f"{name}\0{script}\0".encode('utf-8'))
+            self._scripts_version = digest.hexdigest()[:12]
+        return self._scripts_version
+
+    def get_static_scripts(self) -> Dict[str, str]:
+        """The scripts every post shares, by result field name"""
+        return {'inquiry_script': self.get_inquiry_script(), 'delivery_script': self.get_delivery_script()}
+
+    def _scan_keywords(self, text_lower: str) -> set:
+        """Return every scan keyword present in the lowercased text"""
+        return {kw for kw in self._SCAN_KEYWORDS if kw in text_lower}
+
+    @staticmethod
+    def _follows_year(text: str, pos: int) -> bool:
+        """True if text[:pos] ends with a 4-digit number followed by whitespace"""
+        idx = pos
+        while idx > 0 and text[idx - 1].isspace():
+            idx -= 1
+        return idx < pos and idx >= 4 and text[idx - 4:idx].isdecimal()
+
+    @staticmethod
+    def _brand_head_end(text: str, start: int, end: int) -> int:
+        """
+        End of a brand mention's first word - the model window starts there, so a
+        multi-word brand ("Range Rover Sport") reads the same as the one-word
+        brand list it replaced ("Range" + "Rover Sport")
+        """
+        return start + len(text[start:end].split()[0])
+
+    def _extract_car_name(self, description: str, first_line: str, first_line_offset: int,
+                          brands: List[GazetteerMatch]) -> Tuple[Optional[str], Optional[GazetteerMatch]]:
+        """
+        Extract "Brand Model" trying the year/brand strategies in order
+        Returns the car name and the brand mention it was built from (if any)
+        """
+        first_line_end = first_line_offset + len(first_line)
+        first_line_brands = [m for m in brands if m.end <= first_line_end]
+
+        car_name, used_brand = None, None
+        for tail_re, text, offset, candidates in (
+                (self._YEAR_BRAND_MODEL_TAIL_RE, description, 0, brands),
+                (self._BRAND_MODEL_YEAR_TAIL_RE, description, 0, brands),
+                (self._BRAND_MODEL_TAIL_RE, first_line, first_line_offset, first_line_brands)):
+            for brand_match in candidates:
+                start = brand_match.start - offset
+                end = self._brand_head_end(text, start, brand_match.end - offset)
+                if tail_re is self._YEAR_BRAND_MODEL_TAIL_RE and not self._follows_year(text, start):
+                    continue
+                match = tail_re.match(text, end)
+                if not match:
+                    continue
+                model = match.group(1).strip()
+                if tail_re is self._YEAR_BRAND_MODEL_TAIL_RE:
+                    # Clean up model (remove extra words)
+                    model = self._MODEL_SUFFIX_RE_1.sub('', model).strip()
+                elif tail_re is self._BRAND_MODEL_YEAR_TAIL_RE:
+                    model = self._MODEL_SUFFIX_RE_2.sub('', model).strip()
+                else:
+                    model = self._MODEL_YEAR_SUFFIX_RE.sub('', model).strip()
+                car_name, used_brand = f"{text[start:end]} {model}", brand_match
+                break
+            if car_name:
+                break
+
+        # Fallback: Extract just Brand + Model from first line (brands in priority order,
+        # first mention of each, skipping any with nothing after it)
+        if not car_name:
+            tried = set()
+            for brand_match in sorted(first_line_brands, key=lambda m: (m.entry.order, m.start)):
+                if brand_match.entry in tried:
+                    continue
+                tried.add(brand_match.entry)
+                after_brand = first_line[brand_match.start - first_line_offset:].split()[1:3]  # Get next 2 words
+                if after_brand:
+                    model = ' '.join(after_brand)
+                    model = self._FALLBACK_YEAR_RE.sub('', model).strip()
+                    car_name, used_brand = f"{brand_match.alias.split()[0]} {model}", brand_match
+                    break
+
+        if car_name:
+            # Clean up: remove non-essential suffixes
+            car_name = self._CAR_NAME_SUFFIX_RE.sub('', car_name).strip()
+
+        # Final fallback: if still nothing, try very basic pattern
+        if not car_name:
+            basic_match = self._BASIC_NAME_RE.search(first_line)
+            if basic_match:
+                return f"{basic_match.group(1)} {basic_match.group(2)}", None
+        return car_name, used_brand
 
     def parse_car_description(self, description: str) -> Dict:
         """Parse car description to extract key information with comprehensive matching"""
@@ -227,143 +406,80 @@ Year: {year} | Mileage: {mileage} km | Trans: {transmission} | Price: AED {price
             'condition': None,
             'features': [],
             'fuel_range': None,
-            'notes': []
+            'notes': [],
+            'brand': None,
+            'model': None,
+            'trim': None
         }
 
-        first_line = description.split('\n')[0].strip()
-        
-        # ============================================================================
-        # STEP 1: Extract YEAR (for "make" field in marketplace)
-        # ============================================================================
-        year_match = re.search(r'\b(\d{4})\b', first_line)
+        first_line_raw = description.split('\n', 1)[0]
+        first_line = first_line_raw.strip()
+        keywords = self._scan_keywords(description.lower())
+
+        # One gazetteer pass finds every brand/model/trim mention
+        mentions = self.gazetteer.scan(description)
+        brands = [m for m in mentions if m.kind == 'brand']
+
+        # Year (for "make" field in marketplace)
+        year_match = self._YEAR_RE.search(first_line)
         if year_match:
             info['year'] = int(year_match.group(1))
-        
-        # ============================================================================
-        # STEP 2: Extract CAR NAME (for "model" field - Brand + Model for SEO)
-        # ============================================================================
-        # List of car brands for better matching
-        brands = ['Jeep', 'Mercedes', 'BMW', 'Audi', 'Honda', 'Toyota', 'Nissan', 
-                  'Chevrolet', 'Hyundai', 'Kia', 'Lincoln', 'Cadillac', 'Ford', 
-                  'Range', 'Lexus', 'Porsche', 'Volvo', 'Volkswagen', 'Mazda']
-        
-        # Strategy 1: "YEAR Brand Model" pattern - e.g., "2018 Jeep Compass"
-        # Stop at: year patterns, GCC, with, full, American, trim levels, for, etc.
-        pattern1 = r'\d{4}\s+(' + '|'.join(brands) + r')\s+([A-Za-z0-9]+(?:\s+[A-Za-z0-9]+)?)(?:\s+(?:GCC|with|Full|American|TrailHawk|Limited|LT|SE|Premium|Standard|for|in|—)|\d{4}|$)'
-        match1 = re.search(pattern1, description, re.IGNORECASE)
-        
-        # Strategy 2: "Brand Model YEAR" pattern - e.g., "Jeep Wrangler 2016"
-        # Stop at: YEAR, GCC, with, etc.
-        pattern2 = r'(' + '|'.join(brands) + r')\s+([A-Za-z0-9]+(?:\s+[A-Za-z0-9]+)?)\s+\d{4}'
-        match2 = re.search(pattern2, description, re.IGNORECASE)
-        
-        # Strategy 3: From first line - any "Brand Model" mention
-        # Stop at: year, GCC, with, dash, etc.
-        pattern3 = r'(' + '|'.join(brands) + r')\s+([A-Za-z0-9]+(?:\s+[A-Za-z0-9]+)?)(?:\s+\d{4}|GCC|with|—|-|for|in|$)'
-        match3 = re.search(pattern3, first_line, re.IGNORECASE)
-        
-        # Try strategies in order
-        car_name = None
-        if match1:
-            brand = match1.group(1).strip()
-            model = match1.group(2).strip()
-            # Clean up model (remove extra words)
-            model = re.sub(r'\s+(with|Full|American|GCC|Specs|Specs).*', '', model, flags=re.IGNORECASE).strip()
-            car_name = f"{brand} {model}"
-        elif match2:
-            brand = match2.group(1).strip()
-            model = match2.group(2).strip()
-            model = re.sub(r'\s+(GCC|with|Full|Limited|LT|SE|Premium|Specs).*', '', model, flags=re.IGNORECASE).strip()
-            car_name = f"{brand} {model}"
-        elif match3:
-            brand = match3.group(1).strip()
-            model = match3.group(2).strip()
-            model = re.sub(r'\s+\d{4}.*', '', model, flags=re.IGNORECASE).strip()
-            car_name = f"{brand} {model}"
-        
-        # Fallback: Extract just Brand + Model from first line
-        if not car_name:
-            for brand in brands:
-                if brand.lower() in first_line.lower():
-                    idx = first_line.lower().find(brand.lower())
-                    after_brand = first_line[idx:].split()[1:3]  # Get next 2 words
-                    if after_brand:
-                        model = ' '.join(after_brand)
-                        model = re.sub(r'\d{4}.*', '', model, flags=re.IGNORECASE).strip()
-                        car_name = f"{brand} {model}"
-                        break
-        
-        if car_name:
-            # Clean up: remove non-essential suffixes
-            car_name = re.sub(r'\s+(GCC|with|Full|American|TrailHawk|Limited|LT|SE|Premium|Standard|Specs|Condition).*', '', 
-                             car_name, flags=re.IGNORECASE).strip()
-            info['make_model'] = car_name
-        
-        # Final fallback: if still nothing, try very basic pattern
-        if not info['make_model']:
-            basic_match = re.search(r'([A-Z][a-zA-Z]+)\s+([A-Z][a-zA-Z0-9]+)', first_line)
-            if basic_match:
-                info['make_model'] = f"{basic_match.group(1)} {basic_match.group(2)}"
 
-        # Extract Mileage
-        mileage_match = re.search(r'(\d{2,3}),?(\d{3})\s*(?:kilometers|km)', description, re.IGNORECASE)
+        # Car name (for "model" field - Brand + Model for SEO)
+        first_line_offset = len(first_line_raw) - len(first_line_raw.lstrip())
+        info['make_model'], brand_match = self._extract_car_name(description, first_line, first_line_offset, brands)
+
+        # Canonical brand/model/trim - read from the brand the name was built from,
+        # otherwise from the name itself (e.g. a bare "Corolla")
+        if brand_match:
+            info.update(self.gazetteer.identify(
+                matches=[m for m in mentions if m.start >= brand_match.start], brand=brand_match.entry.name))
+        elif info['make_model']:
+            info.update(self.gazetteer.identify(info['make_model']))
+
+        # Mileage
+        mileage_match = self._MILEAGE_RE.search(description)
         if mileage_match:
             info['mileage'] = int(mileage_match.group(1) + mileage_match.group(2))
 
-        # Extract Engine/Transmission - improved to detect V6, V8, etc.
-        # Try V6/V8 patterns first
-        v_engine_match = re.search(r'(V[68]|v[68])\s+(\d\.?\d+L)', description, re.IGNORECASE)
+        # Engine - V6/V8 patterns first, then cylinder patterns
+        v_engine_match = self._V_ENGINE_RE.search(description)
         if v_engine_match:
-            engine_type = v_engine_match.group(1).upper()
-            engine_size = v_engine_match.group(2)
-            info['engine'] = f"{engine_size} {engine_type}"
+            info['engine'] = f"{v_engine_match.group(2)} {v_engine_match.group(1).upper()}"
         else:
-            # Try cylinder patterns
-            engine_match = re.search(r'(\d\.?\d+L)\s+(\d+-?cylinder)', description, re.IGNORECASE)
+            engine_match = self._CYLINDER_ENGINE_RE.search(description)
             if engine_match:
                 info['engine'] = f"{engine_match.group(1)} {engine_match.group(2)}"
-        
-        # Detect transmission
-        if 'automatic' in description.lower() or '6-speed automatic' in description.lower():
-            info['transmission'] = 'Automatic'
-        elif 'manual' in description.lower():
+
+        # Transmission - default to automatic for modern cars
+        if 'manual' in keywords and 'automatic' not in keywords:
             info['transmission'] = 'Manual'
         else:
-            # Default to automatic for modern cars
             info['transmission'] = 'Automatic'
 
-        # Extract Price
-        price_match = re.search(r'(\d{2,3}),?(\d{3})\s*(?:AED|aed)', description)
+        # Price
+        price_match = self._PRICE_RE.search(description)
         if price_match:
             info['asking_price'] = int(price_match.group(1) + price_match.group(2))
 
-        # Extract Condition
-        if 'good condition' in description.lower():
-            info['condition'] = 'Good Condition'
-        elif 'excellent condition' in description.lower():
-            info['condition'] = 'Excellent Condition'
-        elif 'fair condition' in description.lower():
-            info['condition'] = 'Fair Condition'
-
-        # Extract Features
-        features_keywords = ['leather seats', 'cruise control', 'alloy rims', 'drl', 'fog lamps', 
-                            'parking sensors', 'bluetooth', 'aux', '4x4', 'push-button start',
-                            'keyless entry', 'electronic handbrake', 'touch screen', 'sunroof',
-                            'backup camera', 'gps', 'navigation']
-        
-        for feature in features_keywords:
-            if feature.lower() in description.lower():
-                info['features'].append(feature.title())
+        # Condition
+        for keyword, condition in self.CONDITION_KEYWORDS:
+            if keyword in keywords:
+                info['condition'] = condition
+                break
 
-        # Extract fuel range
-        fuel_match = re.search(r'(\d+)\s*kilometers?\s*per\s*(?:full\s+)?tank', description, re.IGNORECASE)
+        # Features (reported in keyword-list order)
+        info['features'] = [title for keyword, title in self._FEATURE_TITLES if keyword in keywords]
+
+        # Fuel range
+        fuel_match = self._FUEL_RANGE_RE.search(description)
         if fuel_match:
             info['fuel_range'] = fuel_match.group(1)
 
-        # Extract notes
-        if 'brand-new tires' in description.lower():
+        # Notes
+        if 'brand-new tires' in keywords:
             info['notes'].append('Brand-new tires installed')
-        if 'serviced at agency' in description.lower() or 'serviced' in description.lower():
+        if 'serviced' in keywords:
             info['notes'].append('Regular service history')
 
         return info
@@ -401,16 +517,23 @@ Year: {year} | Mileage: {mileage} km | Trans: {transmission} | Price: AED {price
         if mileage < 50000:
             return CarCategory.LOW_MILEAGE
 
+        # Catalogue tags for the canonical brand/model (identified here if the info lacks them)
+        if info.get('brand') or info.get('model'):
+            identity = info
+        else:
+            identity = self.gazetteer.identify(make_model)
+        tags = self.gazetteer.tags(identity.get('brand'), identity.get('model'))
+
         # Check if it's popular model
-        if any(model.lower() in make_model.lower() for model in self.popular_models):
+        if 'popular' in tags:
             return CarCategory.POPULAR
 
         # Check if it's luxury/premium
-        if any(brand in make_model for brand in ['BMW', 'Mercedes', 'Audi', 'Lexus', 'Range']):
+        if 'premium' in tags:
             return CarCategory.PREMIUM
 
         # Check if it's family car (spacious features)
-        if 'Pathfinder' in make_model or 'X-Trail' in make_model or 'CR-V' in make_model:
+        if 'family' in tags:
             return CarCategory.FAMILY
 
         # Check if it's fuel efficient
@@ -579,8 +702,12 @@ Year: {year} | Mileage: {mileage} km | Trans: {transmission} | Price: AED {price
         hashtag_list = sorted(list(hashtags))[:30]
         return ' '.join(hashtag_list)
 
-    def generate_full_post(self, description: str) -> Dict:
-        """Main function - generates complete posting information"""
+    def generate_full_post(self, description: str, inline_scripts: bool = True) -> Dict:
+        """
+        Main function - generates complete posting information
+        inline_scripts=False leaves out the static scripts (several KB that never
+        change per car) and returns 'scripts_version' to fetch them by instead
+        """
         
         # Parse the description
         info = self.parse_car_description(description)
@@ -607,7 +734,7 @@ Year: {year} | Mileage: {mileage} km | Trans: {transmission} | Price: AED {price
         # Posting instructions
         posting_instructions = self.get_posting_instructions(info, category)
 
-        return {
+        result = {
             'success': True,
             'car_info': info,
             'category': category.value,
@@ -616,9 +743,32 @@ Year: {year} | Mileage: {mileage} km | Trans: {transmission} | Price: AED {price
             'hashtags': hashtags,
             'posting_instructions': posting_instructions,
             'features_summary': self.format_features(info['features']),
-            'inquiry_script': self.get_inquiry_script(),
-            'delivery_script': self.get_delivery_script()
         }
+        if inline_scripts:
+            result.update(self.get_static_scripts())
+        else:
+            result['scripts_version'] = self.scripts_version
+        return result
+
+    def generate_posts_batch(self, descriptions: Iterable[str]) -> Iterator[Dict]:
+        """
+        Generate posts for many descriptions lazily - one result per description, in order
+        A description that raises is reported as a failed result instead of stopping the batch
+        """
+        for description in descriptions:
+            try:
+                yield self.generate_full_post(description)
+            except Exception as e:
+                yield {
+                    'success': False,
+                    'errors': [f'Error processing description: {str(e)}'],
+                    'message': '⚠️  PROCESSING FAILED - Description could not be parsed'
+                }
+
+    def stream_posts(self, path, fmt: Optional[str] = None, column: str = 'description',
+                     skipped: Optional[List[int]] = None) -> Iterator[Dict]:
+        """Generate posts for every description in a CSV / JSONL / text file without loading it whole"""
+        return self.generate_posts_batch(read_descriptions(path, fmt=fmt, column=column, skipped=skipped))
 
     def get_selling_angle(self, info: Dict, category: CarCategory) -> str:
         """
@@ -910,6 +1060,164 @@ WHY THIS WORKS:
 """
 
 
+# ============================================================================
+# BATCH INGESTION - dealer inventory exports (CSV / JSONL / plain text)
+# ============================================================================
+
+# Plain-text exports separate listings with a line containing only this marker
+TEXT_BLOCK_SEPARATOR = '---'
+
+
+def detect_input_format(path) -> str:
+    """Guess the inventory file format from its extension"""
+    suffix = Path(path).suffix.lower()
+    if suffix == '.csv':
+        return 'csv'
+    if suffix in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    return 'text'
+
+
+def read_descriptions(path, fmt: Optional[str] = None, column: str = 'description',
+                      skipped: Optional[List[int]] = None) -> Iterator[str]:
+    """
+    Lazily yield car descriptions from an inventory export
+    - csv:   one row per listing, text taken from `column` (ValueError if there is none)
+    - jsonl: one JSON string or object with a `column` key per line; lines that aren't
+             valid JSON are skipped and their line numbers appended to `skipped`
+    - text:  listings separated by a line containing only '---'
+    """
+    fmt = fmt or detect_input_format(path)
+
+    if fmt == 'csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            if column not in (reader.fieldnames or []):
+                raise ValueError(f"CSV has no {column!r} column (columns: {', '.join(reader.fieldnames or [])})")
+            for row in reader:
+                description = (row.get(column) or '').strip()
+                if description:
+                    yield description
+
+    elif fmt == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    if skipped is not None:
+                        skipped.append(line_number)
+                    continue
+                description = record.get(column, '') if isinstance(record, dict) else record
+                description = str(description or '').strip()
+                if description:
+                    yield description
+
+    elif fmt == 'text':
+        with open(path, encoding='utf-8') as f:
+            block = []
+            for line in f:
+                if line.strip() == TEXT_BLOCK_SEPARATOR:
+                    description = ''.join(block).strip()
+                    if description:
+                        yield description
+                    block = []
+                else:
+                    block.append(line)
+            description = ''.join(block).strip()
+            if description:
+                yield description
+
+    else:
+        raise ValueError(f"Unsupported input format: {fmt} (use csv, jsonl or text)")
+
+
+def write_posts_jsonl(results: Iterable, out: TextIO, indexed: bool = False) -> Dict:
+    """
+    Write results to `out` as JSON Lines as they arrive; returns success/failure counts
+    With indexed=True, `results` yields (index, result) pairs (e.g. unordered parallel mode)
+    """
+    counts = {'total': 0, 'success': 0, 'failed': 0}
+    pairs = results if indexed else enumerate(results)
+    for index, result in pairs:
+        out.write(json.dumps({'index': index, **result}, ensure_ascii=False))
+        out.write('\n')
+        counts['total'] += 1
+        counts['success' if result.get('success') else 'failed'] += 1
+    return counts
+
+
+# ============================================================================
+# PARALLEL BATCH MODE - shard descriptions across worker processes
+# ============================================================================
+
+# Built once per worker process by the pool initializer
+_worker_bot = None
+
+
+def _init_worker(catalogue: Optional[str] = None):
+    """Pool initializer - warm up one CarPostingBot per worker"""
+    global _worker_bot
+    _worker_bot = CarPostingBot(load_gazetteer(catalogue))
+
+
+def _process_chunk(start: int, descriptions: List[str]) -> Tuple[int, List[Dict]]:
+    """Worker task - generate posts for one chunk of descriptions"""
+    return start, list(_worker_bot.generate_posts_batch(descriptions))
+
+
+def generate_posts_parallel(descriptions: Iterable[str], workers: Optional[int] = None,
+                            chunk_size: int = 64, ordered: bool = True,
+                            catalogue: Optional[str] = None) -> Iterator[Tuple[int, Dict]]:
+    """
+    Generate posts on a process pool, yielding (index, result) pairs
+    - descriptions are submitted in chunks of `chunk_size` to amortise IPC
+    - at most 2 chunks per worker are in flight, so memory stays bounded; in ordered
+      mode that budget also covers chunks buffered behind a slow one
+    - ordered=True yields in input order, otherwise as soon as each chunk finishes
+    - catalogue: optional gazetteer file each worker loads instead of the bundled one
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 2
+    max_ahead = max_pending * chunk_size  # ordered mode: in flight + buffered, in descriptions
+    descriptions = iter(descriptions)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(catalogue,)) as pool:
+        pending = set()
+        finished = {}  # chunk start -> results, for in-order delivery
+        next_start = 0  # next index to yield in ordered mode
+        submitted = 0
+        exhausted = False
+
+        while True:
+            while not exhausted and len(pending) < max_pending and (not ordered or submitted - next_start < max_ahead):
+                chunk = list(islice(descriptions, chunk_size))
+                if not chunk:
+                    exhausted = True
+                    break
+                pending.add(pool.submit(_process_chunk, submitted, chunk))
+                submitted += len(chunk)
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, results = future.result()
+                if ordered:
+                    finished[start] = results
+                else:
+                    yield from enumerate(results, start)
+
+            while next_start in finished:
+                results = finished.pop(next_start)
+                yield from enumerate(results, next_start)
+                next_start += len(results)
+
+
 def print_result(result: Dict):
     """Pretty print the result"""
     if not result['success']:
@@ -959,8 +1267,54 @@ def print_result(result: Dict):
     print(result['delivery_script'])
 
 
-# Usage example
-if __name__ == "__main__":
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command line entry point - batch mode when an input file is given, demo otherwise"""
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Generate car posts from a dealer inventory export')
+    parser.add_argument('input', nargs='?', help='CSV, JSONL or plain-text file of car descriptions')
+    parser.add_argument('-o', '--output', help='JSONL output file (default: stdout)')
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'text'], help='input format (default: from extension)')
+    parser.add_argument('--column', default='description', help='CSV column / JSON key holding the description')
+    parser.add_argument('--catalogue', help='make/model gazetteer (JSON or CSV) instead of the bundled one')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes (0 = one per CPU)')
+    parser.add_argument('--chunk-size', type=int, default=64, help='descriptions per worker task')
+    parser.add_argument('--unordered', action='store_true', help='write results as they finish (parallel mode)')
+    args = parser.parse_args(argv)
+
+    if not args.input:
+        run_example()
+        return 0
+
+    skipped = []  # JSONL lines that aren't valid JSON
+    if args.workers == 1:
+        bot = CarPostingBot(load_gazetteer(args.catalogue))
+        results = bot.stream_posts(args.input, fmt=args.format, column=args.column, skipped=skipped)
+    else:
+        descriptions = read_descriptions(args.input, fmt=args.format, column=args.column, skipped=skipped)
+        results = generate_posts_parallel(descriptions, workers=args.workers or None,
+                                          chunk_size=args.chunk_size, ordered=not args.unordered,
+                                          catalogue=args.catalogue)
+    indexed = args.workers != 1
+    try:
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as out:
+                counts = write_posts_jsonl(results, out, indexed=indexed)
+        else:
+            counts = write_posts_jsonl(results, sys.stdout, indexed=indexed)
+    except ValueError as e:  # unreadable input, e.g. a missing CSV column
+        parser.error(str(e))
+    print(f"✅ Processed {counts['total']} listings: {counts['success']} ready, {counts['failed']} failed",
+          file=sys.stderr)
+    if skipped:
+        shown = ', '.join(map(str, skipped[:10])) + (', ...' if len(skipped) > 10 else '')
+        print(f"⚠️  Skipped {len(skipped)} malformed JSON lines (line {shown})", file=sys.stderr)
+    return 0
+
+
+def run_example():
+    """Generate and print a post for the built-in example description"""
     bot = CarPostingBot()
     
     # Example car description
@@ -976,3 +1330,8 @@ I am selling this car for just 30,000 AED."""
     
     result = bot.generate_full_post(example_description)
     print_result(result)
+
+
+# Usage example
+if __name__ == "__main__":
+    raise SystemExit(main())
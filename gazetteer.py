@@ -0,0 +1,257 @@
+"""
+Vehicle Gazetteer - brand / model / trim lookup for car descriptions
+Compiles a make/model catalogue (JSON or CSV) into a token trie so every
+brand, model and trim mention is found in ONE left-to-right pass over the
+text, whatever the catalogue size.
+"""
+
+import csv
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import accumulate
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional
+
+DEFAULT_CATALOGUE_PATH = Path(__file__).parent / 'vehicle_catalogue.json'
+
+# Catalogue entries and text are both split into runs of letters/digits
+_TOKEN_RE = re.compile(r'[^\W_]+')
+_TOKEN_SPLIT_RE = re.compile(r'([^\W_]+)')
+_ASCII_SPLIT_RE = re.compile(r'([a-z0-9]+)')  # same tokens for lowercased ASCII text, faster
+
+
+def _normalize_token(token: str) -> str:
+    """Case-fold a token so 'NİSSAN' / 'Niſsan' match 'nissan' like an IGNORECASE regex would"""
+    return token.casefold().replace('\u0307', '').replace('\u0131', 'i')
+
+
+def _tokenize(phrase: str) -> List[str]:
+    return [_normalize_token(token) for token in _TOKEN_RE.findall(phrase)]
+
+
+@dataclass(frozen=True)
+class CatalogueEntry:
+    kind: str                     # 'brand', 'model' or 'trim'
+    name: str                     # canonical name
+    brand: Optional[str] = None   # canonical brand (models & trims)
+    model: Optional[str] = None   # canonical model (trims)
+    tags: FrozenSet[str] = frozenset()
+    order: int = 0                # position in the catalogue (brand priority)
+
+
+@dataclass(frozen=True)
+class GazetteerMatch:
+    start: int                                 # span in the scanned text
+    end: int
+    entry: Optional[CatalogueEntry] = None     # brand / model mention
+    alias: Optional[str] = None                # catalogue spelling that matched
+    trims: Optional[Dict[tuple, CatalogueEntry]] = None  # trim mention: (brand, model) -> trim
+
+    @property
+    def kind(self) -> str:
+        return self.entry.kind if self.entry else 'trim'
+
+
+class _TrieNode:
+    __slots__ = ('children', 'entries', 'trims')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.entries: List[tuple] = []  # (brand/model entry, alias)
+        # Trim names repeat across many models ("SE", "Sport"), so they are keyed by
+        # (brand, model) and reported as ONE match per mention, not one per model
+        self.trims: Dict[tuple, CatalogueEntry] = {}
+
+
+class Gazetteer:
+    """Token trie over every brand, model and trim alias in a catalogue"""
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self._tags: Dict[tuple, FrozenSet[str]] = {}
+        self.brand_count = 0
+        self.entry_count = 0
+        self.fingerprint = ''  # content hash of the catalogue it was built from
+
+    # ==================== BUILDING ====================
+
+    def add(self, kind: str, name: str, aliases: Optional[List[str]] = None, brand: Optional[str] = None,
+            model: Optional[str] = None, tags=()) -> CatalogueEntry:
+        """Register an entry under its canonical name and every alias"""
+        if kind == 'brand':
+            order = self.brand_count
+            self.brand_count += 1
+        else:
+            order = self.entry_count
+        entry = CatalogueEntry(kind=kind, name=name, brand=brand, model=model,
+                               tags=frozenset(tags), order=order)
+        self._tags[(kind, brand, model, name)] = entry.tags
+        self.entry_count += 1
+
+        for alias in dict.fromkeys([name] + list(aliases or [])):
+            tokens = _tokenize(alias)
+            if not tokens:
+                continue
+            node = self._root
+            for token in tokens:
+                node = node.children.setdefault(token, _TrieNode())
+            if kind == 'trim':
+                node.trims.setdefault((brand, model), entry)
+            else:
+                node.entries.append((entry, alias))
+        return entry
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Gazetteer':
+        """
+        Build from the JSON catalogue shape:
+        {"brands": [{"name", "aliases", "tags", "models": [{"name", "aliases", "tags", "trims": [...]}]}]}
+        """
+        gazetteer = cls()
+        for brand in data.get('brands', []):
+            brand_name = brand['name']
+            gazetteer.add('brand', brand_name, brand.get('aliases'), tags=brand.get('tags', ()))
+            for model in brand.get('models', []):
+                model_name = model['name']
+                gazetteer.add('model', model_name, model.get('aliases'), brand=brand_name,
+                              tags=model.get('tags', ()))
+                for trim in model.get('trims', []):
+                    trim = {'name': trim} if isinstance(trim, str) else trim
+                    gazetteer.add('trim', trim['name'], trim.get('aliases'), brand=brand_name,
+                                  model=model_name, tags=trim.get('tags', ()))
+        gazetteer.fingerprint = hashlib.sha256(
+            json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+        return gazetteer
+
+    @classmethod
+    def from_csv(cls, path) -> 'Gazetteer':
+        """
+        Build from a CSV with columns brand, model, trim, aliases, tags
+        One row per entry - leave model/trim empty for brand rows; aliases and tags are '|'-separated
+        """
+        brands: Dict[str, Dict] = {}
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                brand_name = (row.get('brand') or '').strip()
+                model_name = (row.get('model') or '').strip()
+                trim_name = (row.get('trim') or '').strip()
+                if not brand_name:
+                    continue
+                aliases = [a.strip() for a in (row.get('aliases') or '').split('|') if a.strip()]
+                tags = [t.strip() for t in (row.get('tags') or '').split('|') if t.strip()]
+
+                brand = brands.setdefault(brand_name, {'name': brand_name, 'aliases': [], 'tags': [], 'models': {}})
+                if not model_name:
+                    brand['aliases'] += aliases
+                    brand['tags'] += tags
+                    continue
+                model = brand['models'].setdefault(model_name, {'name': model_name, 'aliases': [], 'tags': [],
+                                                                'trims': []})
+                if trim_name:
+                    model['trims'].append({'name': trim_name, 'aliases': aliases, 'tags': tags})
+                else:
+                    model['aliases'] += aliases
+                    model['tags'] += tags
+
+        for brand in brands.values():
+            brand['models'] = list(brand['models'].values())
+        return cls.from_dict({'brands': list(brands.values())})
+
+    @classmethod
+    def load(cls, path) -> 'Gazetteer':
+        """Load a catalogue file (.json or .csv)"""
+        path = Path(path)
+        if path.suffix.lower() == '.csv':
+            return cls.from_csv(path)
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+    # ==================== LOOKUP ====================
+
+    def scan(self, text: str) -> List[GazetteerMatch]:
+        """
+        Find every catalogue mention in one pass - leftmost-longest, non-overlapping
+        Cost is O(tokens in text x longest alias), independent of catalogue size
+        """
+        # split() with a capturing group alternates [sep, word, sep, word, ...]; cumulative
+        # lengths then give every word's span without a Python-level match object per token
+        if text.isascii():
+            parts = _ASCII_SPLIT_RE.split(text.lower())
+            words = parts[1::2]
+        else:
+            parts = _TOKEN_SPLIT_RE.split(text)
+            words = [_normalize_token(word) for word in parts[1::2]]
+        bounds = list(accumulate(map(len, parts)))  # word i spans bounds[2i]:bounds[2i+1]
+
+        matches = []
+        root_get = self._root.children.get
+        i, count = 0, len(words)
+        while i < count:
+            node = root_get(words[i])
+            if node is None:
+                i += 1
+                continue
+            best_end, best_node = None, None
+            j = i + 1
+            while True:
+                if node.entries or node.trims:
+                    best_end, best_node = j, node
+                if j >= count:
+                    break
+                node = node.children.get(words[j])
+                if node is None:
+                    break
+                j += 1
+            if best_node is None:
+                i += 1
+                continue
+            start, end = bounds[2 * i], bounds[2 * best_end - 1]
+            for entry, alias in best_node.entries:
+                matches.append(GazetteerMatch(start, end, entry, alias))
+            if best_node.trims:
+                matches.append(GazetteerMatch(start, end, trims=best_node.trims))
+            i = best_end
+        return matches
+
+    def identify(self, text: str = '', matches: Optional[List[GazetteerMatch]] = None,
+                 brand: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """
+        Return canonical {'brand', 'model', 'trim'} for the first consistent mentions in the text
+        Pass `brand` to pin the brand (only its models are considered)
+        """
+        if matches is None:
+            matches = self.scan(text)
+
+        model = trim = None
+        model_end = None
+        if brand is None:
+            for match in matches:
+                if match.kind == 'brand':
+                    brand = match.entry.name
+                    break
+        for match in matches:
+            if match.kind == 'model' and (brand is None or match.entry.brand == brand):
+                brand, model, model_end = match.entry.brand, match.entry.name, match.end
+                break
+        if model:
+            for match in matches:
+                if match.trims and match.start >= model_end and (brand, model) in match.trims:
+                    trim = match.trims[(brand, model)].name
+                    break
+        return {'brand': brand, 'model': model, 'trim': trim}
+
+    def tags(self, brand: Optional[str] = None, model: Optional[str] = None) -> FrozenSet[str]:
+        """Union of catalogue tags for a canonical brand and (optionally) model"""
+        tags = self._tags.get(('brand', None, None, brand), frozenset())
+        if model:
+            tags = tags | self._tags.get(('model', brand, None, model), frozenset())
+        return tags
+
+
+@lru_cache(maxsize=8)
+def load_gazetteer(path=None) -> Gazetteer:
+    """Load (and cache) a catalogue - the bundled vehicle_catalogue.json by default"""
+    return Gazetteer.load(path or DEFAULT_CATALOGUE_PATH)
@@ -0,0 +1,351 @@
+"""
+HTTP Cache - conditional responses and server-side memoisation for API routes
+The dashboard polls near-static routes (/api/image-backgrounds, /api/chat-status)
+and resubmits the same descriptions to /api/process-car. Each cached route gets:
+
+- memoisation: rendered response bodies in a bounded LRU, optionally with a TTL
+- validators:  a strong ETag (body hash, or the request hash for pure routes)
+               and Last-Modified, so clients can revalidate
+- 304:         If-None-Match / If-Modified-Since on GET/HEAD answered without a
+               body - for request-hashed routes without even rendering the response.
+               Other methods ignore the conditional headers and always get the
+               body (RFC 9110 allows 304 only for GET/HEAD)
+- Cache-Control as configured per route
+
+ResponseCompressor negotiates Content-Encoding for every response: gzip always,
+Brotli when the brotli package is installed. Blocks that appear verbatim in
+many responses (the inquiry/delivery scripts in every post) are deflated once
+and spliced into each gzip stream, and whole compressed bodies are kept per
+ETag, so repeat responses are never compressed twice. Streamed responses (the
+NDJSON batch endpoint) are gzipped chunk by chunk with a sync flush after each,
+so every line still reaches the client as soon as it is produced; Brotli is not
+used for streams.
+"""
+
+import hashlib
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import Response, make_response, request
+
+try:
+    import brotli  # optional - adds Content-Encoding: br
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'application/javascript',
+                          'text/html', 'text/plain', 'text/css', 'text/csv'}
+_GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'  # deflate, no name, no mtime, unknown OS
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    """Strong ETags differ per Content-Encoding: '<etag>-gzip', '<etag>-br'"""
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def _conditional() -> bool:
+    """Only GET/HEAD may be answered with 304 (RFC 9110 section 13.1)"""
+    return request.method in ('GET', 'HEAD')
+
+
+def _etag_matches(etag: str) -> bool:
+    """If-None-Match against any encoding of the representation"""
+    return any(request.if_none_match.contains(encoded_etag(etag, encoding))
+               for encoding in (None, 'gzip', 'br'))
+
+
+class ResponseCache:
+    """LRU of rendered JSON responses plus ETag/Last-Modified revalidation"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'hits': 0, 'misses': 0, 'not_modified': 0, 'expired': 0,
+                         'evictions': 0, 'uncacheable': 0}
+
+    @classmethod
+    def from_env(cls) -> 'ResponseCache':
+        """Configure from CARBOT_RESPONSE_CACHE_SIZE (default 256 responses)"""
+        return cls(max_entries=int(os.getenv('CARBOT_RESPONSE_CACHE_SIZE', '256')))
+
+    @staticmethod
+    def make_etag(*parts) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()[:32]
+
+    # ==================== MEMOISATION ====================
+
+    def _get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['expires'] is not None and entry['expires'] <= time.time():
+                del self._entries[key]
+                self.counters['expired'] += 1
+                entry = None
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry
+
+    def _put(self, key: str, entry: Dict):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    # ==================== RESPONSES ====================
+
+    @staticmethod
+    def _not_modified(entry: Dict) -> bool:
+        """Does the request already hold this representation?"""
+        if not _conditional():
+            return False
+        if request.if_none_match:
+            return _etag_matches(entry['etag'])  # If-None-Match wins over If-Modified-Since
+        since = request.if_modified_since
+        return since is not None and int(entry['last_modified']) <= since.timestamp()
+
+    def _respond(self, entry: Dict, cache_control: str):
+        if self._not_modified(entry):
+            with self._lock:
+                self.counters['not_modified'] += 1
+            response = Response(status=304)
+        else:
+            response = Response(entry['body'], status=200, mimetype=entry['mimetype'])
+        response.set_etag(entry['etag'])
+        response.last_modified = entry['last_modified']
+        response.headers['Cache-Control'] = cache_control
+        return response
+
+    def respond(self, key: str, render: Callable, ttl: Optional[float] = None,
+                cache_control: str = 'no-cache', request_etag: Optional[str] = None):
+        """
+        Serve a route through the cache
+        key:          memoisation key (include everything the response depends on)
+        render:       produces the response on a miss - non-200 responses pass through uncached
+        ttl:          seconds a memoised body stays fresh (None = until evicted)
+        request_etag: ETag known before rendering (the route is a pure function of the
+                      request); a matching If-None-Match on GET/HEAD is answered
+                      without rendering
+        """
+        with self._lock:
+            self.counters['requests'] += 1
+        if request_etag is not None and _conditional() and _etag_matches(request_etag):
+            with self._lock:
+                self.counters['not_modified'] += 1
+            response = Response(status=304)
+            response.set_etag(request_etag)
+            response.headers['Cache-Control'] = cache_control
+            return response
+
+        entry = self._get(key)
+        if entry is None:
+            response = make_response(render())
+            if response.status_code != 200:
+                with self._lock:
+                    self.counters['uncacheable'] += 1
+                response.headers['Cache-Control'] = 'no-store'
+                return response
+            body = response.get_data()
+            now = time.time()
+            entry = {'body': body, 'mimetype': response.mimetype,
+                     'etag': request_etag or self.make_etag(body),
+                     'last_modified': now, 'expires': None if ttl is None else now + ttl}
+            self._put(key, entry)
+        return self._respond(entry, cache_control)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            stats = dict(self.counters)
+            stats['entries'] = len(self._entries)
+            stats['max_entries'] = self.max_entries
+            stats['hit_rate'] = round(self.counters['hits'] / lookups, 4) if lookups else 0.0
+            requests = self.counters['requests']
+            stats['not_modified_rate'] = round(self.counters['not_modified'] / requests, 4) if requests else 0.0
+            return stats
+
+
+class ResponseCompressor:
+    """Content-Encoding negotiation with precompressed static blocks and per-ETag variants"""
+
+    def __init__(self, min_bytes: int = 1024, level: int = 6, brotli_quality: int = 5, max_entries: int = 256):
+        self.min_bytes = min_bytes
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.max_entries = max_entries
+        self._static: Dict[bytes, bytes] = {}    # block -> raw deflate, ended by a full flush
+        self._variants: 'OrderedDict[Tuple[str, str], bytes]' = OrderedDict()  # (etag, encoding) -> body
+        self._lock = threading.Lock()
+        self.counters = {'responses': 0, 'compressed': 0, 'streamed': 0, 'variant_hits': 0, 'static_blocks': 0,
+                         'bytes_in': 0, 'bytes_out': 0}
+
+    @classmethod
+    def from_env(cls) -> 'ResponseCompressor':
+        """Configure from CARBOT_COMPRESS_MIN_BYTES (default 1024) / CARBOT_COMPRESS_LEVEL (gzip, default 6)"""
+        return cls(min_bytes=int(os.getenv('CARBOT_COMPRESS_MIN_BYTES', '1024')),
+                   level=int(os.getenv('CARBOT_COMPRESS_LEVEL', '6')))
+
+    @staticmethod
+    def encodings() -> List[str]:
+        return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    def add_static(self, block: bytes):
+        """Precompress a byte block that recurs verbatim in response bodies (min. 256 bytes)"""
+        if len(block) < 256 or block in self._static:
+            return
+        deflater = zlib.compressobj(9, zlib.DEFLATED, -15)
+        with self._lock:
+            self._static[block] = deflater.compress(block) + deflater.flush(zlib.Z_FULL_FLUSH)
+
+    # ==================== ENCODERS ====================
+
+    def gzip(self, body: bytes) -> bytes:
+        """
+        Gzip with static blocks spliced in precompressed
+        A full flush byte-aligns the stream and drops back-references, so
+        independently deflated pieces concatenate into one valid deflate stream.
+        """
+        spans = []
+        for block in self._static:
+            start = body.find(block)
+            while start >= 0:
+                spans.append((start, block))
+                start = body.find(block, start + len(block))
+        spans.sort(key=lambda span: span[0])
+
+        deflater = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        pieces = [_GZIP_HEADER]
+        position = spliced = 0
+        for start, block in spans:
+            if start < position:
+                continue  # overlaps a block already spliced
+            pieces.append(deflater.compress(body[position:start]) + deflater.flush(zlib.Z_FULL_FLUSH))
+            pieces.append(self._static[block])
+            position = start + len(block)
+            spliced += 1
+        pieces.append(deflater.compress(body[position:]) + deflater.flush())
+        pieces.append(struct.pack('<II', zlib.crc32(body), len(body) & 0xffffffff))
+        if spliced:
+            with self._lock:
+                self.counters['static_blocks'] += spliced
+        return b''.join(pieces)
+
+    def gzip_stream(self, chunks):
+        """Gzip an iterable of byte chunks, flushing after each so none is held back"""
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+        size_in = size_out = 0
+        for chunk in chunks:
+            encoded = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            size_in += len(chunk)
+            size_out += len(encoded)
+            yield encoded
+        encoded = compressor.flush()
+        size_out += len(encoded)
+        yield encoded
+        with self._lock:
+            self.counters['bytes_in'] += size_in
+            self.counters['bytes_out'] += size_out
+
+    def encode(self, body: bytes, encoding: str) -> bytes:
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return self.gzip(body)
+
+    # ==================== RESPONSES ====================
+
+    def negotiate(self) -> Optional[str]:
+        """Best encoding the request accepts (Brotli first), or None for identity"""
+        for encoding in self.encodings():
+            if request.accept_encodings[encoding] > 0:
+                return encoding
+        return None
+
+    def compress(self, response):
+        """
+        after_request hook: compress eligible responses in place
+        Vary: Accept-Encoding goes on every response of a negotiable type, whatever its
+        status, and on 304s, so caches never hand a stored encoding to the wrong client
+        """
+        if response.direct_passthrough or 'Content-Encoding' in response.headers:
+            return response
+        negotiable = response.mimetype in COMPRESSIBLE_MIMETYPES
+        if negotiable or response.status_code == 304:
+            response.vary.add('Accept-Encoding')
+        if not negotiable or response.status_code != 200:
+            return response
+        if response.is_streamed:
+            return self._compress_stream(response)
+        body = response.get_data()
+        encoding = self.negotiate()
+        with self._lock:
+            self.counters['responses'] += 1
+        if encoding is None or len(body) < self.min_bytes:
+            return response
+
+        etag = response.get_etag()[0]
+        key = (etag, encoding)
+        with self._lock:
+            encoded = self._variants.get(key) if etag else None
+            if encoded is not None:
+                self._variants.move_to_end(key)
+                self.counters['variant_hits'] += 1
+        if encoded is None:
+            encoded = self.encode(body, encoding)
+            if etag:
+                with self._lock:
+                    self._variants[key] = encoded
+                    while len(self._variants) > self.max_entries:
+                        self._variants.popitem(last=False)
+        if len(encoded) >= len(body):
+            return response
+
+        response.set_data(encoded)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(encoded_etag(etag, encoding))
+        with self._lock:
+            self.counters['compressed'] += 1
+            self.counters['bytes_in'] += len(body)
+            self.counters['bytes_out'] += len(encoded)
+        return response
+
+    def _compress_stream(self, response):
+        """Gzip a streamed response on the fly (no ETag variants - the body isn't known yet)"""
+        with self._lock:
+            self.counters['responses'] += 1
+        if request.accept_encodings['gzip'] <= 0:
+            return response
+        response.response = self.gzip_stream(response.iter_encoded())
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers.pop('Content-Length', None)
+        with self._lock:
+            self.counters['streamed'] += 1
+        return response
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats['encodings'] = self.encodings()
+            stats['static_entries'] = len(self._static)
+            stats['variant_entries'] = len(self._variants)
+            stats['ratio'] = round(self.counters['bytes_out'] / self.counters['bytes_in'], 4) \
+                if self.counters['bytes_in'] else 0.0
+            return stats
@@ -0,0 +1,205 @@
+"""
+Image Jobs - background processing queue for photo batches
+A 25-photo batch takes tens of seconds, far too long to hold an HTTP request
+open. Uploads are written to a job directory, a job row goes into SQLite and a
+small worker pool runs CarImageProcessor.iter_processed_images on it, saving
+each photo as soon as it is encoded so progress can be polled.
+
+Layout:  <root>/jobs.db                  job rows (status, progress, result JSON)
+         <root>/<job_id>/uploads/...     the photos as uploaded
+         <root>/<job_id>/out/<n>.<ext>   processed photos
+Finished jobs are deleted once they are older than the TTL. The root defaults to
+the per-user cache directory (see image_store.cache_dir), never the checkout.
+"""
+
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from image_store import cache_dir
+
+_EXTENSIONS = {'image/jpeg': 'jpg', 'image/webp': 'webp', 'image/avif': 'avif'}
+_JOB_ID_RE = re.compile(r'[0-9a-f]{32}')
+
+
+class JobQueue:
+    """SQLite-backed queue of image batches processed by a local worker pool"""
+
+    def __init__(self, processor_factory: Callable, root: Optional[str] = None, workers: int = 1,
+                 ttl_seconds: float = 24 * 3600):
+        self.processor_factory = processor_factory
+        self.root = Path(root or cache_dir('jobs'))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-job')
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self.counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'expired': 0}
+
+        self._db = sqlite3.connect(str(self.root / 'jobs.db'), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL, updated REAL NOT NULL, '
+            'total INTEGER NOT NULL, done INTEGER NOT NULL DEFAULT 0, options TEXT NOT NULL, '
+            'result TEXT, error TEXT)')
+        self._db.commit()
+
+        # Jobs a previous process accepted but never finished still have their uploads - run them
+        for (job_id,) in self._db.execute("SELECT id FROM jobs WHERE status IN ('queued', 'running')").fetchall():
+            self._executor.submit(self._run, job_id)
+
+    @classmethod
+    def from_env(cls, processor_factory: Callable) -> 'JobQueue':
+        """Configure from CARBOT_JOBS_DIR / CARBOT_JOB_WORKERS (default 1) / CARBOT_JOB_TTL_HOURS (default 24)"""
+        return cls(processor_factory, root=os.getenv('CARBOT_JOBS_DIR') or None,
+                   workers=int(os.getenv('CARBOT_JOB_WORKERS', '1')),
+                   ttl_seconds=float(os.getenv('CARBOT_JOB_TTL_HOURS', '24')) * 3600)
+
+    def _update(self, job_id: str, **fields):
+        fields['updated'] = time.time()
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f'UPDATE jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+            self._db.commit()
+
+    # ==================== SUBMISSION ====================
+
+    def submit(self, uploads: List[Tuple[str, object]], background_preset: str = 'none',
+               listing_id: Optional[str] = None, dealer_id: Optional[str] = None) -> str:
+        """
+        Persist (filename, stream) uploads and queue them - returns the job id at once
+        Filenames must already be safe (werkzeug.utils.secure_filename)
+        """
+        self.cleanup()
+        job_id = uuid.uuid4().hex
+        upload_dir = self.root / job_id / 'uploads'
+        upload_dir.mkdir(parents=True)
+        for number, (filename, stream) in enumerate(uploads, 1):
+            with open(upload_dir / f"{number:02d}_{filename or 'upload'}", 'wb') as f:
+                shutil.copyfileobj(stream, f, 1024 * 1024)
+
+        now = time.time()
+        options = {'background_preset': background_preset, 'listing_id': listing_id, 'dealer_id': dealer_id}
+        with self._lock:
+            self._db.execute('INSERT INTO jobs (id, status, created, updated, total, options) VALUES (?, ?, ?, ?, ?, ?)',
+                             (job_id, 'queued', now, now, len(uploads), json.dumps(options)))
+            self._db.commit()
+            self.counters['submitted'] += 1
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def _run(self, job_id: str):
+        """Worker: process one job, saving every photo and its progress as it completes"""
+        try:
+            with self._lock:
+                row = self._db.execute('SELECT options FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return
+            options = json.loads(row[0])
+            self._update(job_id, status='running', done=0)
+            job_dir = self.root / job_id
+            out_dir = job_dir / 'out'
+            out_dir.mkdir(exist_ok=True)
+            uploads = sorted(str(path) for path in (job_dir / 'uploads').iterdir())
+
+            processor = self.processor_factory()
+            images, warnings = [], []
+            for handled, record in enumerate(processor.iter_processed_images(uploads, **options), 1):
+                if not record['success']:
+                    warnings.append(record['error'])
+                    self._update(job_id, done=min(handled, len(uploads)))
+                    continue
+                filename = f"{record['image']:02d}.{_EXTENSIONS.get(record['mime'], 'img')}"
+                with open(out_dir / filename, 'wb') as f:
+                    f.write(record['data'])
+                images.append({'image': record['image'], 'position': record['position'], 'file': filename,
+                               'mime': record['mime'], 'bytes': len(record['data']), 'metrics': record['metrics']})
+                self._update(job_id, done=min(handled, len(uploads)))
+
+            if not images:
+                raise ValueError(" | ".join(warnings) or 'No images could be processed')
+            scores = [image['metrics']['score'] for image in images]
+            best = processor.select_best_images(scores, processor.BEST_PHOTO_COUNT)
+            result = {'images': images, 'best_indices': best, 'warnings': warnings}
+            self._update(job_id, status='done', result=json.dumps(result))
+            with self._lock:
+                self.counters['completed'] += 1
+        except Exception as e:
+            self._update(job_id, status='failed', error=str(e))
+            with self._lock:
+                self.counters['failed'] += 1
+        finally:
+            shutil.rmtree(self.root / job_id / 'uploads', ignore_errors=True)
+
+    # ==================== STATUS ====================
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """{'id', 'status', 'total', 'done', 'progress', 'created', 'updated', 'result', 'error'} or None"""
+        if not _JOB_ID_RE.fullmatch(job_id):
+            return None
+        self.cleanup()
+        with self._lock:
+            row = self._db.execute('SELECT id, status, total, done, created, updated, result, error '
+                                   'FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(('id', 'status', 'total', 'done', 'created', 'updated', 'result', 'error'), row))
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['progress'] = round(job['done'] / job['total'], 3) if job['total'] else 0.0
+        return job
+
+    def output_path(self, job_id: str, filename: str) -> Optional[Path]:
+        """Path of a processed photo, or None (never escapes the job directory)"""
+        if not _JOB_ID_RE.fullmatch(job_id):
+            return None
+        path = self.root / job_id / 'out' / filename
+        if path.name != filename or filename.startswith('.') or not path.is_file():
+            return None
+        return path
+
+    def wait(self, job_id: str, timeout: float = 60.0, interval: float = 0.05) -> Optional[Dict]:
+        """Poll until the job is done or failed (or the timeout passes)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] in ('done', 'failed') or time.monotonic() >= deadline:
+                return job
+            time.sleep(interval)
+
+    def cleanup(self, force: bool = False) -> int:
+        """
+        Delete finished jobs older than the TTL (at most once a minute unless forced)
+        Runs from submit(), get() and stats(), so a queue that is only polled still expires jobs
+        """
+        now = time.time()
+        if not force and now - self._last_cleanup < 60:
+            return 0
+        self._last_cleanup = now
+        with self._lock:
+            expired = [job_id for (job_id,) in self._db.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND updated < ?",
+                (now - self.ttl_seconds,)).fetchall()]
+            self._db.executemany('DELETE FROM jobs WHERE id = ?', [(job_id,) for job_id in expired])
+            self._db.commit()
+            self.counters['expired'] += len(expired)
+        for job_id in expired:
+            shutil.rmtree(self.root / job_id, ignore_errors=True)
+        return len(expired)
+
+    def stats(self) -> Dict:
+        self.cleanup()
+        with self._lock:
+            by_status = dict(self._db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+            stats = dict(self.counters)
+        stats['jobs'] = by_status
+        stats['ttl_seconds'] = self.ttl_seconds
+        return stats
@@ -3,11 +3,22 @@
 # Creates eye-catching collages optimized for Facebook & maximum lead generation
 # ============================================================================
 
-from PIL import Image, ImageDraw, ImageFilter, ImageEnhance, ImageOps
+from PIL import Image, ImageDraw, ImageFilter, ImageEnhance, ImageOps, ImageStat
 from pathlib import Path
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import io
-from typing import List, Tuple, Dict, Optional
+import math
+import os
+import random
+import threading
+import time
+from typing import Iterator, List, Tuple, Dict, Optional
 from functools import lru_cache
+from itertools import combinations
+from image_store import ImageStore, hash_source
 
 # Lazy import numpy only when needed
 _numpy_available = False
@@ -19,7 +30,7 @@ except ImportError:
 
 
 def image_to_bytes(image: Image.Image, format='JPEG', quality=88) -> bytes:
-    """Convert PIL Image to bytes for web display"""
+    """Convert PIL Image to bytes for web display (a copy - see encode_image for zero-copy output)"""
     try:
         if image is None:
             return None
@@ -35,6 +46,719 @@ def image_to_bytes(image: Image.Image, format='JPEG', quality=88) -> bytes:
         return None
 
 
+class _CountingWriter:
+    """Forwards writes to a caller's stream and counts the bytes"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.written = 0
+
+    def write(self, data) -> int:
+        self.stream.write(data)
+        self.written += len(data)
+        return len(data)
+
+    def flush(self):
+        if hasattr(self.stream, 'flush'):
+            self.stream.flush()
+
+
+class _MemoryWriter:
+    """File-like view over a caller-provided writable buffer (bytearray, mmap, memoryview)"""
+
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast('B')
+        self.written = 0
+
+    def write(self, data) -> int:
+        end = self.written + len(data)
+        if end > len(self.view):
+            raise ValueError(f"Output buffer too small ({len(self.view)} bytes)")
+        self.view[self.written:end] = data
+        self.written = end
+        return len(data)
+
+
+def encode_image(image: Image.Image, out=None, format='JPEG', quality=88, **params):
+    """
+    Encode an image without intermediate copies
+    - out=None: returns a memoryview over the encoder's own buffer
+    - out=a writable stream (HTTP response, open file): encodes straight into it, returns bytes written
+    - out=a writable buffer (bytearray, mmap, memoryview): fills it from the start and returns a
+      memoryview of the encoded part (ValueError if it does not fit)
+    """
+    params = dict(params, quality=quality)
+    if format.upper() == 'JPEG':
+        params.setdefault('optimize', True)
+    if out is None:
+        buffer = io.BytesIO()
+        image.save(buffer, format=format, **params)
+        return buffer.getbuffer()
+    if hasattr(out, 'write'):
+        writer = _CountingWriter(out)
+        image.save(writer, format=format, **params)
+        writer.flush()
+        return writer.written
+    writer = _MemoryWriter(out)
+    image.save(writer, format=format, **params)
+    return writer.view[:writer.written]
+
+
+def thumbnail_size(size: Tuple[int, int], box: Tuple[int, int]) -> Tuple[int, int]:
+    """The size Image.thumbnail(box) would produce for an image of `size`, without the image"""
+    width, height = size
+    box_width, box_height = box
+    if box_width >= width and box_height >= height:
+        return size
+
+    def round_aspect(number: float, key) -> int:
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / height
+    if box_width / box_height >= aspect:
+        return round_aspect(box_height * aspect, key=lambda n: abs(aspect - n / box_height)), box_height
+    return box_width, round_aspect(box_width / aspect,
+                                   key=lambda n: 0 if n == 0 else abs(aspect - box_width / n))
+
+
+# ==================== VECTORIZED RENDERING ====================
+# Background canvases are 3.5x the photo (~147 MP for a 12 MP upload), so nothing
+# here may touch pixels from Python. Gradients are built as one column and widened
+# by Pillow; radial masks are computed with NumPy in row bands to bound memory.
+# Without NumPy, Pillow's built-in linear/radial gradients are stretched instead.
+
+_MASK_BAND_ROWS = 256
+
+
+def render_vertical_gradient(width: int, height: int, color1: Tuple, color2: Tuple) -> Image.Image:
+    """Top-to-bottom gradient from color1 to color2"""
+    if _numpy_available:
+        ratio = np.arange(height, dtype=np.float64)[:, None] / height
+        column = np.asarray(color1, dtype=np.float64) * (1 - ratio) + np.asarray(color2, dtype=np.float64) * ratio
+        strip = Image.fromarray(column.astype(np.uint8).reshape(height, 1, 3), 'RGB')
+    else:
+        mask = Image.linear_gradient('L').resize((1, height), Image.Resampling.BILINEAR)
+        strip = Image.composite(Image.new('RGB', (1, height), tuple(color2)),
+                                Image.new('RGB', (1, height), tuple(color1)), mask)
+    # Every row is a single colour, so widening the 1px strip is an exact copy
+    return strip.resize((width, height), Image.Resampling.NEAREST)
+
+
+def render_radial_mask(width: int, height: int, radius_x: float, radius_y: float, strength: int) -> Image.Image:
+    """
+    'L' mask of min(strength * d, strength), where d is the distance from the canvas
+    centre normalised by radius_x / radius_y (1.0 on that ellipse)
+    """
+    if not _numpy_available:
+        return _render_radial_mask_pillow(width, height, radius_x, radius_y, strength)
+
+    mask = np.empty((height, width), dtype=np.uint8)
+    dx2 = ((np.arange(width, dtype=np.float64) - width // 2) / radius_x) ** 2
+    dy = (np.arange(height, dtype=np.float64) - height // 2) / radius_y
+    for top in range(0, height, _MASK_BAND_ROWS):
+        band = np.sqrt(dy[top:top + _MASK_BAND_ROWS, None] ** 2 + dx2)
+        band *= strength
+        np.minimum(band, strength, out=band)
+        mask[top:top + _MASK_BAND_ROWS] = band  # float -> uint8 truncates like int()
+    return Image.fromarray(mask, 'L')
+
+
+def _render_radial_mask_pillow(width: int, height: int, radius_x: float, radius_y: float,
+                               strength: int) -> Image.Image:
+    """NumPy-free approximation: stretch Image.radial_gradient over the canvas and remap its levels"""
+    # radial_gradient is 255 * r / (128 * sqrt(2)) - stretch it just enough to cover the canvas
+    scale = max(width / (2 * radius_x), height / (2 * radius_y))
+    full_w, full_h = max(round(2 * radius_x * scale), width), max(round(2 * radius_y * scale), height)
+    gradient = Image.radial_gradient('L').resize((full_w, full_h), Image.Resampling.BILINEAR)
+    left, top = (full_w - width) // 2, (full_h - height) // 2
+    gradient = gradient.crop((left, top, left + width, top + height))
+    level = strength * scale * 2 ** 0.5 / 255
+    return gradient.point([min(int(v * level), strength) for v in range(256)])
+
+# ==================== SEEDED TEXTURES ====================
+# Random textures never touch the global `random` module: each layer draws from a
+# private RNG seeded by (preset, listing id, layer[, canvas size]), so identical
+# requests render identical pixels and encode to byte-identical JPEGs.
+# Scattered layers (leaves, sand, lights, ripples) are drawn once into a
+# wrap-around RGBA tile and repeated, so their cost does not grow with the canvas.
+
+TEXTURE_TILE_SIZE = 1024
+_REFERENCE_CANVAS = (4200, 3150)  # 1200px photo x 3.5 - tile densities match the old look here
+
+
+def texture_seed(preset: str, listing_id: Optional[str] = None) -> str:
+    """Seed string for a preset, optionally varied per listing"""
+    return f"{preset}|{listing_id or ''}"
+
+
+def texture_rng(seed: str, layer: str, size: Optional[Tuple[int, int]] = None) -> random.Random:
+    """Private RNG for one texture layer (str seeds are hashed with SHA-512, stable across runs)"""
+    return random.Random(f"{seed}|{layer}|{size or ''}")
+
+
+def _leaf(rng):
+    size = rng.randint(15, 50)
+    alpha = rng.randint(80, 150)
+    return size, {'fill': (rng.randint(0, 80), rng.randint(80, 160), rng.randint(0, 80), alpha)}
+
+
+def _ripple(rng):
+    return rng.randint(20, 80), {'outline': (255, 255, 255, 80), 'width': 3}
+
+
+def _sand_grain(rng):
+    size = rng.randint(2, 8)
+    return size, {'fill': (220, 200, 120, rng.randint(60, 150))}
+
+
+def _city_light(rng):
+    brightness = rng.randint(180, 255)
+    size = rng.randint(3, 8)
+    return size, {'fill': (brightness, brightness - 30, brightness - 80, 180)}
+
+
+# layer: (shapes on the reference canvas, fraction of its height covered, shape(rng) -> (radius, style))
+_SCATTER_LAYERS = {
+    'garden': (400, 0.7, _leaf),
+    'water': (200, 0.8, _ripple),
+    'sand': (800, 1.0, _sand_grain),
+    'night_lights': (300, 1.0, _city_light),
+}
+
+
+@lru_cache(maxsize=32)
+def scatter_tile(layer: str, seed: str) -> Image.Image:
+    """Seamless RGBA tile for a scatter layer - shared, treat as read-only"""
+    shapes, coverage, shape = _SCATTER_LAYERS[layer]
+    size = TEXTURE_TILE_SIZE
+    count = round(shapes * size * size / (_REFERENCE_CANVAS[0] * _REFERENCE_CANVAS[1] * coverage))
+    rng = texture_rng(seed, layer)
+    tile = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+
+    for _ in range(count):
+        x, y = rng.randrange(size), rng.randrange(size)
+        radius, style = shape(rng)
+        patch = Image.new('RGBA', (2 * radius + 1, 2 * radius + 1), (0, 0, 0, 0))
+        ImageDraw.Draw(patch).ellipse([0, 0, 2 * radius, 2 * radius], **style)
+        # Composite (not overwrite) so overlapping shapes blend; wrap shapes crossing an edge
+        for offset_y in (-size, 0, size):
+            for offset_x in (-size, 0, size):
+                left, top = x - radius + offset_x, y - radius + offset_y
+                if left >= size or top >= size or left + patch.width <= 0 or top + patch.height <= 0:
+                    continue
+                tile.alpha_composite(patch, dest=(max(left, 0), max(top, 0)),
+                                     source=(max(-left, 0), max(-top, 0)))
+    return tile
+
+
+def paste_tiled(image: Image.Image, tile: Image.Image, top: int = 0) -> Image.Image:
+    """Blend an RGBA tile repeatedly over image from row `top` down (in place)"""
+    for y in range(top, image.height, tile.height):
+        for x in range(0, image.width, tile.width):
+            image.paste(tile, (x, y), tile)
+    return image
+
+
+# ==================== FUSED ENHANCEMENT ====================
+# The ImageEnhance chain (contrast, brightness, colour, sharpness, DETAIL) builds a
+# degenerate image and a blend per step - 14 full-size allocations per photo. The
+# same maths in three passes:
+#   1. contrast + brightness -> one 256-entry LUT (same per-step clipping)
+#   2. saturation            -> one RGB->RGB colour matrix (Pillow's L weights)
+#   3. sharpness + DETAIL    -> one 3x3 convolution
+# Output stays within 5 levels (mean < 0.1) of the chain; see test_image_processor.
+
+_LUMA_WEIGHTS = (0.299, 0.587, 0.114)  # what convert('L') uses
+
+
+def _clip_truncate(value: float) -> int:
+    """Image.blend's float path: clip to 0..255, then truncate"""
+    return 0 if value <= 0 else 255 if value >= 255 else int(value)
+
+
+def contrast_brightness_lut(mean: int, contrast: float, brightness: float) -> List[int]:
+    """ImageEnhance.Contrast(mean) followed by ImageEnhance.Brightness, as one table"""
+    return [_clip_truncate(brightness * _clip_truncate(mean + contrast * (v - mean))) for v in range(256)]
+
+
+def saturation_matrix(saturation: float) -> Tuple[float, ...]:
+    """ImageEnhance.Color as a convert('RGB', matrix): grey + s * (pixel - grey)"""
+    matrix = []
+    for row in range(3):
+        matrix += [(1 - saturation) * weight + (saturation if row == col else 0)
+                   for col, weight in enumerate(_LUMA_WEIGHTS)]
+        matrix.append(-0.5)  # convert() rounds, Image.blend truncates
+    return tuple(matrix)
+
+
+@lru_cache(maxsize=8)
+def sharpen_detail_kernel(sharpness: float) -> ImageFilter.Kernel:
+    """
+    ImageEnhance.Sharpness (f*x - (f-1)*SMOOTH) plus DETAIL, merged into one 3x3 kernel
+    Exact composition is 5x5; dropping the product of the two small high-pass terms
+    keeps it 3x3 (half the taps) and is closer to the chain, which clips in between.
+    """
+    smooth = (1, 1, 1, 1, 5, 1, 1, 1, 1)
+    detail = (0, -1, 0, -1, 10, -1, 0, -1, 0)
+    weights = [-(sharpness - 1) * w / 13 + d / 6 for w, d in zip(smooth, detail)]
+    weights[4] += sharpness - 1  # identity from both filters, counted once
+    return ImageFilter.Kernel((3, 3), weights, scale=1)
+
+
+# ==================== ENCODERS ====================
+
+try:
+    import pillow_avif  # noqa: F401 - registers AVIF on Pillow builds without it
+except ImportError:
+    pass
+
+# Output formats - quality is the fixed default, quality_range bounds the target search
+OUTPUT_FORMATS = {
+    'jpeg': {'format': 'JPEG', 'ext': 'jpg', 'mime': 'image/jpeg', 'quality': 88, 'quality_range': (40, 95),
+             'params': {'progressive': True}},  # progressive also optimises Huffman tables
+    'webp': {'format': 'WEBP', 'ext': 'webp', 'mime': 'image/webp', 'quality': 80, 'quality_range': (30, 95),
+             'params': {'method': 4}},
+    'avif': {'format': 'AVIF', 'ext': 'avif', 'mime': 'image/avif', 'quality': 60, 'quality_range': (20, 90),
+             'params': {'speed': 8}},
+}
+_SSIM_BLOCK = 8
+
+
+def available_formats() -> List[str]:
+    """Output formats this Pillow build can write"""
+    Image.init()
+    return [name for name, spec in OUTPUT_FORMATS.items() if spec['format'] in Image.SAVE]
+
+
+def ssim(reference: Image.Image, candidate: Image.Image) -> float:
+    """Mean SSIM of the luma channels over 8x8 blocks (1.0 = identical)"""
+    a = np.asarray(reference.convert('L'), dtype=np.float32)
+    b = np.asarray(candidate.convert('L'), dtype=np.float32)
+    height, width = (a.shape[0] // _SSIM_BLOCK) * _SSIM_BLOCK, (a.shape[1] // _SSIM_BLOCK) * _SSIM_BLOCK
+    shape = (height // _SSIM_BLOCK, _SSIM_BLOCK, width // _SSIM_BLOCK, _SSIM_BLOCK)
+    a = a[:height, :width].reshape(shape)
+    b = b[:height, :width].reshape(shape)
+    mean_a, mean_b = a.mean(axis=(1, 3)), b.mean(axis=(1, 3))
+    var_a, var_b = a.var(axis=(1, 3)), b.var(axis=(1, 3))
+    covariance = (a * b).mean(axis=(1, 3)) - mean_a * mean_b
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    scores = (((2 * mean_a * mean_b + c1) * (2 * covariance + c2))
+              / ((mean_a ** 2 + mean_b ** 2 + c1) * (var_a + var_b + c2)))
+    return float(scores.mean())
+
+
+class ImageEncoder:
+    """
+    Encodes to any OUTPUT_FORMATS entry, optionally searching quality for a target
+    With target_bytes the highest quality that fits is chosen; with target_ssim the lowest
+    quality that still reaches it. Both are binary searches over the format's quality_range,
+    and the result is cached per (format, target, cache_key) - callers pass (preset, size) -
+    so photos of the same kind usually cost one encode instead of a search.
+    """
+
+    def __init__(self, max_cached_qualities: int = 256):
+        self.max_cached_qualities = max_cached_qualities
+        self._qualities: 'OrderedDict[tuple, int]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict] = {}
+
+    def _trial(self, image: Image.Image, fmt: str, quality: int) -> Tuple[memoryview, float]:
+        spec = OUTPUT_FORMATS[fmt]
+        start = time.perf_counter()
+        data = encode_image(image, format=spec['format'], quality=quality, **spec['params'])
+        return data, (time.perf_counter() - start) * 1000
+
+    def encode(self, image: Image.Image, fmt: str = 'jpeg', quality: Optional[int] = None,
+               target_bytes: Optional[int] = None, target_ssim: Optional[float] = None,
+               cache_key=None) -> Dict:
+        """
+        {'data' (memoryview), 'format', 'ext', 'mime', 'quality', 'bytes', 'encode_ms', 'trials',
+         'target_met'} - plus 'ssim' when searching for an SSIM target
+        """
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format '{fmt}' (choose from {', '.join(OUTPUT_FORMATS)})")
+        spec = OUTPUT_FORMATS[fmt]
+        if target_ssim is not None and not _numpy_available:
+            target_ssim = None  # SSIM needs numpy - fall back to the fixed quality
+        if target_bytes is None and target_ssim is None:
+            data, elapsed = self._trial(image, fmt, quality or spec['quality'])
+            result = {'quality': quality or spec['quality'], 'data': data, 'encode_ms': elapsed,
+                      'trials': 1, 'target_met': True}
+        else:
+            result = self._search(image, fmt, target_bytes, target_ssim, cache_key)
+        result.update(format=fmt, ext=spec['ext'], mime=spec['mime'], bytes=len(result['data']))
+        result['encode_ms'] = round(result['encode_ms'], 2)
+        self._count(fmt, result)
+        return result
+
+    def _search(self, image: Image.Image, fmt: str, target_bytes: Optional[int], target_ssim: Optional[float],
+                cache_key) -> Dict:
+        low, high = OUTPUT_FORMATS[fmt]['quality_range']
+        key = (fmt, target_bytes, target_ssim, cache_key)
+        tried: Dict[int, Dict] = {}
+        elapsed = 0.0
+
+        def meets(quality: int) -> bool:
+            nonlocal elapsed
+            if quality not in tried:
+                data, ms = self._trial(image, fmt, quality)
+                elapsed += ms
+                trial = {'quality': quality, 'data': data}
+                if target_bytes is not None:
+                    trial['ok'] = len(data) <= target_bytes
+                else:
+                    trial['ssim'] = round(ssim(image, Image.open(io.BytesIO(data))), 4)
+                    trial['ok'] = trial['ssim'] >= target_ssim
+                tried[quality] = trial
+            return tried[quality]['ok']
+
+        # Size falls as quality drops: want the highest passing quality. SSIM rises with
+        # quality: want the lowest passing one. Both are a boundary search on [low, high].
+        want_high = target_bytes is not None
+        with self._lock:
+            cached = self._qualities.get(key)
+            if cached is not None:
+                self._qualities.move_to_end(key)
+        if cached is not None:
+            self._counter(fmt)['cache_hits'] += 1
+            if meets(cached):
+                # Still passes - photos of one kind rarely move the boundary, so don't re-probe it
+                return dict(tried[cached], encode_ms=elapsed, trials=len(tried), target_met=True)
+            if want_high:
+                high = cached - 1
+            else:
+                low = cached + 1
+
+        self._counter(fmt)['searches'] += 1
+        best = None
+        while low <= high:
+            middle = (low + high) // 2
+            if meets(middle):
+                best = middle
+                if want_high:
+                    low = middle + 1
+                else:
+                    high = middle - 1
+            elif want_high:
+                high = middle - 1
+            else:
+                low = middle + 1
+
+        target_met = best is not None
+        if best is None:  # unreachable target - closest we can get
+            best = OUTPUT_FORMATS[fmt]['quality_range'][0 if want_high else 1]
+            meets(best)
+        else:
+            with self._lock:
+                self._qualities[key] = best
+                self._qualities.move_to_end(key)
+                while len(self._qualities) > self.max_cached_qualities:
+                    self._qualities.popitem(last=False)
+        return dict(tried[best], encode_ms=elapsed, trials=len(tried), target_met=target_met)
+
+    def _counter(self, fmt: str) -> Dict:
+        with self._lock:
+            return self.counters.setdefault(fmt, {'images': 0, 'trials': 0, 'bytes': 0, 'encode_ms': 0.0,
+                                                  'searches': 0, 'cache_hits': 0})
+
+    def _count(self, fmt: str, result: Dict):
+        counter = self._counter(fmt)
+        with self._lock:
+            counter['images'] += 1
+            counter['trials'] += result['trials']
+            counter['bytes'] += result['bytes']
+            counter['encode_ms'] += result['encode_ms']
+
+    def stats(self) -> Dict:
+        """Per format: images, bytes and encode time (totals and per image), searches, cache hits"""
+        with self._lock:
+            stats = {}
+            for fmt, counter in self.counters.items():
+                images = counter['images'] or 1
+                stats[fmt] = dict(counter, encode_ms=round(counter['encode_ms'], 2),
+                                  avg_bytes=counter['bytes'] // images,
+                                  avg_encode_ms=round(counter['encode_ms'] / images, 2))
+            stats['cached_qualities'] = len(self._qualities)
+            return stats
+
+
+# ==================== BACKGROUND CACHE ====================
+
+def _image_nbytes(image: Image.Image) -> int:
+    """Approximate in-memory size - Pillow stores RGB as 4 bytes per pixel"""
+    return image.width * image.height * (1 if image.mode in ('1', 'L', 'P') else 4)
+
+
+class BackgroundCache:
+    """
+    Renders each (preset, canvas size) once and hands out private copies
+    Eviction is LRU bounded by total bytes, not entry count - one 12 MP photo's
+    canvas (~150 MP) weighs as much as hundreds of thumbnails' canvases.
+    With `bucket`, sizes are snapped up to a multiple of it and the cached
+    render is centre-cropped, so near-identical photo sizes share one render.
+    """
+
+    def __init__(self, render, max_bytes: int = 512 * 1024 * 1024, bucket: Optional[int] = None):
+        self.render = render  # render(width, height, preset, listing_id) -> Image
+        self.max_bytes = max_bytes
+        self.bucket = bucket
+        self._entries: 'OrderedDict[tuple, Image.Image]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._rendering: Dict[tuple, threading.Lock] = {}  # one render per key, even under a thread pool
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'uncacheable': 0}
+
+    def _snap(self, size: int) -> int:
+        if not self.bucket:
+            return size
+        return -(-size // self.bucket) * self.bucket
+
+    def _lookup(self, key: tuple) -> Optional[Image.Image]:
+        base = self._entries.get(key)
+        if base is not None:
+            self._entries.move_to_end(key)
+        return base
+
+    def _store(self, key: tuple, base: Image.Image):
+        nbytes = _image_nbytes(base)
+        if nbytes > self.max_bytes:
+            self.counters['uncacheable'] += 1
+            return
+        self._entries[key] = base
+        self._bytes += nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= _image_nbytes(evicted)
+            self.counters['evictions'] += 1
+
+    def get(self, preset: str, width: int, height: int, mode: Optional[str] = None,
+            listing_id: Optional[str] = None, supersample: int = 1) -> Image.Image:
+        """
+        Background of exactly (width, height), converted to `mode` if given
+        `supersample` renders at N x the size and reduce()s once before caching, so
+        textures keep the scale they have on a full-size canvas.
+        Always a new image: the crop/convert that callers need anyway is the copy,
+        so pasting into the result can never touch the cached base.
+        """
+        key = (preset, self._snap(width), self._snap(height), listing_id, supersample)
+        with self._lock:
+            base = self._lookup(key)
+            if base is not None:
+                self.counters['hits'] += 1
+            else:
+                self.counters['misses'] += 1
+                key_lock = self._rendering.setdefault(key, threading.Lock())
+
+        if base is None:
+            with key_lock:
+                with self._lock:
+                    base = self._lookup(key)
+                if base is None:
+                    base = self.render(key[1] * supersample, key[2] * supersample, preset, listing_id)
+                    if supersample > 1:
+                        base = base.reduce(supersample)
+                    with self._lock:
+                        self._store(key, base)
+                        self._rendering.pop(key, None)
+
+        if base.size != (width, height):
+            left, top = (base.width - width) // 2, (base.height - height) // 2
+            image = base.crop((left, top, left + width, top + height))
+            return image.convert(mode) if mode and mode != image.mode else image
+        return base.convert(mode) if mode and mode != base.mode else base.copy()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            stats = dict(self.counters)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['max_bytes'] = self.max_bytes
+            stats['hit_rate'] = round(self.counters['hits'] / lookups, 4) if lookups else 0.0
+            return stats
+
+
+# ==================== ADMISSION CONTROL ====================
+
+class MemoryBudget:
+    """
+    Process-wide ceiling on the pixel memory image tasks may hold at once
+    Each task reserves its estimated footprint (from the header, before decoding) and
+    waits in FIFO order until it fits. A task larger than the whole budget runs alone
+    instead of never.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._in_use = 0
+        self._queue: deque = deque()
+        self._condition = threading.Condition()
+        self.counters = {'admitted': 0, 'queued': 0, 'oversized': 0, 'peak_bytes': 0}
+
+    def _can_admit(self, ticket, nbytes: int) -> bool:
+        return self._queue[0] is ticket and (self._in_use == 0 or self._in_use + nbytes <= self.max_bytes)
+
+    @contextmanager
+    def reserve(self, nbytes: int):
+        """Block until nbytes fit under the budget, hold them for the with-block"""
+        ticket = object()
+        with self._condition:
+            self._queue.append(ticket)
+            if not self._can_admit(ticket, nbytes):
+                self.counters['queued'] += 1
+                self._condition.wait_for(lambda: self._can_admit(ticket, nbytes))
+            self._queue.popleft()
+            self._in_use += nbytes
+            self.counters['admitted'] += 1
+            if nbytes > self.max_bytes:
+                self.counters['oversized'] += 1
+            self.counters['peak_bytes'] = max(self.counters['peak_bytes'], self._in_use)
+            self._condition.notify_all()  # the next ticket may fit too
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_use -= nbytes
+                self._condition.notify_all()
+
+    def stats(self) -> Dict:
+        with self._condition:
+            stats = dict(self.counters)
+            stats['in_use_bytes'] = self._in_use
+            stats['max_bytes'] = self.max_bytes
+            stats['queue_depth'] = len(self._queue)
+            return stats
+
+
+_memory_budget = None
+_memory_budget_lock = threading.Lock()
+
+
+def get_memory_budget() -> MemoryBudget:
+    """Budget shared by every CarImageProcessor in the process (CARBOT_IMAGE_MEMORY_MB, default 1024)"""
+    global _memory_budget
+    with _memory_budget_lock:
+        if _memory_budget is None:
+            _memory_budget = MemoryBudget(int(os.getenv('CARBOT_IMAGE_MEMORY_MB', '1024')) * 1024 * 1024)
+        return _memory_budget
+
+
+# ==================== PERCEPTUAL HASHING ====================
+
+HASH_SIZE = 8            # dHash grid - 8x8 horizontal gradients = 64-bit fingerprint
+HASH_BITS = HASH_SIZE * HASH_SIZE
+_FINGERPRINT_DRAFT = (64, 64)  # JPEGs are decoded at 1/8 scale (greyscale) for hashing
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash - bit set where a pixel is brighter than its right-hand neighbour"""
+    small = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+    pixels = small.tobytes()
+    fingerprint = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            fingerprint = (fingerprint << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return _popcount(a ^ b)
+
+
+_popcount = getattr(int, 'bit_count', None) or (lambda value: bin(value).count('1'))  # int.bit_count is 3.10+
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(bits: int, max_flips: int) -> Tuple[int, ...]:
+    """Every mask of up to max_flips set bits within a `bits`-wide substring (including 0)"""
+    masks = [0]
+    for flips in range(1, max_flips + 1):
+        for positions in combinations(range(bits), flips):
+            masks.append(sum(1 << p for p in positions))
+    return tuple(masks)
+
+
+def fingerprint_upload(source) -> int:
+    """
+    dHash of an upload (path or file object) from a tiny thumbnail
+    Opens its own handle so a lazily opened copy of the upload is left untouched; file
+    objects are rewound to where they were. JPEGs decode greyscale at 1/8 scale.
+    """
+    position = source.tell() if hasattr(source, 'tell') else None
+    try:
+        with Image.open(source) as img:
+            img.draft('L', _FINGERPRINT_DRAFT)
+            return dhash(img)
+    finally:
+        if position is not None:
+            source.seek(position)
+
+
+class HashIndex:
+    """
+    Multi-index hash table for Hamming-radius lookups over 64-bit fingerprints
+    Each fingerprint is split into `chunks` substrings, each with its own exact-match
+    table. Two fingerprints within `radius` bits differ by at most radius // chunks bits
+    in at least one substring (pigeonhole), so a lookup only probes the substrings'
+    near neighbours and verifies those candidates - not the whole index.
+    """
+
+    def __init__(self, radius: int = 6, chunks: int = 3):
+        self.radius = radius
+        self.chunks = chunks
+        # (shift, width) of each substring - widths differ by at most one bit
+        widths = [HASH_BITS // chunks + (i < HASH_BITS % chunks) for i in range(chunks)]
+        self._chunk_layout = [(sum(widths[:i]), width) for i, width in enumerate(widths)]
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(chunks)]
+        self._values: Dict[int, object] = {}
+        self._lock = threading.Lock()
+
+    def _substrings(self, fingerprint: int):
+        for shift, width in self._chunk_layout:
+            yield (fingerprint >> shift) & ((1 << width) - 1)
+
+    def add(self, fingerprint: int, value=None):
+        """Index a fingerprint; re-adding one replaces its value"""
+        with self._lock:
+            if fingerprint not in self._values:
+                for table, substring in zip(self._tables, self._substrings(fingerprint)):
+                    table.setdefault(substring, []).append(fingerprint)
+            self._values[fingerprint] = value
+
+    def search(self, fingerprint: int, radius: Optional[int] = None) -> List[Tuple[int, int, object]]:
+        """(distance, fingerprint, value) for every entry within radius bits, nearest first"""
+        radius = self.radius if radius is None else radius
+        max_flips = radius // self.chunks
+        candidates = set()
+        with self._lock:
+            for (_, width), table, substring in zip(self._chunk_layout, self._tables, self._substrings(fingerprint)):
+                probe = table.get
+                for mask in _flip_masks(width, max_flips):
+                    bucket = probe(substring ^ mask)
+                    if bucket:
+                        candidates.update(bucket)
+            matches = []
+            for candidate in candidates:
+                distance = _popcount(fingerprint ^ candidate)
+                if distance <= radius:
+                    matches.append((distance, candidate, self._values[candidate]))
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+    def nearest(self, fingerprint: int, radius: Optional[int] = None) -> Optional[Tuple[int, int, object]]:
+        matches = self.search(fingerprint, radius)
+        return matches[0] if matches else None
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
 class CarImageProcessor:
     """Professional car image processor optimized for conversion and engagement"""
     
@@ -78,7 +802,34 @@ class CarImageProcessor:
         'vignette': '🎯 Professional Vignette',
     }
     
-    def __init__(self):
+    # Output geometry - position 0 is the Facebook cover, the rest are square posts
+    COVER_SIZE = (1200, 630)
+    POST_SIZE = (1080, 1080)
+    BACKGROUND_SCALE = 3.5   # canvas is 3.5x the photo - car is only ~28% of image
+    DECODE_OVERSAMPLE = 2    # decode at 2x the pixels the photo finally occupies
+    PIPELINE_COPIES = 3      # full-size images a task holds at once (input, output, filter scratch)
+    QUALITY_PROXY_SIZE = (256, 256)
+    SHARPNESS_HALF_SCORE = 200.0  # Laplacian variance (on the proxy) that earns half the sharpness score
+    BEST_PHOTO_COUNT = 10    # photos selected for the post
+    
+    # Platform renditions (width, height) - see render_renditions
+    RENDITIONS = {
+        'facebook_cover': (1200, 630),
+        'facebook_post': (1080, 1080),
+        'instagram_square': (1080, 1080),
+        'instagram_portrait': (1080, 1350),   # 4:5
+        'tiktok': (1080, 1920),               # 9:16
+        'snapchat': (1080, 1920),             # 9:16
+        'youtube_thumbnail': (1280, 720),     # 16:9
+    }
+    DUPLICATE_DISTANCE = 6   # dHash bits two uploads may differ by and still be the same shot
+    PIPELINE_VERSION = '2'   # bump whenever processing changes output pixels - keys the image store
+    
+    def __init__(self, background_cache_bytes: Optional[int] = None, background_bucket: int = 32,
+                 max_workers: Optional[int] = None, draft_decode: bool = True,
+                 frugal_compositing: bool = True, memory_budget: Optional[MemoryBudget] = None,
+                 image_store: Optional[ImageStore] = None, output_format: str = 'jpeg',
+                 target_bytes: Optional[int] = None, target_ssim: Optional[float] = None):
         self.max_image_size = (1200, 1200)
         self.collage_size = (1200, 800)
         self.output_dir = Path('processed_images')
@@ -92,43 +843,151 @@ class CarImageProcessor:
             'sharpness': 1.15,     # 15% sharper (was 10%)
             'vibrance': 1.12       # Extra color pop
         }
+        
+        # Decode straight to output-appropriate resolution (False = full-resolution reference path)
+        self.draft_decode = draft_decode
+        # Compose backgrounds at the final post size instead of on a 3.5x RGBA canvas
+        self.frugal_compositing = frugal_compositing
+        # Admission control - process-wide unless a budget is passed in
+        self.memory_budget = memory_budget or get_memory_budget()
+        
+        # Per-photo pipeline threads - Pillow releases the GIL in decode, filters, resize and encode
+        self.max_workers = max_workers or int(os.getenv('CARBOT_IMAGE_WORKERS', '0')) or min(4, os.cpu_count() or 1)
+        
+        # Rendered presets, shared by every image in a batch (CARBOT_BG_CACHE_MB, default 512)
+        if background_cache_bytes is None:
+            background_cache_bytes = int(os.getenv('CARBOT_BG_CACHE_MB', '512')) * 1024 * 1024
+        self.background_cache = BackgroundCache(self._create_background_by_preset,
+                                                max_bytes=background_cache_bytes, bucket=background_bucket)
+        
+        # Output encoding - format plus optional per-photo byte or SSIM target (see ImageEncoder)
+        if output_format not in available_formats():
+            raise ValueError(f"Output format '{output_format}' not available (have {', '.join(available_formats())})")
+        self.output_format = output_format
+        self.target_bytes = target_bytes
+        self.target_ssim = target_ssim
+        self.encoder = ImageEncoder()
+        
+        # Content-addressed output (off unless a store is passed in - see ImageStore.from_env)
+        self.image_store = image_store
+        
+        # Fingerprints of every photo each dealer has had processed (dealer_id -> index of listing_id)
+        self.photo_history: Dict[str, HashIndex] = {}
+        self._history_lock = threading.Lock()
     
     def calculate_image_quality_score(self, image: Image.Image) -> float:
         """
         Analyze image quality to select best photos
-        Scores: brightness, contrast, edges (detail), saturation
-        Returns: score 0-100
+        Scores: brightness, contrast, sharpness (detail), saturation
+        Returns: score 0-100 (a neutral 50 if the image can't be scored)
         """
         try:
-            img_array = np.array(image)
-            
-            # Calculate metrics
-            brightness = np.mean(img_array) / 255.0
-            contrast = np.std(img_array) / 127.5
-            
-            # Detect edges (measure detail/clarity)
-            edges = image.filter(ImageFilter.FIND_EDGES)
-            edge_array = np.array(edges)
-            edge_strength = np.mean(edge_array) / 255.0
-            
-            # Calculate composite score
-            score = (
-                (brightness * 0.2) +
-                (min(contrast / 2, 1.0) * 0.2) +
-                (edge_strength * 0.3) +
-                (0.3)
-            ) * 100
-            
-            return min(score, 100)
-        
+            return self.score_images([self.quality_proxy(image)])['metrics'][0]['score']
         except Exception as e:
             print(f"Error calculating quality score: {e}")
             return 50
     
-
+    def quality_proxy(self, image: Image.Image) -> Image.Image:
+        """Fixed-size RGB thumbnail that quality scoring runs on - never the full photo"""
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        # Integer reduce() first (fast box average), then an exact BOX resize to the proxy size
+        factor = min(image.width // self.QUALITY_PROXY_SIZE[0], image.height // self.QUALITY_PROXY_SIZE[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+        return image.resize(self.QUALITY_PROXY_SIZE, Image.Resampling.BOX)
+    
+    def score_images(self, proxies: List[Image.Image]) -> Dict:
+        """
+        Score a listing's proxies together in one vectorised pass over an (N, 256, 256, 3) stack
+        Returns {'metrics': [{'score', 'brightness', 'contrast', 'sharpness', 'saturation'}, ...],
+                 'timings_ms': per-metric time for the whole batch}
+        A proxy that can't be scored gets a neutral {'score': 50.0} instead of failing the batch
+        """
+        if not proxies:
+            return {'metrics': [], 'timings_ms': {}}
+        if not _numpy_available:
+            return {'metrics': [{'score': 50.0} for _ in proxies], 'timings_ms': {}}
+        
+        timings = {}
+        clock = time.perf_counter()
+        
+        def lap(name):
+            nonlocal clock
+            now = time.perf_counter()
+            timings[name] = round((now - clock) * 1000, 3)
+            clock = now
+        
+        arrays, scored = [], []
+        for index, proxy in enumerate(proxies):
+            try:
+                if proxy.mode != 'RGB' or proxy.size != self.QUALITY_PROXY_SIZE:
+                    proxy = self.quality_proxy(proxy)
+                arrays.append(np.asarray(proxy, dtype=np.float32))
+                scored.append(index)
+            except Exception as e:
+                print(f"Error calculating quality score: {e}")
+        metrics = [{'score': 50.0} for _ in proxies]
+        if not arrays:
+            return {'metrics': metrics, 'timings_ms': {}}
+        rgb = np.stack(arrays)
+        luma = (_LUMA_WEIGHTS[0] * rgb[..., 0] + _LUMA_WEIGHTS[1] * rgb[..., 1]
+                + _LUMA_WEIGHTS[2] * rgb[..., 2])
+        lap('stack')
+        
+        # Exposure: mean luma, best around mid-grey
+        brightness = luma.mean(axis=(1, 2)) / 255
+        lap('brightness')
+        
+        # Global contrast: luma standard deviation
+        contrast = luma.std(axis=(1, 2)) / 127.5
+        lap('contrast')
+        
+        # Sharpness: variance of the 4-neighbour Laplacian (blurry photos have little)
+        laplacian = (4 * luma[:, 1:-1, 1:-1] - luma[:, :-2, 1:-1] - luma[:, 2:, 1:-1]
+                     - luma[:, 1:-1, :-2] - luma[:, 1:-1, 2:])
+        sharpness = laplacian.var(axis=(1, 2))
+        lap('sharpness')
+        
+        # Colourfulness: mean HSV saturation
+        red, green, blue = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+        high = np.maximum(np.maximum(red, green), blue)  # channel-wise beats max(axis=3) on a 3-wide axis
+        low = np.minimum(np.minimum(red, green), blue)
+        saturation = ((high - low) / np.maximum(high, 1)).mean(axis=(1, 2))
+        lap('saturation')
+        
+        exposure_score = 1 - np.minimum(np.abs(brightness - 0.5) / 0.5, 1)
+        contrast_score = np.minimum(contrast / 0.5, 1)
+        sharpness_score = sharpness / (sharpness + self.SHARPNESS_HALF_SCORE)
+        saturation_score = np.minimum(saturation / 0.5, 1)
+        scores = 100 * (0.25 * exposure_score + 0.2 * contrast_score
+                        + 0.35 * sharpness_score + 0.2 * saturation_score)
+        lap('combine')
+        
+        for i, index in enumerate(scored):
+            metrics[index] = {
+                'score': round(float(scores[i]), 1),
+                'brightness': round(float(brightness[i]), 3),
+                'contrast': round(float(contrast[i]), 3),
+                'sharpness': round(float(sharpness[i]), 1),
+                'saturation': round(float(saturation[i]), 3),
+            }
+        return {'metrics': metrics, 'timings_ms': timings}
+    
+    def select_best_images(self, scores: List[float], count: int) -> List[int]:
+        """Indices of the `count` best-scoring photos, best first (ties keep upload order)"""
+        ranking = sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+        return ranking[:count]
     
-    def apply_background_to_image(self, image: Image.Image, background_preset: str = 'none') -> Image.Image:
-        """Apply background preset to image - creates visual background effect"""
+    def apply_background_to_image(self, image: Image.Image, background_preset: str = 'none',
+                                  listing_id: Optional[str] = None,
+                                  output_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+        """
+        Apply background preset to image - creates visual background effect
+        Textures are seeded by (preset, size, listing_id): same inputs, same pixels
+        With output_size, the result is composed directly at the size the 3.5x canvas
+        would be thumbnailed to (same framing, a fraction of the memory)
+        """
         try:
             if background_preset == 'none' or not background_preset:
                 return image
@@ -137,19 +996,21 @@ class CarImageProcessor:
             orig_width, orig_height = image.width, image.height
             
             # Create MUCH LARGER canvas for background effect (3.5x size - car is only ~28% of image)
-            canvas_width = int(orig_width * 3.5)
-            canvas_height = int(orig_height * 3.5)
+            canvas_width = int(orig_width * self.BACKGROUND_SCALE)
+            canvas_height = int(orig_height * self.BACKGROUND_SCALE)
+            
+            if output_size:
+                return self._compose_at_output_size(image, (canvas_width, canvas_height), background_preset,
+                                                    listing_id, output_size)
             
-            # Create background based on preset
-            bg = self._create_background_by_preset(canvas_width, canvas_height, background_preset)
+            # Cached preset render, handed out as a private RGBA copy
+            bg = self.background_cache.get(background_preset, canvas_width, canvas_height, mode='RGBA',
+                                           listing_id=listing_id)
             
             # Convert image to RGBA for transparency handling
             if image.mode != 'RGBA':
                 image = image.convert('RGBA')
             
-            # Convert background to RGBA
-            bg = bg.convert('RGBA')
-            
             # Center the car image on the background (will show lots of background)
             x_offset = (canvas_width - orig_width) // 2
             y_offset = (canvas_height - orig_height) // 2
@@ -164,34 +1025,61 @@ class CarImageProcessor:
             print(f"Error applying background: {e}")
             return image
     
-    def _create_background_by_preset(self, width: int, height: int, preset: str) -> Image.Image:
+    def _compose_at_output_size(self, image: Image.Image, canvas_size: Tuple[int, int], background_preset: str,
+                                listing_id: Optional[str], output_size: Tuple[int, int]) -> Image.Image:
+        """
+        Same picture as pasting onto the full canvas and thumbnailing it into output_size,
+        but the background is rendered (cached) at the final size and the photo is scaled
+        to its final footprint before pasting - no RGBA copies unless the photo has alpha
+        """
+        canvas_width, canvas_height = canvas_size
+        final_width, final_height = thumbnail_size(canvas_size, output_size)
+        bg = self.background_cache.get(background_preset, final_width, final_height, listing_id=listing_id,
+                                       supersample=self.DECODE_OVERSAMPLE)
+        
+        photo_size = (max(round(image.width * final_width / canvas_width), 1),
+                      max(round(image.height * final_height / canvas_height), 1))
+        if image.size != photo_size:
+            image = image.resize(photo_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+        
+        offset = ((final_width - image.width) // 2, (final_height - image.height) // 2)
+        if 'A' in image.getbands():
+            bg.paste(image, offset, image)
+        else:
+            bg.paste(image, offset)
+        return bg
+    
+    def _create_background_by_preset(self, width: int, height: int, preset: str,
+                                     listing_id: Optional[str] = None) -> Image.Image:
         """Create realistic textured background scenes for each preset"""
         try:
+            seed = texture_seed(preset, listing_id)
+
             # Luxury Residential
             if preset == 'villa_green':
-                return self._create_villa_green_scene(width, height)
+                return self._create_villa_green_scene(width, height, seed)
             elif preset == 'villa_modern':
                 return self._create_villa_modern_scene(width, height)
             elif preset == 'villa_pool':
-                return self._create_villa_pool_scene(width, height)
+                return self._create_villa_pool_scene(width, height, seed)
             
             # Waterfront & Beach
             elif preset == 'marina_blue':
-                return self._create_marina_scene(width, height)
+                return self._create_marina_scene(width, height, seed)
             elif preset == 'marina_gold':
                 return self._create_marina_sunset_scene(width, height)
             elif preset == 'beach_golden':
-                return self._create_beach_scene(width, height)
+                return self._create_beach_scene(width, height, seed)
             elif preset == 'beach_sunset':
                 return self._create_sunset_beach_scene(width, height)
             
             # Urban & Downtown
             elif preset == 'cityscape':
-                return self._create_cityscape_scene(width, height)
+                return self._create_cityscape_scene(width, height, seed)
             elif preset == 'downtown_night':
-                return self._create_downtown_night_scene(width, height)
+                return self._create_downtown_night_scene(width, height, seed)
             elif preset == 'emirates_towers':
-                return self._create_emirates_towers_scene(width, height)
+                return self._create_emirates_towers_scene(width, height, seed)
             
             # Nature & Desert
             elif preset == 'desert_sunset':
@@ -205,9 +1093,9 @@ class CarImageProcessor:
             elif preset == 'parking_modern':
                 return self._create_modern_parking_scene(width, height)
             elif preset == 'parking_luxury':
-                return self._create_luxury_parking_scene(width, height)
+                return self._create_luxury_parking_scene(width, height, seed)
             elif preset == 'showroom_modern':
-                return self._create_showroom_scene(width, height)
+                return self._create_showroom_scene(width, height, seed)
             
             # Professional & Clean
             elif preset == 'simple_white':
@@ -239,37 +1127,37 @@ class CarImageProcessor:
     
     # ==================== VILLA SCENES ====================
     
-    def _create_villa_green_scene(self, width: int, height: int) -> Image.Image:
+    def _create_villa_green_scene(self, width: int, height: int, seed: str = '') -> Image.Image:
         """Create garden/villa green scene"""
         bg = self._create_gradient_background(width, height, (20, 100, 20), (80, 150, 60))
-        return self._add_garden_texture(bg)
+        return self._add_garden_texture(bg, seed)
     
     def _create_villa_modern_scene(self, width: int, height: int) -> Image.Image:
         """Create modern villa architecture scene"""
         bg = self._create_gradient_background(width, height, (40, 40, 60), (120, 150, 180))
         return self._add_building_pattern(bg)
     
-    def _create_villa_pool_scene(self, width: int, height: int) -> Image.Image:
+    def _create_villa_pool_scene(self, width: int, height: int, seed: str = '') -> Image.Image:
         """Create villa with pool water scene"""
         bg = self._create_gradient_background(width, height, (0, 80, 160), (100, 200, 220))
-        return self._add_water_texture(bg)
+        return self._add_water_texture(bg, seed)
     
     # ==================== WATERFRONT SCENES ====================
     
-    def _create_marina_scene(self, width: int, height: int) -> Image.Image:
+    def _create_marina_scene(self, width: int, height: int, seed: str = '') -> Image.Image:
         """Create Dubai Marina waterfront scene"""
         bg = self._create_gradient_background(width, height, (0, 60, 120), (100, 180, 220))
-        return self._add_water_ripples(bg)
+        return self._add_water_ripples(bg, seed)
     
     def _create_marina_sunset_scene(self, width: int, height: int) -> Image.Image:
         """Create marina sunset scene"""
         bg = self._create_gradient_background(width, height, (150, 80, 20), (255, 200, 80))
         return self._add_sunset_reflection(bg)
     
-    def _create_beach_scene(self, width: int, height: int) -> Image.Image:
+    def _create_beach_scene(self, width: int, height: int, seed: str = '') -> Image.Image:
         """Create golden beach scene"""
         bg = self._create_gradient_background(width, height, (200, 150, 50), (255, 240, 150))
-        return self._add_sand_texture(bg)
+        return self._add_sand_texture(bg, seed)
     
     def _create_sunset_beach_scene(self, width: int, height: int) -> Image.Image:
         """Create sunset beach scene"""
@@ -278,20 +1166,20 @@ class CarImageProcessor:
     
     # ==================== CITYSCAPE SCENES ====================
     
-    def _create_cityscape_scene(self, width: int, height: int) -> Image.Image:
+    def _create_cityscape_scene(self, width: int, height: int, seed: str = '') -> Image.Image:
         """Create Dubai cityscape scene"""
         bg = self._create_gradient_background(width, height, (60, 80, 100), (150, 170, 200))
-        return self._add_cityscape_buildings(bg)
+        return self._add_cityscape_buildings(bg, seed)
     
-    def _create_downtown_night_scene(self, width: int, height: int) -> Image.Image:
+    def _create_downtown_night_scene(self, width: int, height: int, seed: str = '') -> Image.Image:
         """Create downtown night scene"""
         bg = self._create_gradient_background(width, height, (15, 20, 40), (60, 80, 120))
-        return self._add_night_lights(bg)
+        return self._add_night_lights(bg, seed)
     
-    def _create_emirates_towers_scene(self, width: int, height: int) -> Image.Image:
+    def _create_emirates_towers_scene(self, width: int, height: int, seed: str = '') -> Image.Image:
         """Create emirates towers district scene"""
         bg = self._create_gradient_background(width, height, (70, 100, 140), (180, 210, 240))
-        return self._add_skyscraper_silhouettes(bg)
+        return self._add_skyscraper_silhouettes(bg, seed)
     
     # ==================== DESERT SCENES ====================
     
@@ -317,37 +1205,24 @@ class CarImageProcessor:
         bg = self._create_gradient_background(width, height, (140, 140, 150), (200, 200, 210))
         return self._add_parking_markings(bg)
     
-    def _create_luxury_parking_scene(self, width: int, height: int) -> Image.Image:
+    def _create_luxury_parking_scene(self, width: int, height: int, seed: str = '') -> Image.Image:
         """Create luxury parking garage scene"""
         bg = self._create_gradient_background(width, height, (180, 180, 190), (220, 220, 230))
-        return self._add_garage_pattern(bg)
+        return self._add_garage_pattern(bg, seed)
     
-    def _create_showroom_scene(self, width: int, height: int) -> Image.Image:
+    def _create_showroom_scene(self, width: int, height: int, seed: str = '') -> Image.Image:
         """Create modern showroom scene"""
         bg = self._create_gradient_background(width, height, (120, 120, 140), (190, 190, 210))
-        return self._add_showroom_lights(bg)
+        return self._add_showroom_lights(bg, seed)
     
     # ==================== TEXTURE & PATTERN METHODS ====================
     
-    def _add_garden_texture(self, image: Image.Image) -> Image.Image:
+    def _add_garden_texture(self, image: Image.Image, seed: str = '') -> Image.Image:
         """Add garden foliage texture - BOLD VERSION"""
-        from PIL import ImageDraw
-        import random
-        
-        draw = ImageDraw.Draw(image, 'RGBA')
-        width, height = image.size
-        
-        # Add LARGE random foliage/leaf patterns - MORE VISIBLE
-        for _ in range(400):  # Doubled from 200
-            x = random.randint(0, width)
-            y = random.randint(int(height * 0.3), height)  # Lower half
-            size = random.randint(15, 50)  # Much larger leaves
-            alpha = random.randint(80, 150)  # More opaque
-            color = (random.randint(0, 80), random.randint(80, 160), random.randint(0, 80), alpha)
-            draw.ellipse([x-size, y-size, x+size, y+size], fill=color)
-        
-        return image
+        # LARGE random foliage/leaf patterns over the lower 70% - seeded tile
+        return paste_tiled(image, scatter_tile('garden', seed), top=int(image.height * 0.3))
     
+
     def _add_building_pattern(self, image: Image.Image) -> Image.Image:
         """Add modern building/architecture pattern - BOLD VERSION"""
         from PIL import ImageDraw
@@ -365,34 +1240,23 @@ class CarImageProcessor:
         
         return image
     
-    def _add_water_texture(self, image: Image.Image) -> Image.Image:
+    def _add_water_texture(self, image: Image.Image, seed: str = '') -> Image.Image:
         """Add water ripple texture - BOLD VERSION"""
-        from PIL import ImageDraw
-        import random
-        
-        draw = ImageDraw.Draw(image, 'RGBA')
-        width, height = image.size
-        
-        # Add LARGER water ripples - VERY VISIBLE
-        for _ in range(200):  # Doubled
-            x = random.randint(0, width)
-            y = random.randint(int(height * 0.2), height)
-            radius = random.randint(20, 80)  # Much larger
-            draw.ellipse([x-radius, y-radius, x+radius, y+radius], outline=(255, 255, 255, 80), width=3)
-        
-        return image
+        # LARGER water ripples over the lower 80% - seeded tile
+        return paste_tiled(image, scatter_tile('water', seed), top=int(image.height * 0.2))
     
-    def _add_water_ripples(self, image: Image.Image) -> Image.Image:
+
+    def _add_water_ripples(self, image: Image.Image, seed: str = '') -> Image.Image:
         """Add marina water ripples - BOLD VERSION"""
         from PIL import ImageDraw
-        import random
         
         draw = ImageDraw.Draw(image, 'RGBA')
         width, height = image.size
+        rng = texture_rng(seed, 'water_ripples', image.size)
         
         # Horizontal water lines - MORE VISIBLE
         for y in range(0, height, 8):  # Closer together from 15
-            opacity = random.randint(60, 150)  # Much more opaque
+            opacity = rng.randint(60, 150)  # Much more opaque
             draw.line([(0, y), (width, y)], fill=(255, 255, 255, opacity), width=2)
         
         return image
@@ -418,25 +1282,12 @@ class CarImageProcessor:
         
         return image
     
-    def _add_sand_texture(self, image: Image.Image) -> Image.Image:
+    def _add_sand_texture(self, image: Image.Image, seed: str = '') -> Image.Image:
         """Add sandy beach texture - BOLD VERSION"""
-        from PIL import ImageDraw
-        import random
-        
-        draw = ImageDraw.Draw(image, 'RGBA')
-        width, height = image.size
-        
-        # Add MUCH MORE sand grain texture - VERY VISIBLE
-        for _ in range(800):  # Tripled from 300
-            x = random.randint(0, width)
-            y = random.randint(0, height)
-            size = random.randint(2, 8)  # Larger grains
-            alpha = random.randint(60, 150)  # More opaque
-            color = (220, 200, 120, alpha)
-            draw.ellipse([x-size, y-size, x+size, y+size], fill=color)
-        
-        return image
+        # MUCH MORE sand grain texture - seeded tile
+        return paste_tiled(image, scatter_tile('sand', seed))
     
+
     def _add_sunset_sky_effect(self, image: Image.Image) -> Image.Image:
         """Add dramatic sunset sky effect - BOLD VERSION"""
         from PIL import ImageDraw
@@ -456,13 +1307,13 @@ class CarImageProcessor:
         
         return image
     
-    def _add_cityscape_buildings(self, image: Image.Image) -> Image.Image:
+    def _add_cityscape_buildings(self, image: Image.Image, seed: str = '') -> Image.Image:
         """Add cityscape building silhouettes - BOLD VERSION"""
         from PIL import ImageDraw
-        import random
         
         draw = ImageDraw.Draw(image, 'RGBA')
         width, height = image.size
+        rng = texture_rng(seed, 'buildings', image.size)
         
         # Add LARGE building silhouettes - VERY VISIBLE
         num_buildings = 12  # More buildings
@@ -470,7 +1321,7 @@ class CarImageProcessor:
         
         for i in range(num_buildings):
             x = i * building_width
-            building_height = random.randint(int(height*0.25), int(height*0.75))
+            building_height = rng.randint(int(height*0.25), int(height*0.75))
             draw.rectangle(
                 [x, height-building_height, x+building_width, height],
                 fill=(60, 80, 100, 150)
@@ -483,34 +1334,19 @@ class CarImageProcessor:
         
         return image
     
-    def _add_night_lights(self, image: Image.Image) -> Image.Image:
+    def _add_night_lights(self, image: Image.Image, seed: str = '') -> Image.Image:
         """Add night city lights effect - BOLD VERSION"""
-        from PIL import ImageDraw
-        import random
-        
-        draw = ImageDraw.Draw(image, 'RGBA')
-        width, height = image.size
-        
-        # Add MANY scattered lights - VERY VISIBLE
-        for _ in range(300):  # Doubled
-            x = random.randint(0, width)
-            y = random.randint(0, height)
-            brightness = random.randint(180, 255)
-            size = random.randint(3, 8)
-            draw.ellipse(
-                [x-size, y-size, x+size, y+size],
-                fill=(brightness, brightness-30, brightness-80, 180)
-            )
-        
-        return image
+        # MANY scattered lights - seeded tile
+        return paste_tiled(image, scatter_tile('night_lights', seed))
     
-    def _add_skyscraper_silhouettes(self, image: Image.Image) -> Image.Image:
+
+    def _add_skyscraper_silhouettes(self, image: Image.Image, seed: str = '') -> Image.Image:
         """Add tall skyscraper silhouettes - BOLD VERSION"""
         from PIL import ImageDraw
-        import random
         
         draw = ImageDraw.Draw(image, 'RGBA')
         width, height = image.size
+        rng = texture_rng(seed, 'towers', image.size)
         
         # Add LARGER skyscraper silhouettes - VERY VISIBLE
         num_towers = 10  # More towers
@@ -518,7 +1354,7 @@ class CarImageProcessor:
         
         for i in range(num_towers):
             x = i * tower_width
-            tower_height = random.randint(int(height*0.35), int(height*0.85))
+            tower_height = rng.randint(int(height*0.35), int(height*0.85))
             draw.rectangle(
                 [x, height-tower_height, x+tower_width, height],
                 fill=(80, 110, 140, 160)
@@ -616,19 +1452,19 @@ class CarImageProcessor:
         
         return image
     
-    def _add_garage_pattern(self, image: Image.Image) -> Image.Image:
+    def _add_garage_pattern(self, image: Image.Image, seed: str = '') -> Image.Image:
         """Add garage concrete pattern - BOLD VERSION"""
         from PIL import ImageDraw
-        import random
         
         draw = ImageDraw.Draw(image, 'RGBA')
         width, height = image.size
+        rng = texture_rng(seed, 'garage', image.size)
         
         # Add LARGE concrete tile pattern - VERY VISIBLE
         tile_size = 50  # From 60
         for y in range(0, height, tile_size):
             for x in range(0, width, tile_size):
-                shade = random.randint(160, 190)
+                shade = rng.randint(160, 190)
                 draw.rectangle([x, y, x+tile_size, y+tile_size], outline=(shade, shade, shade, 150), width=3)
         
         # Add diagonal cross-hatching for concrete effect
@@ -637,19 +1473,19 @@ class CarImageProcessor:
         
         return image
     
-    def _add_showroom_lights(self, image: Image.Image) -> Image.Image:
+    def _add_showroom_lights(self, image: Image.Image, seed: str = '') -> Image.Image:
         """Add showroom lighting effects - BOLD VERSION"""
         from PIL import ImageDraw
-        import random
         
         draw = ImageDraw.Draw(image, 'RGBA')
         width, height = image.size
+        rng = texture_rng(seed, 'showroom_lights', image.size)
         
         # Add LARGER spotlight glints - VERY VISIBLE
         for _ in range(40):  # Doubled
-            x = random.randint(0, width)
-            y = random.randint(0, int(height * 0.6))
-            size = random.randint(10, 40)  # Much larger
+            x = rng.randint(0, width)
+            y = rng.randint(0, int(height * 0.6))
+            size = rng.randint(10, 40)  # Much larger
             draw.ellipse([x-size, y-size, x+size, y+size], fill=(255, 255, 255, 120))
             # Add halo
             draw.ellipse([x-size-10, y-size-10, x+size+10, y+size+10], outline=(255, 255, 200, 80), width=3)
@@ -659,18 +1495,7 @@ class CarImageProcessor:
     def _create_gradient_background(self, width: int, height: int, color1: Tuple, color2: Tuple) -> Image.Image:
         """Create a gradient background from color1 to color2"""
         try:
-            bg = Image.new('RGB', (width, height), color1)
-            for y in range(height):
-                ratio = y / height
-                r = int(color1[0] * (1 - ratio) + color2[0] * ratio)
-                g = int(color1[1] * (1 - ratio) + color2[1] * ratio)
-                b = int(color1[2] * (1 - ratio) + color2[2] * ratio)
-                
-                pixels = bg.load()
-                for x in range(width):
-                    pixels[x, y] = (r, g, b)
-            
-            return bg
+            return render_vertical_gradient(width, height, color1, color2)
         except Exception as e:
             print(f"Error creating gradient: {e}")
             return Image.new('RGB', (width, height), color1)
@@ -679,19 +1504,9 @@ class CarImageProcessor:
         """Add spotlight effect to image"""
         try:
             width, height = image.width, image.height
-            overlay = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-            pixels = overlay.load()
-            
-            center_x, center_y = width // 2, height // 2
             max_distance = ((width // 2) ** 2 + (height // 2) ** 2) ** 0.5
-            
-            for y in range(height):
-                for x in range(width):
-                    dist = ((x - center_x) ** 2 + (y - center_y) ** 2) ** 0.5
-                    alpha = int(200 * (dist / max_distance))  # Darken edges
-                    pixels[x, y] = (0, 0, 0, min(alpha, 200))
-            
-            image.paste(overlay, (0, 0), overlay)
+            mask = render_radial_mask(width, height, max_distance, max_distance, strength=200)  # Darken edges
+            image.paste((0, 0, 0), (0, 0, width, height), mask)
             return image
         except Exception as e:
             print(f"Error adding spotlight: {e}")
@@ -701,118 +1516,91 @@ class CarImageProcessor:
         """Add vignette effect (darkened edges)"""
         try:
             width, height = image.width, image.height
-            overlay = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-            pixels = overlay.load()
-            
-            for y in range(height):
-                for x in range(width):
-                    dist_x = abs(x - width // 2) / (width // 2)
-                    dist_y = abs(y - height // 2) / (height // 2)
-                    dist = (dist_x ** 2 + dist_y ** 2) ** 0.5
-                    alpha = int(150 * dist)
-                    pixels[x, y] = (0, 0, 0, min(alpha, 150))
-            
-            image.paste(overlay, (0, 0), overlay)
+            mask = render_radial_mask(width, height, max(width // 2, 1), max(height // 2, 1), strength=150)
+            image.paste((0, 0, 0), (0, 0, width, height), mask)
             return image
         except Exception as e:
             print(f"Error adding vignette: {e}")
             return image
 
-    def process_images(self, image_files: List, background_preset: str = 'none') -> Dict:
-        """Main image processing with comprehensive error handling"""
+    def process_images(self, image_files: List, background_preset: str = 'none',
+                       listing_id: Optional[str] = None, best_count: Optional[int] = None,
+                       dealer_id: Optional[str] = None, dedupe: bool = True) -> Dict:
+        """
+        Main image processing with comprehensive error handling
+        With dedupe, repeated shots in the batch are processed once; with a dealer_id, photos
+        the dealer already used in another listing are reported in 'previously_seen'.
+        Encoded images are returned as bytes; iter_processed_images streams them as
+        memoryviews over the encoder's buffers instead of holding the whole batch.
+        """
         try:
-            # Validate input
-            if not image_files:
-                return {
-                    'success': False,
-                    'error': 'No images provided. Please upload at least 2 images.'
-                }
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                batch = self._prepare_batch(image_files, executor, background_preset, listing_id,
+                                            dealer_id, dedupe)
+                if batch.get('error'):
+                    return {
+                        'success': False,
+                        'error': batch['error']
+                    }
+                errors, identities = batch['errors'], batch['identities']
+                outcomes = list(executor.map(lambda task: self._process_one_image(*task), batch.pop('tasks')))
             
-            if len(image_files) < 2:
-                return {
-                    'success': False,
-                    'error': f'Need at least 2 images. You uploaded {len(image_files)} image(s).'
-                }
+            processed = []
+            for outcome, identity in zip(outcomes, identities):
+                if outcome.get('error'):
+                    errors.append(outcome['error'])
+                else:
+                    processed.append((outcome, identity))
+            image_count = len(outcomes)
+            del outcomes
             
-            if len(image_files) > 25:
+            if len(processed) < 2:
                 return {
                     'success': False,
-                    'error': 'Maximum 25 images allowed. Please reduce your selection.'
+                    'error': "Not enough valid images. " + " | ".join(errors)
                 }
             
-            # Open and validate images
-            images = []
-            errors = []
-            
-            for idx, img_file in enumerate(image_files):
-                try:
-                    img = Image.open(img_file)
-                    
-                    # Validate dimensions
-                    if img.size[0] < 200 or img.size[1] < 200:
-                        errors.append(f"Image {idx+1}: Too small (minimum 200×200px)")
-                        continue
-                    
-                    if img.size[0] > 10000 or img.size[1] > 10000:
-                        errors.append(f"Image {idx+1}: Too large (maximum 10000×10000px)")
-                        continue
-                    
-                    img = img.convert('RGB')
-                    images.append(img)
-                
-                except IOError:
-                    errors.append(f"Image {idx+1}: Invalid format (JPG, PNG, GIF, WebP)")
-                except MemoryError:
-                    errors.append(f"Image {idx+1}: Too large to process")
-                except Exception as e:
-                    errors.append(f"Image {idx+1}: {str(e)}")
-            
-            if len(images) < 2:
-                error_msg = "Not enough valid images. "
-                if errors:
-                    error_msg += " | ".join(errors)
-                return {
-                    'success': False,
-                    'error': error_msg
-                }
-            
-            # Enhance all images
-            enhanced_images = []
-            for img in images:
-                enhanced = self.enhance_image_professional(img)
-                enhanced_images.append(enhanced)
-            
-            # Apply background to enhanced images
-            background_applied_images = []
-            for img in enhanced_images:
-                with_bg = self.apply_background_to_image(img, background_preset)
-                background_applied_images.append(with_bg)
-            
-            # Optimize for Facebook
-            optimized_images = []
-            for idx, img in enumerate(background_applied_images):
-                optimized = self.optimize_for_facebook_professional(img, idx)
-                optimized_images.append(optimized)
-            
-            # Convert all images to bytes for web transmission
-            individual_bytes = []
-            for img in optimized_images:
-                img_bytes = image_to_bytes(img, format='JPEG', quality=88)
-                if img_bytes:
-                    individual_bytes.append(img_bytes)
+            # Score the whole listing at once (store hits bring their metrics along), then pick
+            # the best photos for the post
+            scoring = self.score_images([outcome['proxy'] for outcome, _ in processed if 'proxy' in outcome])
+            fresh_metrics = iter(scoring['metrics'])
+            quality_metrics = [outcome['metrics'] if 'metrics' in outcome else next(fresh_metrics)
+                               for outcome, _ in processed]
+            for (outcome, identity), metrics in zip(processed, quality_metrics):
+                self._record_outcome(outcome, identity, metrics, background_preset, listing_id, dealer_id)
+            individual_bytes = [bytes(outcome['bytes']) for outcome, _ in processed]
+            store_hits = sum(1 for outcome, _ in processed if 'metrics' in outcome)
+            encode_ms = sum(outcome['encode_ms'] for outcome, _ in processed)
+            del processed
+            quality_scores = [metrics['score'] for metrics in quality_metrics]
+            best_indices = self.select_best_images(quality_scores, best_count or self.BEST_PHOTO_COUNT)
+            best_images = [individual_bytes[i] for i in best_indices]
             
             return {
                 'success': True,
                 'individual_images': individual_bytes,
-                'image_count': len(images),
-                'processed_count': len(images),
+                'best_images': best_images,
+                'best_indices': best_indices,
+                'image_count': image_count,
+                'processed_count': len(individual_bytes),
                 'quality_scores': quality_scores,
+                'quality_metrics': quality_metrics,
+                'duplicates': batch['duplicates'],
+                'previously_seen': batch['previously_seen'],
                 'warnings': errors if errors else [],
                 'metadata': {
                     'best_for_collage': True,
-                    'total_images': len(images),
+                    'total_images': image_count,
                     'selected_for_post': len(best_images),
                     'quality_rating': f"{sum(quality_scores)/len(quality_scores):.1f}/100",
+                    'scoring_timings_ms': scoring['timings_ms'],
+                    'store_hits': store_hits,
+                    'encoding': {
+                        'format': self.output_format,
+                        'mime': OUTPUT_FORMATS[self.output_format]['mime'],
+                        'bytes': sum(len(data) for data in individual_bytes),
+                        'encode_ms': round(encode_ms, 2)
+                    },
                     'optimization': 'Professional - Maximum Conversion',
                     'background': background_preset if background_preset != 'none' else 'Original',
                     'facebook_ready': True
@@ -830,27 +1618,343 @@ class CarImageProcessor:
                 'error': f'Processing error: {str(e)}'
             }
     
+    def iter_processed_images(self, image_files: List, background_preset: str = 'none',
+                              listing_id: Optional[str] = None, dealer_id: Optional[str] = None,
+                              dedupe: bool = True) -> Iterator[Dict]:
+        """
+        Generator mode - yield each photo, in upload order, as soon as it is encoded
+        Yields {'success': True, 'image', 'position', 'data' (memoryview), 'mime', 'encode_ms',
+                 'metrics', 'stored'}
+        per photo and {'success': False, 'error'} for every upload that was skipped or failed.
+        Only max_workers photos are in flight, so peak memory is a few encodings rather than
+        the whole batch - write each 'data' out (e.g. to an HTTP response) before asking for
+        the next one. Photos are scored one at a time; there is no best-photo selection.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                batch = self._prepare_batch(image_files, executor, background_preset, listing_id,
+                                            dealer_id, dedupe)
+            except MemoryError:
+                batch = {'error': 'Processing failed: Not enough memory. Try fewer/smaller images.'}
+            except Exception as e:
+                batch = {'error': f'Processing error: {str(e)}'}
+            if batch.get('error'):
+                yield {'success': False, 'error': batch['error']}
+                return
+            for error in batch['errors']:
+                yield {'success': False, 'error': error}
+            
+            window = deque()
+            try:
+                for task, identity in zip(batch.pop('tasks'), batch['identities']):
+                    window.append((task, identity, executor.submit(self._process_one_image, *task)))
+                    if len(window) > self.max_workers:
+                        yield self._stream_record(*window.popleft(), dealer_id)
+                while window:
+                    yield self._stream_record(*window.popleft(), dealer_id)
+            finally:
+                for _, _, future in window:  # consumer stopped early
+                    future.cancel()
+    
+    def _stream_record(self, task: tuple, identity: Dict, future, dealer_id: Optional[str]) -> Dict:
+        position, idx, _, background_preset, listing_id, _ = task
+        outcome = future.result()
+        if outcome.get('error'):
+            return {'success': False, 'error': outcome['error']}
+        metrics = outcome.get('metrics') or self.score_images([outcome['proxy']])['metrics'][0]
+        self._record_outcome(outcome, identity, metrics, background_preset, listing_id, dealer_id)
+        return {'success': True, 'image': idx + 1, 'position': position, 'data': outcome['bytes'],
+                'mime': OUTPUT_FORMATS[self.output_format]['mime'], 'encode_ms': outcome['encode_ms'],
+                'metrics': metrics, 'stored': 'metrics' in outcome}
+    
+    def _prepare_batch(self, image_files: List, executor, background_preset: str, listing_id: Optional[str],
+                       dealer_id: Optional[str], dedupe: bool) -> Dict:
+        """
+        Validate a batch and build its pipeline tasks - {'error'} or {'tasks', 'identities',
+        'errors', 'duplicates', 'previously_seen'}
+        """
+        # Validate input
+        if not image_files:
+            return {
+                'success': False,
+                'error': 'No images provided. Please upload at least 2 images.'
+            }
+        
+        if len(image_files) < 2:
+            return {
+                'success': False,
+                'error': f'Need at least 2 images. You uploaded {len(image_files)} image(s).'
+            }
+        
+        if len(image_files) > 25:
+            return {
+                'success': False,
+                'error': 'Maximum 25 images allowed. Please reduce your selection.'
+            }
+        
+        # Validate headers only (Image.open is lazy) - pixels are decoded in the pipeline
+        images = []
+        errors = []
+        
+        for idx, img_file in enumerate(image_files):
+            try:
+                img = Image.open(img_file)
+                
+                # Validate dimensions
+                if img.size[0] < 200 or img.size[1] < 200:
+                    errors.append(f"Image {idx+1}: Too small (minimum 200×200px)")
+                    continue
+                
+                if img.size[0] > 10000 or img.size[1] > 10000:
+                    errors.append(f"Image {idx+1}: Too large (maximum 10000×10000px)")
+                    continue
+                
+                images.append((idx, img_file, img))
+            
+            except IOError:
+                errors.append(f"Image {idx+1}: Invalid format (JPG, PNG, GIF, WebP)")
+            except Exception as e:
+                errors.append(f"Image {idx+1}: {str(e)}")
+        
+        if len(images) < 2:
+            error_msg = "Not enough valid images. "
+            if errors:
+                error_msg += " | ".join(errors)
+            return {
+                'success': False,
+                'error': error_msg
+            }
+        
+        # Hash every upload's bytes (store key) and fingerprint it from a tiny thumbnail
+        duplicates, previously_seen = [], []
+        identities = [{'source': None, 'fingerprint': None}] * len(images)
+        if dedupe or self.image_store is not None:
+            identities = list(executor.map(lambda item: self._identify_one(*item, fingerprint=dedupe),
+                                           images))
+        if dedupe:
+            # Drop repeats before the heavy work
+            images, identities, duplicates, previously_seen = self._collapse_duplicates(
+                images, identities, dealer_id, listing_id)
+            errors.extend(f"Image {dup['image']}: Duplicate of image {dup['duplicate_of']} - skipped"
+                          for dup in duplicates)
+            if len(images) < 2:
+                return {
+                    'success': False,
+                    'error': "Not enough distinct images. " + " | ".join(errors)
+                }
+        
+        # One task per photo: decode -> enhance -> background -> resize -> encode
+        # Position 0 (first valid photo) becomes the 1200×630 cover
+        tasks = [(position, idx, img, background_preset, listing_id, identity['source'])
+                 for position, ((idx, _, img), identity) in enumerate(zip(images, identities))]
+        return {'tasks': tasks, 'identities': identities, 'errors': errors,
+                'duplicates': duplicates, 'previously_seen': previously_seen}
+    
+    def _record_outcome(self, outcome: Dict, identity: Dict, metrics: Dict, background_preset: str,
+                        listing_id: Optional[str], dealer_id: Optional[str]):
+        """Keep a freshly processed photo in the image store and the dealer's history"""
+        if outcome.get('store_key'):
+            self.image_store.put(outcome['store_key'], outcome['bytes'], ext=outcome['ext'], metrics=metrics,
+                                 source=identity['source'], fingerprint=identity['fingerprint'],
+                                 preset=background_preset, version=self.PIPELINE_VERSION)
+        if dealer_id is not None and identity['fingerprint'] is not None:
+            self._dealer_history(dealer_id).add(identity['fingerprint'], listing_id)
+    
+    def _identify_one(self, idx: int, source, img: Image.Image, fingerprint: bool = True) -> Dict:
+        """
+        {'source': SHA-256 of the upload, 'fingerprint': its dHash} - None where unavailable
+        A fingerprint already recorded in the image store is reused instead of decoding.
+        """
+        identity = {'source': None, 'fingerprint': None}
+        try:
+            identity['source'] = hash_source(source)
+            if fingerprint:
+                if self.image_store is not None:
+                    identity['fingerprint'] = self.image_store.fingerprint(identity['source'])
+                if identity['fingerprint'] is None:
+                    with self.memory_budget.reserve(self.estimate_fingerprint_memory(img)):
+                        identity['fingerprint'] = fingerprint_upload(source)
+        except Exception as e:
+            print(f"Error fingerprinting image {idx+1}: {e}")
+        return identity
+    
+    def estimate_fingerprint_memory(self, img: Image.Image) -> int:
+        """JPEGs hash from a 1/8-scale greyscale decode; other formats decode in full"""
+        if img.format == 'JPEG':
+            return -(-img.width // 8) * -(-img.height // 8)
+        return 4 * img.width * img.height
+    
+    def _dealer_history(self, dealer_id: str) -> HashIndex:
+        with self._history_lock:
+            if dealer_id not in self.photo_history:
+                self.photo_history[dealer_id] = HashIndex(radius=self.DUPLICATE_DISTANCE)
+            return self.photo_history[dealer_id]
+    
+    def _collapse_duplicates(self, images: List, identities: List[Dict], dealer_id: Optional[str],
+                             listing_id: Optional[str]) -> Tuple[List, List[Dict], List[Dict], List[Dict]]:
+        """
+        Keep the first upload of every near-identical group
+        Returns the kept images and their identities, the dropped duplicates and the kept
+        photos the dealer already used in another listing.
+        """
+        batch = HashIndex(radius=self.DUPLICATE_DISTANCE)
+        history = self.photo_history.get(dealer_id) if dealer_id is not None else None
+        kept, kept_identities, duplicates, previously_seen = [], [], [], []
+        for (idx, source, img), identity in zip(images, identities):
+            fingerprint = identity['fingerprint']
+            if fingerprint is None:
+                kept.append((idx, source, img))
+                kept_identities.append(identity)
+                continue
+            
+            match = batch.nearest(fingerprint)
+            if match is not None:
+                distance, _, original_idx = match
+                duplicates.append({'image': idx + 1, 'duplicate_of': original_idx + 1, 'distance': distance})
+                img.close()
+                continue
+            batch.add(fingerprint, idx)
+            kept.append((idx, source, img))
+            kept_identities.append(identity)
+            
+            if history is not None:
+                for distance, _, seen_listing in history.search(fingerprint):
+                    if listing_id is None or seen_listing != listing_id:
+                        previously_seen.append({'image': idx + 1, 'listing_id': seen_listing, 'distance': distance})
+                        break
+        return kept, kept_identities, duplicates, previously_seen
+    
+    def output_size(self, position: int) -> Tuple[int, int]:
+        """Final post size for a photo at this position"""
+        return self.COVER_SIZE if position == 0 else self.POST_SIZE
+    
+    def decode_for_output(self, img: Image.Image, position: int, background_preset: str = 'none') -> Image.Image:
+        """
+        Decode a lazily opened upload at the resolution the post actually needs
+        The photo ends up fitted into output_size (shrunk a further 3.5x when it sits on a
+        background), so decoding a 12 MP phone shot at full size only to thumbnail it at
+        the end wastes CPU and ~50x the memory. JPEGs are scaled in the DCT domain by
+        draft() (1/2, 1/4, 1/8 - never below the request); other formats are reduce()d
+        by an integer factor right after decoding.
+        """
+        return self._decode_to(img, self._decode_target(img, position, background_preset))
+    
+    def _decode_to(self, img: Image.Image, needed: Optional[Tuple[int, int]]) -> Image.Image:
+        """Decode as RGB, no smaller than `needed` (None = full size) - draft() for JPEG, reduce() otherwise"""
+        if needed is None:
+            return img.convert('RGB')
+        
+        if img.format == 'JPEG':
+            img.draft('RGB', needed)
+        image = img.convert('RGB')
+        factor = min(image.width // needed[0], image.height // needed[1])
+        if factor >= 2:
+            image = image.reduce(factor)
+        return image
+    
+    def _decode_target(self, img: Image.Image, position: int, background_preset: str) -> Optional[Tuple[int, int]]:
+        """Smallest size decode_for_output may reduce the photo to, or None to decode as-is"""
+        if not self.draft_decode:
+            return None
+        
+        target_width, target_height = self.output_size(position)
+        if background_preset and background_preset != 'none':
+            target_width /= self.BACKGROUND_SCALE
+            target_height /= self.BACKGROUND_SCALE
+        # Size of the photo once fitted into the target box, with headroom for filters/resampling
+        fit = min(target_width / img.width, target_height / img.height) * self.DECODE_OVERSAMPLE
+        if fit >= 1:
+            return None
+        return max(int(img.width * fit), 1), max(int(img.height * fit), 1)
+    
+    def estimate_task_memory(self, img: Image.Image, position: int, background_preset: str = 'none') -> int:
+        """
+        Peak bytes _process_one_image will hold for this upload, from its header alone
+        Pillow keeps RGB as 4 bytes per pixel.
+        """
+        full_pixels = img.width * img.height
+        needed = self._decode_target(img, position, background_preset)
+        if needed is None:
+            decode_pixels = working_pixels = full_pixels
+        elif img.format == 'JPEG':
+            # draft() picks the largest 1/1..1/8 scale that stays >= needed
+            factor = min(img.width // needed[0], img.height // needed[1])
+            scale = next(s for s in (8, 4, 2, 1) if factor >= s)
+            decode_pixels = working_pixels = -(-img.width // scale) * -(-img.height // scale)
+        else:
+            factor = max(min(img.width // needed[0], img.height // needed[1]), 1)
+            decode_pixels, working_pixels = full_pixels, (img.width // factor) * (img.height // factor)
+        
+        output_width, output_height = self.output_size(position)
+        nbytes = 4 * (decode_pixels + self.PIPELINE_COPIES * working_pixels + 2 * output_width * output_height)
+        if background_preset and background_preset != 'none' and not self.frugal_compositing:
+            # RGBA canvas + RGBA photo copy on the 3.5x canvas
+            nbytes += 4 * 2 * int(working_pixels * self.BACKGROUND_SCALE ** 2)
+        return nbytes
+    
+    def store_key(self, source: str, position: int, background_preset: str,
+                  listing_id: Optional[str] = None) -> str:
+        """Image store key - everything that decides a processed photo's bytes"""
+        seed = texture_seed(background_preset, listing_id) if background_preset not in (None, 'none') else ''
+        return ImageStore.make_key(self.PIPELINE_VERSION, source, background_preset or 'none', seed,
+                                   self.output_size(position), self.draft_decode, self.frugal_compositing,
+                                   self.output_format, self.target_bytes, self.target_ssim)
+    
+    def _process_one_image(self, position: int, idx: int, img: Image.Image, background_preset: str,
+                           listing_id: Optional[str], source: Optional[str] = None) -> Dict:
+        """
+        Full pipeline for one photo, run on the thread pool
+        Each stage rebinds `image`, so the previous intermediate is freed as soon as
+        the next one exists. The estimated peak is reserved against the process-wide
+        memory budget first, so concurrent batches queue instead of exhausting RAM.
+        A photo already in the image store is returned from disk without decoding.
+        """
+        try:
+            key = None
+            if self.image_store is not None and source:
+                key = self.store_key(source, position, background_preset, listing_id)
+                stored = self.image_store.get(key)
+                if stored is not None:
+                    img.close()
+                    return {'bytes': memoryview(stored[0]), 'metrics': stored[1]['metrics'], 'encode_ms': 0.0}
+            with self.memory_budget.reserve(self.estimate_task_memory(img, position, background_preset)):
+                image = self.decode_for_output(img, position, background_preset)
+                img.close()
+                del img
+                proxy = self.quality_proxy(image)
+                image = self.enhance_image_professional(image)
+                output_size = self.output_size(position) if self.frugal_compositing else None
+                image = self.apply_background_to_image(image, background_preset, listing_id, output_size)
+                image = self.optimize_for_facebook_professional(image, position)
+                encoded = self.encoder.encode(image, self.output_format, target_bytes=self.target_bytes,
+                                              target_ssim=self.target_ssim, cache_key=(background_preset, image.size))
+                del image
+            return {'bytes': encoded['data'], 'proxy': proxy, 'store_key': key, 'ext': encoded['ext'],
+                    'encode_ms': encoded['encode_ms']}
+        except MemoryError:
+            return {'error': f"Image {idx+1}: Too large to process"}
+        except Exception as e:
+            return {'error': f"Image {idx+1}: {str(e)}"}
+    
     def enhance_image_professional(self, image: Image.Image) -> Image.Image:
-        """Professional enhancement for maximum eye appeal"""
+        """Professional enhancement for maximum eye appeal - fused LUT / matrix / kernel passes"""
         try:
-            # Contrast
-            enhancer = ImageEnhance.Contrast(image)
-            image = enhancer.enhance(self.enhancement_config['contrast'])
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            config = self.enhancement_config
             
-            # Brightness
-            enhancer = ImageEnhance.Brightness(image)
-            image = enhancer.enhance(self.enhancement_config['brightness'])
+            # Contrast pivots on the mean grey level, as ImageEnhance.Contrast does
+            channel_means = ImageStat.Stat(image).mean
+            mean = int(sum(m * w for m, w in zip(channel_means, _LUMA_WEIGHTS)) + 0.5)
             
-            # Saturation
-            enhancer = ImageEnhance.Color(image)
-            image = enhancer.enhance(self.enhancement_config['saturation'])
+            # Contrast + Brightness
+            image = image.point(contrast_brightness_lut(mean, config['contrast'], config['brightness']) * 3)
             
-            # Sharpness
-            enhancer = ImageEnhance.Sharpness(image)
-            image = enhancer.enhance(self.enhancement_config['sharpness'])
+            # Saturation
+            image = image.convert('RGB', saturation_matrix(config['saturation']))
             
-            # Detail
-            image = image.filter(ImageFilter.DETAIL)
+            # Sharpness + Detail
+            image = image.filter(sharpen_detail_kernel(config['sharpness']))
             
             return image
         
@@ -858,15 +1962,176 @@ class CarImageProcessor:
             print(f"Error in professional enhancement: {e}")
             return image
     
+    def _enhance_image_reference(self, image: Image.Image) -> Image.Image:
+        """Original ImageEnhance chain - reference for tests and benchmarks"""
+        image = ImageEnhance.Contrast(image).enhance(self.enhancement_config['contrast'])
+        image = ImageEnhance.Brightness(image).enhance(self.enhancement_config['brightness'])
+        image = ImageEnhance.Color(image).enhance(self.enhancement_config['saturation'])
+        image = ImageEnhance.Sharpness(image).enhance(self.enhancement_config['sharpness'])
+        return image.filter(ImageFilter.DETAIL)
+    
+    # ==================== RENDITIONS ====================
+    
+    def render_renditions(self, image_file, background_preset: str = 'none', listing_id: Optional[str] = None,
+                          platforms: Optional[List[str]] = None) -> Dict:
+        """
+        Every platform rendition of one photo from a single decode + enhance
+        The upload is decoded once at the resolution the most demanding rendition needs,
+        enhanced and composed into one master, and the renditions are cut from a resize
+        pyramid over that master (see build_renditions). With a background the scene is
+        centre-cropped to each aspect ratio; without one the photo is letterboxed like
+        optimize_for_facebook_professional.
+        Returns {'success', 'renditions': {name: {'data', 'size', 'mime', 'bytes', 'encode_ms'}},
+                 'master_size', 'timings_ms'}
+        """
+        try:
+            platforms = platforms or list(self.RENDITIONS)
+            unknown = [name for name in platforms if name not in self.RENDITIONS]
+            if unknown:
+                return {
+                    'success': False,
+                    'error': f"Unknown rendition(s): {', '.join(unknown)} (choose from {', '.join(self.RENDITIONS)})"
+                }
+            sizes = {name: self.RENDITIONS[name] for name in platforms}
+            with_background = bool(background_preset) and background_preset != 'none'
+            
+            img = Image.open(image_file)
+            width, height = img.size
+            # Scene = background canvas (3.5x the photo) or the photo itself; find the largest
+            # scale any rendition needs it at - cover scale for crops, fit scale for letterboxes
+            if with_background:
+                scene = (int(width * self.BACKGROUND_SCALE), int(height * self.BACKGROUND_SCALE))
+                scale = max(max(w / scene[0], h / scene[1]) for w, h in sizes.values())
+            else:
+                scene = (width, height)
+                scale = max(min(w / scene[0], h / scene[1]) for w, h in sizes.values())
+            scale = min(scale, 1.0)
+            needed = None
+            if self.draft_decode and scale * self.DECODE_OVERSAMPLE < 1:
+                needed = (max(int(width * scale * self.DECODE_OVERSAMPLE), 1),
+                          max(int(height * scale * self.DECODE_OVERSAMPLE), 1))
+            master_size = (max(round(scene[0] * scale), 1), max(round(scene[1] * scale), 1))
+            
+            nbytes = 4 * (width * height + self.PIPELINE_COPIES * (needed[0] * needed[1] if needed else width * height)
+                          + 2 * master_size[0] * master_size[1] + sum(w * h for w, h in sizes.values()))
+            timings = {}
+            clock = time.perf_counter()
+            
+            def lap(name):
+                nonlocal clock
+                now = time.perf_counter()
+                timings[name] = round((now - clock) * 1000, 2)
+                clock = now
+            
+            with self.memory_budget.reserve(nbytes):
+                image = self._decode_to(img, needed)
+                img.close()
+                if needed and image.width > needed[0]:
+                    # draft()/reduce() only scale by whole factors - area-average the rest so
+                    # enhancement runs on exactly what the pyramid needs
+                    image = image.resize(needed, Image.Resampling.BOX)
+                lap('decode')
+                image = self.enhance_image_professional(image)
+                lap('enhance')
+                if with_background:
+                    image = self._compose_at_output_size(image, scene, background_preset, listing_id, master_size)
+                lap('compose')
+                images = self.build_renditions(image, sizes, fit='crop' if with_background else 'pad')
+                master_size = image.size
+                del image
+                lap('pyramid')
+                renditions = {}
+                for name, rendition in images.items():
+                    encoded = self.encoder.encode(rendition, self.output_format, target_bytes=self.target_bytes,
+                                                  target_ssim=self.target_ssim,
+                                                  cache_key=(background_preset, rendition.size))
+                    renditions[name] = {'data': encoded['data'], 'size': rendition.size, 'mime': encoded['mime'],
+                                        'bytes': encoded['bytes'], 'encode_ms': encoded['encode_ms']}
+                del images
+                lap('encode')
+            
+            return {
+                'success': True,
+                'renditions': renditions,
+                'master_size': master_size,
+                'timings_ms': timings
+            }
+        
+        except MemoryError:
+            return {
+                'success': False,
+                'error': 'Processing failed: Not enough memory. Try a smaller image.'
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Rendition error: {str(e)}'
+            }
+    
+    def build_renditions(self, master: Image.Image, sizes: Dict[str, Tuple[int, int]],
+                         fit: str = 'pad') -> Dict[str, Image.Image]:
+        """
+        Cut every rendition out of one master through a 2x resize pyramid
+        Level k is level k-1 reduce()d by 2 (a cheap box filter), built only as deep as the
+        smallest rendition needs. Each rendition is resampled (Lanczos) from the smallest
+        level that is still at least its size, so no resize ever reads the full master for
+        a small output. fit='crop' centre-crops to the rendition's aspect ratio, 'pad'
+        letterboxes onto a light grey canvas. Renditions of the same size share one image.
+        """
+        plans = {}
+        for name, (target_width, target_height) in sizes.items():
+            if fit == 'crop':
+                scale = max(target_width / master.width, target_height / master.height)
+                crop_width, crop_height = target_width / scale, target_height / scale
+                box = ((master.width - crop_width) / 2, (master.height - crop_height) / 2,
+                       (master.width + crop_width) / 2, (master.height + crop_height) / 2)
+                resized = (target_width, target_height)
+            else:
+                scale = min(target_width / master.width, target_height / master.height)
+                box = (0, 0, master.width, master.height)
+                resized = thumbnail_size(master.size, (target_width, target_height))
+            plans.setdefault((target_width, target_height), (scale, box, resized, []))[3].append(name)
+        
+        levels = [master]
+        renditions = {}
+        for (target_width, target_height), (scale, box, resized, names) in sorted(
+                plans.items(), key=lambda item: -item[1][0]):
+            needed_width, needed_height = (box[2] - box[0]) * scale, (box[3] - box[1]) * scale
+            level = 0
+            while True:
+                if level + 1 == len(levels):
+                    if min(levels[level].size) < 2:
+                        break
+                    next_size = (levels[level].width // 2, levels[level].height // 2)
+                else:
+                    next_size = levels[level + 1].size
+                ratio = next_size[0] / master.width, next_size[1] / master.height
+                if (box[2] - box[0]) * ratio[0] < needed_width or (box[3] - box[1]) * ratio[1] < needed_height:
+                    break
+                if level + 1 == len(levels):
+                    levels.append(levels[level].reduce(2))
+                level += 1
+            
+            source = levels[level]
+            ratio = source.width / master.width, source.height / master.height
+            source_box = (box[0] * ratio[0], box[1] * ratio[1], box[2] * ratio[0], box[3] * ratio[1])
+            if (source_box[2] - source_box[0], source_box[3] - source_box[1]) == resized and all(
+                    float(edge).is_integer() for edge in source_box):
+                image = source.crop(tuple(int(edge) for edge in source_box))  # 1:1 - nothing to resample
+            else:
+                image = source.resize(resized, Image.Resampling.LANCZOS, box=source_box)
+            if resized != (target_width, target_height):
+                canvas = Image.new('RGB', (target_width, target_height), color=(248, 248, 248))
+                canvas.paste(image, ((target_width - image.width) // 2, (target_height - image.height) // 2))
+                image = canvas
+            for name in names:
+                renditions[name] = image
+        return {name: renditions[name] for name in sizes}
+    
     def optimize_for_facebook_professional(self, image: Image.Image, position: int) -> Image.Image:
         """Optimize for Facebook dimensions"""
         try:
-            if position == 0:
-                target_width = 1200
-                target_height = 630
-            else:
-                target_width = 1080
-                target_height = 1080
+            target_width, target_height = self.output_size(position)
             
             img_copy = image.copy()
             img_copy.thumbnail((target_width, target_height), Image.Resampling.LANCZOS)
@@ -877,8 +2142,6 @@ class CarImageProcessor:
             y = (target_height - img_copy.height) // 2
             canvas.paste(img_copy, (x, y))
             
-            canvas = self.add_elegant_border(canvas)
-            
             return canvas
         
         except Exception as e:
@@ -898,11 +2161,25 @@ class CarImageProcessor:
             return image
     
     def save_for_web(self, image: Image.Image, filename: str) -> str:
-        """Save optimized for web"""
+        """
+        Save optimized for web - into the image store when there is one
+        Keyed on the pixels (and pipeline version), looked up before encoding, so an
+        unchanged image is never re-encoded and an edited one never gets a stale file
+        """
         try:
             if image.mode != 'RGB':
                 image = image.convert('RGB')
             
+            if self.image_store is not None:
+                key = ImageStore.make_key('web', self.PIPELINE_VERSION, image.size,
+                                          hashlib.sha256(image.tobytes()).hexdigest())
+                path = self.image_store.path(key)
+                if path is not None:
+                    return path
+                buffer = io.BytesIO()
+                image.save(buffer, 'JPEG', quality=88, optimize=True, progressive=True)
+                return self.image_store.put(key, buffer.getvalue(), filename=filename)
+            
             filepath = self.output_dir / filename
             image.save(
                 filepath,
@@ -0,0 +1,204 @@
+"""
+Image Store - content-addressed store for processed photos
+The same upload processed with the same preset and pipeline version always
+produces the same post image, so the encoded bytes are kept on disk under a
+hash of those inputs and re-processing becomes a file read.
+
+Layout:  <root>/ab/cd/<key>.<ext>    encoded image
+         <root>/ab/cd/<key>.json     metadata sidecar (size, format, source hash, metrics...)
+Entries are evicted least-recently-used once the store exceeds max_bytes.
+The default root is in the user cache directory (see cache_dir), never the checkout.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+def cache_dir(name: str) -> str:
+    """Per-user cache directory for generated data: $XDG_CACHE_HOME/carbot/<name> (default ~/.cache)"""
+    base = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'carbot', name)
+
+
+def hash_source(source) -> str:
+    """SHA-256 of an upload's bytes (path or file object - hashed from the start, position restored)"""
+    digest = hashlib.sha256()
+    if hasattr(source, 'read'):
+        position = source.tell()
+        source.seek(0)
+        try:
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                digest.update(chunk)
+        finally:
+            source.seek(position)
+    else:
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes):
+    """Write through a temp file + rename so readers never see a partial file"""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class ImageStore:
+    """Sharded on-disk store of encoded images keyed by content hash, with LRU size limit"""
+
+    def __init__(self, root: Optional[str] = None, max_bytes: int = 1024 * 1024 * 1024):
+        self.root = Path(root or cache_dir('image-store'))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()  # key -> metadata, least recent first
+        self._fingerprints: Dict[str, int] = {}  # source hash -> perceptual hash
+        self._source_entries: Dict[str, int] = {}  # source hash -> entries holding its fingerprint
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        self._scan()
+
+    @classmethod
+    def from_env(cls) -> 'ImageStore':
+        """Configure from CARBOT_IMAGE_STORE (directory, default cache_dir('image-store')) / CARBOT_IMAGE_STORE_MB (default 1024)"""
+        return cls(root=os.getenv('CARBOT_IMAGE_STORE') or None,
+                   max_bytes=int(os.getenv('CARBOT_IMAGE_STORE_MB', '1024')) * 1024 * 1024)
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Stable key for any JSON-serialisable inputs (source hash, preset, version, ...)"""
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _paths(self, key: str, ext: str) -> Tuple[Path, Path]:
+        shard = self.root / key[:2] / key[2:4]
+        return shard / f"{key}.{ext}", shard / f"{key}.json"
+
+    # ==================== INDEX ====================
+
+    def _scan(self):
+        """Rebuild the in-memory index from the sidecars, oldest access first"""
+        found = []
+        for sidecar in self.root.glob('*/*/*.json'):
+            try:
+                metadata = json.loads(sidecar.read_text(encoding='utf-8'))
+                data_path = self._paths(metadata['key'], metadata['ext'])[0]
+                found.append((data_path.stat().st_mtime, metadata))
+            except (OSError, ValueError, KeyError):
+                sidecar.unlink(missing_ok=True)  # orphaned or unreadable
+        for _, metadata in sorted(found, key=lambda item: item[0]):
+            self._index(metadata)
+        for tmp in self.root.glob('*/*/*.tmp'):
+            tmp.unlink(missing_ok=True)  # interrupted writes
+
+    def _index(self, metadata: Dict):
+        self._entries[metadata['key']] = metadata
+        self._bytes += metadata['size']
+        if metadata.get('source') and metadata.get('fingerprint') is not None:
+            self._fingerprints[metadata['source']] = metadata['fingerprint']
+            self._source_entries[metadata['source']] = self._source_entries.get(metadata['source'], 0) + 1
+
+    def _evict(self, key: str):
+        metadata = self._entries.pop(key)
+        self._bytes -= metadata['size']
+        source = metadata.get('source')
+        if source in self._source_entries and metadata.get('fingerprint') is not None:
+            self._source_entries[source] -= 1
+            if not self._source_entries[source]:
+                del self._source_entries[source]
+                self._fingerprints.pop(source, None)
+        for path in self._paths(key, metadata['ext']):
+            path.unlink(missing_ok=True)
+        self.counters['evictions'] += 1
+
+    # ==================== PUBLIC API ====================
+
+    def get(self, key: str) -> Optional[Tuple[bytes, Dict]]:
+        """(encoded bytes, metadata) for a stored entry, or None"""
+        with self._lock:
+            metadata = self._entries.get(key)
+        if metadata is not None:
+            # Disk I/O outside the lock - concurrent hits don't queue behind each other
+            data_path = self._paths(key, metadata['ext'])[0]
+            try:
+                data = data_path.read_bytes()
+                os.utime(data_path)  # LRU order survives restarts
+            except OSError:
+                data = None
+        with self._lock:
+            if metadata is not None and data is None and self._entries.get(key) is metadata:
+                self._evict(key)  # removed behind our back
+            if metadata is None or data is None:
+                self.counters['misses'] += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return data, metadata
+
+    def path(self, key: str) -> Optional[str]:
+        """File path of a stored entry (counted as a use), or None"""
+        with self._lock:
+            metadata = self._entries.get(key)
+            if metadata is None:
+                return None
+            self._entries.move_to_end(key)
+            return str(self._paths(key, metadata['ext'])[0])
+
+    def put(self, key: str, data: bytes, ext: str = 'jpg', **metadata) -> str:
+        """Store encoded bytes with metadata; returns the file path"""
+        metadata = dict(metadata, key=key, ext=ext, size=len(data), created=time.time())
+        data_path, sidecar = self._paths(key, ext)
+        with self._lock:
+            if key in self._entries:
+                self._evict(key)
+                self.counters['evictions'] -= 1  # replaced, not evicted
+            data_path.parent.mkdir(parents=True, exist_ok=True)
+            _write_atomic(data_path, data)
+            _write_atomic(sidecar, json.dumps(metadata).encode('utf-8'))
+            self._index(metadata)
+            self.counters['writes'] += 1
+            self._collect(self.max_bytes)
+        return str(data_path)
+
+    def fingerprint(self, source: str) -> Optional[int]:
+        """Perceptual hash recorded for a source hash, if any entry has one"""
+        with self._lock:
+            return self._fingerprints.get(source)
+
+    def _collect(self, max_bytes: int) -> int:
+        evicted = 0
+        while self._entries and self._bytes > max_bytes:
+            self._evict(next(iter(self._entries)))
+            evicted += 1
+        return evicted
+
+    def collect(self, max_bytes: Optional[int] = None) -> int:
+        """Evict least-recently-used entries until the store fits in max_bytes; returns the count"""
+        with self._lock:
+            return self._collect(self.max_bytes if max_bytes is None else max_bytes)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._evict(key)
+            self._fingerprints.clear()
+            self._source_entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            stats = dict(self.counters)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['max_bytes'] = self.max_bytes
+            stats['hit_rate'] = round(self.counters['hits'] / lookups, 4) if lookups else 0.0
+            return stats
@@ -0,0 +1,172 @@
+"""
+Post Cache - content-hash cache for CarPostingBot.generate_full_post results
+Dealers repost the same description every few days; a normalised-description
+hash lets those reposts skip parsing and generation entirely.
+
+Tiers:
+- memory: bounded LRU (OrderedDict)
+- disk:   optional SQLite file that survives restarts, capped at max_disk_entries
+          rows and disk_ttl_seconds of age (both pruned on insert)
+Entries are keyed on the bot's content_version, so changing the parser,
+catalogue, templates or scripts invalidates them automatically.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+_LINE_END_RE = re.compile(r'[ \t]+(?=\n)|\r')
+
+
+def normalize_description(description: str) -> str:
+    """Canonical form used for hashing AND generation: LF line endings, no trailing/edge whitespace"""
+    return _LINE_END_RE.sub('', description.replace('\r\n', '\n')).strip()
+
+
+class PostCache:
+    """Two-tier (LRU memory + optional SQLite) cache of generated posts"""
+
+    def __init__(self, max_entries: int = 1024, db_path: Optional[str] = None,
+                 max_disk_entries: int = 100000, disk_ttl_seconds: Optional[float] = 30 * 24 * 3600):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.max_disk_entries = max_disk_entries
+        self.disk_ttl_seconds = disk_ttl_seconds
+        self._memory: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_version = None
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'invalidated': 0, 'pruned': 0}
+
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS posts ('
+                'key TEXT PRIMARY KEY, version TEXT NOT NULL, result TEXT NOT NULL, created REAL NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS posts_created ON posts (created)')
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls) -> 'PostCache':
+        """
+        Configure from CARBOT_CACHE_SIZE / CARBOT_CACHE_DB (disk tier off when unset) /
+        CARBOT_CACHE_DB_ROWS (default 100000) / CARBOT_CACHE_DB_TTL_DAYS (default 30, 0 = no expiry)
+        """
+        ttl_days = float(os.getenv('CARBOT_CACHE_DB_TTL_DAYS', '30'))
+        return cls(max_entries=int(os.getenv('CARBOT_CACHE_SIZE', '1024')),
+                   db_path=os.getenv('CARBOT_CACHE_DB') or None,
+                   max_disk_entries=int(os.getenv('CARBOT_CACHE_DB_ROWS', '100000')),
+                   disk_ttl_seconds=ttl_days * 24 * 3600 if ttl_days > 0 else None)
+
+    @staticmethod
+    def make_key(version: str, normalized: str, inline_scripts: bool = True) -> str:
+        shape = '' if inline_scripts else '\0scripts-by-reference'
+        return hashlib.sha256(f"{version}\0{normalized}{shape}".encode('utf-8')).hexdigest()
+
+    # ==================== TIERS ====================
+
+    def _invalidate_disk(self, version: str):
+        """Drop disk entries written by another parser/template version (once per version)"""
+        if self._db is None or self._db_version == version:
+            return
+        removed = self._db.execute('DELETE FROM posts WHERE version != ?', (version,)).rowcount
+        self._db.commit()
+        self.counters['invalidated'] += max(removed, 0)
+        self._db_version = version
+
+    def _prune_disk(self):
+        """Drop disk entries past the TTL, then the oldest beyond max_disk_entries"""
+        removed = 0
+        if self.disk_ttl_seconds is not None:
+            removed += self._db.execute('DELETE FROM posts WHERE created < ?',
+                                        (time.time() - self.disk_ttl_seconds,)).rowcount
+        removed += self._db.execute('DELETE FROM posts WHERE key IN '
+                                    '(SELECT key FROM posts ORDER BY created DESC LIMIT -1 OFFSET ?)',
+                                    (self.max_disk_entries,)).rowcount
+        self.counters['pruned'] += max(removed, 0)
+
+    def get(self, key: str, version: str) -> Optional[Dict]:
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.counters['hits'] += 1
+                return result
+
+            if self._db is not None:
+                self._invalidate_disk(version)
+                oldest = 0.0 if self.disk_ttl_seconds is None else time.time() - self.disk_ttl_seconds
+                row = self._db.execute('SELECT result FROM posts WHERE key = ? AND created >= ?',
+                                       (key, oldest)).fetchone()
+                if row:
+                    result = json.loads(row[0])
+                    self._remember(key, result)
+                    self.counters['disk_hits'] += 1
+                    return result
+
+            self.counters['misses'] += 1
+            return None
+
+    def put(self, key: str, version: str, result: Dict):
+        with self._lock:
+            self._remember(key, result)
+            if self._db is not None:
+                self._invalidate_disk(version)
+                self._db.execute('INSERT OR REPLACE INTO posts (key, version, result, created) VALUES (?, ?, ?, ?)',
+                                 (key, version, json.dumps(result, ensure_ascii=False), time.time()))
+                self._prune_disk()
+                self._db.commit()
+
+    def _remember(self, key: str, result: Dict):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    # ==================== PUBLIC API ====================
+
+    def generate(self, bot, description: str, inline_scripts: bool = True) -> Dict:
+        """
+        Cached bot.generate_full_post(description) - keyed on the normalised description
+        Whitespace variants share an entry; the post only differs in car_info['raw_input'],
+        which is set back to the caller's own text on a hit from another variant.
+        Returned dicts are shared between callers - treat them as read-only
+        """
+        version = bot.content_version
+        key = self.make_key(version, normalize_description(description), inline_scripts)
+
+        result = self.get(key, version)
+        if result is None:
+            result = bot.generate_full_post(description, inline_scripts=inline_scripts)
+            self.put(key, version, result)
+        info = result.get('car_info')
+        if info is not None and info.get('raw_input') != description:
+            result = dict(result, car_info=dict(info, raw_input=description))
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM posts')
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['disk_hits'] + self.counters['misses']
+            stats = dict(self.counters)
+            stats['memory_entries'] = len(self._memory)
+            stats['max_entries'] = self.max_entries
+            stats['hit_rate'] = round((lookups - self.counters['misses']) / lookups, 4) if lookups else 0.0
+            if self._db is not None:
+                stats['disk_entries'] = self._db.execute('SELECT COUNT(*) FROM posts').fetchone()[0]
+                stats['max_disk_entries'] = self.max_disk_entries
+            return stats
@@ -459,7 +459,8 @@ def load_bot_modules():
     
     try:
         from image_processor import CarImageProcessor
-        image_processor = CarImageProcessor()
+        from image_store import ImageStore
+        image_processor = CarImageProcessor(image_store=ImageStore.from_env())
     except Exception as e:
         st.error(f'🖼️ Image Processor Error: {str(e)[:50]}')
     
@@ -471,6 +472,17 @@ def load_bot_modules():
     
     return bot, chat_assist, image_processor, social_optimizer
 
+@st.cache_resource
+def load_post_cache():
+    """One post cache per server process, shared across sessions"""
+    from post_cache import PostCache
+    return PostCache.from_env()
+
+@st.cache_resource
+def load_static_scripts(version: str):
+    """Inquiry/delivery scripts, held once per process - posts in session_state only keep the version"""
+    return bot.get_static_scripts() if bot else {}
+
 # Load modules using cache
 bot, chat_assist, image_processor, social_optimizer = load_bot_modules()
 
@@ -550,7 +562,7 @@ with col2:
             with st.spinner('⏳ Processing car information...'):
                 if bot:
                     try:
-                        result = bot.generate_full_post(car_description)
+                        result = load_post_cache().generate(bot, car_description, inline_scripts=False)
                         st.session_state.car_post_result = result
                         
                         # Generate platform-specific content if optimizer is available
@@ -735,7 +747,7 @@ if st.session_state.car_post_result and st.session_state.car_post_result.get('su
     
     elif selected_tab == '💬 Inquiry Script':
         st.subheader('Buyer Inquiry Response Script')
-        inquiry_text = post.get('inquiry_script', '')
+        inquiry_text = load_static_scripts(post.get('scripts_version', '')).get('inquiry_script', '')
         st.markdown(f'<div class="content-box">{inquiry_text}</div>', unsafe_allow_html=True)
         st.text_area('Copy script:', value=inquiry_text, height=300, disabled=True, label_visibility='collapsed')
         col_copy = st.columns([1, 3])[0]
@@ -744,7 +756,7 @@ if st.session_state.car_post_result and st.session_state.car_post_result.get('su
     
     elif selected_tab == '✅ Delivery Script':
         st.subheader('Post-Delivery Social Proof Script')
-        delivery_text = post.get('delivery_script', '')
+        delivery_text = load_static_scripts(post.get('scripts_version', '')).get('delivery_script', '')
         st.markdown(f'<div class="content-box">{delivery_text}</div>', unsafe_allow_html=True)
         st.text_area('Copy script:', value=delivery_text, height=300, disabled=True, label_visibility='collapsed')
         col_copy = st.columns([1, 3])[0]
@@ -0,0 +1,255 @@
+import gzip
+import hashlib
+import io
+import json
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+import app as app_module
+from image_jobs import JobQueue
+from upload_spool import UploadSpool
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv('CARBOT_JOBS_DIR', str(tmp_path / 'jobs'))
+    monkeypatch.setenv('CARBOT_IMAGE_STORE', str(tmp_path / 'store'))
+    monkeypatch.setenv('CARBOT_UPLOAD_DIR', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(app_module, '_job_queue', None)
+    monkeypatch.setattr(app_module, '_upload_spool', None)
+    monkeypatch.setattr(app_module, '_response_cache', None)
+    monkeypatch.setattr(app_module, '_response_compressor', None)
+    monkeypatch.setattr(app_module, '_bot', None)
+    monkeypatch.setattr(app_module, '_image_processor', None)
+    return app_module.app.test_client()
+
+
+def _photo(scene, format='JPEG'):
+    buffer = io.BytesIO()
+    Image.effect_mandelbrot((400, 300), scene, 64).convert('RGB').save(buffer, format)
+    buffer.seek(0)
+    return buffer
+
+
+def test_image_job_runs_in_background_and_serves_results(client):
+    scenes = [(-2.2, -1.2, 1.0, 1.2), (-0.8, -0.2, -0.4, 0.2), (-1.8, -0.1, -1.6, 0.1)]
+    response = client.post('/api/images/jobs', content_type='multipart/form-data', data={
+        'images': [(_photo(scene), f'car{i}.jpg') for i, scene in enumerate(scenes)],
+        'background': 'gradient_blue',
+    })
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    job = app_module.get_job_queue().wait(job_id, timeout=30)
+    assert job['status'] == 'done', job
+    status = client.get(response.get_json()['status_url']).get_json()
+    assert status['job']['progress'] == 1.0
+    images = status['job']['result']['images']
+    assert [image['image'] for image in images] == [1, 2, 3]
+
+    download = client.get(images[0]['url'])
+    assert download.status_code == 200
+    assert Image.open(io.BytesIO(download.data)).size == (1200, 630)
+    assert client.get(f'/api/images/jobs/{job_id}/images/..').status_code == 404
+    assert client.get('/api/images/jobs/not-a-job').status_code == 404
+
+    # Finished jobs expire with their files - polling alone is enough to run the cleanup
+    queue = app_module.get_job_queue()
+    queue.ttl_seconds, queue._last_cleanup = 0, 0.0
+    assert client.get(response.get_json()['status_url']).status_code == 404
+    assert queue.stats()['expired'] == 1 and not (queue.root / job_id).exists()
+
+
+def test_job_queue_defaults_outside_the_checkout(tmp_path, monkeypatch):
+    monkeypatch.delenv('CARBOT_JOBS_DIR', raising=False)
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    queue = JobQueue.from_env(app_module.CarImageProcessor)
+    assert queue.root == tmp_path / 'carbot' / 'jobs' and (queue.root / 'jobs.db').is_file()
+
+
+def test_image_job_rejects_bad_batches_up_front(client):
+    response = client.post('/api/images/jobs', content_type='multipart/form-data',
+                           data={'images': [(_photo((-2.2, -1.2, 1.0, 1.2)), 'car.jpg')]})
+    assert response.status_code == 400
+    response = client.post('/api/images/jobs', content_type='multipart/form-data', data={
+        'images': [(_photo((-2.2, -1.2, 1.0, 1.2)), 'car.jpg'), (io.BytesIO(b'x'), 'notes.txt')]})
+    assert response.status_code == 400
+    assert client.get('/api/image-backgrounds').get_json()['success']
+
+
+class _CountingStream(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def test_upload_spool_rejects_from_the_first_chunk(tmp_path):
+    spool = UploadSpool(tmp_path, max_bytes=1024 * 1024)
+    not_an_image = _CountingStream(b'%PDF-1.7' + bytes(900 * 1024))
+    assert spool.spool(not_an_image)['status'] == 415
+    assert not_an_image.bytes_read <= 64 * 1024
+
+    tiny = io.BytesIO()
+    Image.new('RGB', (100, 100)).save(tiny, 'PNG')
+    assert 'Too small' in spool.spool(io.BytesIO(tiny.getvalue()))['error']
+    assert spool.spool(io.BytesIO(b'x'), content_length=2 * 1024 * 1024)['status'] == 413
+    assert spool.spool(_CountingStream(_photo((-2.2, -1.2, 1.0, 1.2)).getvalue() + bytes(1024 * 1024)))['status'] == 413
+
+    for format in ('JPEG', 'PNG', 'GIF', 'WEBP'):
+        result = spool.spool(_photo((-0.8, -0.2, -0.4, 0.2), format))
+        assert result['success'] and result['size'] == [400, 300], (format, result)
+    assert list(tmp_path.joinpath('partial').iterdir()) == []
+
+
+def test_resumable_pieces_are_checked_against_the_declared_upload(tmp_path):
+    spool = UploadSpool(tmp_path)
+    data = _photo((-2.2, -1.2, 1.0, 1.2)).getvalue()
+    upload_id, half = spool.start(len(data))['upload_id'], len(data) // 2
+    assert spool.append(upload_id, io.BytesIO(data[:half]), 0, len(data))['offset'] == half
+    assert spool.append(upload_id, io.BytesIO(data[half:] + b'x'), half, len(data) + 1)['status'] == 400
+    assert spool.append(upload_id, io.BytesIO(data[half:]), half, len(data))['complete']
+    assert spool.stats()['bytes'] == len(data)
+
+    # Two copies of the same piece racing: one is written, the other sees the new offset
+    upload_id = spool.start(len(data))['upload_id']
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(lambda _: spool.append(upload_id, io.BytesIO(data[:half]), 0, len(data)), range(2)))
+    assert sorted(result.get('status', 200) for result in results) == [200, 409]
+    assert spool.offset(upload_id) == half
+
+
+def test_streamed_and_resumed_uploads_feed_a_job(client):
+    data = _photo((-2.2, -1.2, 1.0, 1.2)).getvalue()
+    first = client.post('/api/uploads', data=data, content_type='image/jpeg').get_json()
+    assert first['success'] and not first['duplicate']
+    assert client.post('/api/uploads', data=data, content_type='image/jpeg').get_json()['duplicate']
+
+    # Resumable: a dropped piece is re-sent from the offset the server reports
+    data = _photo((-0.8, -0.2, -0.4, 0.2)).getvalue()
+    session = client.post('/api/uploads/resumable', headers={'Upload-Length': str(len(data))}).get_json()
+    url, half = session['upload_url'], len(data) // 2
+    assert client.put(url, data=data[:half], headers={'Content-Range': f'bytes 0-{half - 1}/{len(data)}'}).status_code == 200
+    retry = client.put(url, data=data[10:], headers={'Content-Range': f'bytes 10-{len(data) - 1}/{len(data)}'})
+    assert retry.status_code == 409 and retry.get_json()['offset'] == half
+    assert client.get(url).get_json()['offset'] == half
+    second = client.put(url, data=data[half:], headers={'Content-Range': f'bytes {half}-{len(data) - 1}/{len(data)}'})
+    assert second.status_code == 201
+    assert second.get_json()['upload_id'] == hashlib.sha256(data).hexdigest()
+
+    response = client.post('/api/images/jobs', json={
+        'uploads': [first['upload_id'], second.get_json()['upload_id']], 'background': 'gradient_blue'})
+    assert response.status_code == 202
+    job = app_module.get_job_queue().wait(response.get_json()['job_id'], timeout=30)
+    assert job['status'] == 'done' and len(job['result']['images']) == 2
+    assert client.post('/api/images/jobs', json={'uploads': ['0' * 64, first['upload_id']]}).status_code == 400
+
+
+def test_api_responses_are_memoised_and_revalidated(client):
+    description = {'description': "2018 Jeep Compass TrailHawk GCC\nDriven 103,000 km. Selling for 30,000 AED."}
+    first = client.post('/api/process-car', json=description)
+    assert first.status_code == 200 and first.headers['Cache-Control'] == 'private, no-cache'
+    etag = first.headers['ETag']
+    # Same description modulo whitespace: same ETag, answered from the memo
+    again = client.post('/api/process-car', json={'description': description['description'] + '  \n'})
+    assert again.headers['ETag'] == etag and again.data == first.data
+    # 304 is for GET/HEAD only - a POST gets the body whatever If-None-Match says
+    conditional = client.post('/api/process-car', json=description, headers={'If-None-Match': etag})
+    assert conditional.status_code == 200 and conditional.data == first.data
+    assert client.post('/api/process-car', json={'description': 'too short'}).status_code == 400
+
+    backgrounds = client.get('/api/image-backgrounds')
+    assert backgrounds.headers['Cache-Control'] == 'public, max-age=3600'
+    revalidated = client.get('/api/image-backgrounds', headers={'If-None-Match': backgrounds.headers['ETag']})
+    assert revalidated.status_code == 304 and revalidated.data == b''
+    since = client.get('/api/chat-status')
+    assert since.status_code == 200 and since.headers['Cache-Control'] == 'no-cache'
+    assert client.get('/api/chat-status', headers={'If-Modified-Since': since.headers['Last-Modified']}).status_code == 304
+
+    stats = client.get('/api/cache-stats').get_json()['responses']
+    assert (stats['hits'], stats['misses'], stats['not_modified'], stats['uncacheable']) == (4, 4, 2, 1)
+
+
+def test_responses_are_compressed_when_accepted(client):
+    description = {'description': "2018 Jeep Compass TrailHawk GCC\nDriven 103,000 km. Selling for 30,000 AED."}
+    plain = client.post('/api/process-car', json=description)
+    assert 'Content-Encoding' not in plain.headers and 'Accept-Encoding' in plain.headers['Vary']
+
+    packed = client.post('/api/process-car', json=description, headers={'Accept-Encoding': 'gzip'})
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(packed.data) == plain.data
+    assert len(packed.data) < len(plain.data) // 3
+    assert packed.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+    backgrounds = client.get('/api/image-backgrounds', headers={'Accept-Encoding': 'gzip'})
+    assert backgrounds.headers['ETag'].endswith('-gzip"')
+    revalidated = client.get('/api/image-backgrounds', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': backgrounds.headers['ETag']})
+    assert revalidated.status_code == 304 and 'Accept-Encoding' in revalidated.headers['Vary']
+    invalid = client.post('/api/process-car', json={'description': 'too short'})
+    assert invalid.status_code == 400 and 'Accept-Encoding' in invalid.headers['Vary']
+
+    # Both scripts were spliced in precompressed, and the gzip body is kept for the ETag
+    client.post('/api/process-car', json=description, headers={'Accept-Encoding': 'gzip'})
+    compressor = app_module.get_response_compressor()
+    assert (compressor.stats()['static_blocks'], compressor.stats()['variant_hits']) == (2, 1)
+    body = b'{"a": 1}' + b''.join(compressor._static) * 2 + b'tail'
+    assert gzip.decompress(compressor.gzip(body)) == body
+    small = client.get('/api/chat-status', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers  # under min_bytes
+
+
+def test_compact_posts_reference_versioned_scripts(client):
+    description = {'description': "2018 Jeep Compass TrailHawk GCC\nDriven 103,000 km. Selling for 30,000 AED."}
+    inline = client.post('/api/process-car', json=description).get_json()['data']
+    compact = client.post('/api/process-car', json=dict(description, inline_scripts=False))
+    data = compact.get_json()['data']
+    assert 'inquiry_script' not in data and len(compact.data) < 4000
+    assert {key: value for key, value in data.items() if key != 'scripts'} == \
+        {key: value for key, value in inline.items() if not key.endswith('_script')}
+
+    scripts = client.get(data['scripts']['url'])
+    assert scripts.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert scripts.get_json()['inquiry_script'] == inline['inquiry_script']
+    assert scripts.get_json()['delivery_script'] == inline['delivery_script']
+    assert client.get('/api/scripts').get_json()['url'] == data['scripts']['url']
+    assert client.get('/api/scripts/000000000000').status_code == 404
+
+
+def test_batch_endpoint_streams_ndjson_per_item(client):
+    good = "2018 Jeep Compass TrailHawk GCC\nDriven 103,000 km. Selling for 30,000 AED."
+    response = client.post('/api/process-cars', json=[good, {'description': 'too short'}, 'x' * 5001, 42])
+    assert response.status_code == 200 and response.mimetype == 'application/x-ndjson' and response.is_streamed
+    lines = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+    assert [line.get('index') for line in lines] == [0, 1, 2, 3, None]
+    assert lines[0]['success'] and 'scripts' in lines[0]['data']
+    single = client.post('/api/process-car', json={'description': good, 'inline_scripts': False}).get_json()
+    assert lines[0]['data'] == single['data']
+    assert lines[1]['errors'] == ['Description too short - please provide more details (minimum 20 characters)']
+    assert lines[2]['errors'] == ['Description too long - please keep it under 5000 characters']
+    assert lines[3]['errors'] == ['Please enter a car description']
+    assert lines[4] == {'summary': {'total': 4, 'success': 1, 'failed': 3}}
+
+    body = json.dumps({'description': good}) + '\n\nnot json\n' + json.dumps(good) + '\n'
+    response = client.post('/api/process-cars?inline_scripts=true', data=body, content_type='application/x-ndjson')
+    lines = [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+    assert [line.get('success') for line in lines] == [True, False, True, None]
+    assert lines[1]['errors'] == ['Invalid JSON line'] and 'inquiry_script' in lines[2]['data']
+    assert client.post('/api/process-cars', json={'descriptions': []}).status_code == 400
+    assert client.post('/api/process-cars', data='\n\n', content_type='application/x-ndjson').status_code == 400
+
+    # Streamed lines are gzipped one flush at a time - each decodes as soon as it arrives
+    response = client.post('/api/process-cars', json=[good] * 3, headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    assert response.headers['Content-Encoding'] == 'gzip' and 'Accept-Encoding' in response.headers['Vary']
+    decoder = zlib.decompressobj(31)
+    first = decoder.decompress(next(iter(response.response)))
+    assert json.loads(first)['index'] == 0
+    rest = b''.join(decoder.decompress(chunk) for chunk in response.response)
+    assert len((first + rest).splitlines()) == 4
+    response.close()
@@ -0,0 +1,188 @@
+"""
+Car Bot Tests - Verify the description parser and post generation
+Run with: python -m pytest test_car_bot.py
+"""
+
+import json
+from pathlib import Path
+
+import pytest
+
+from car_bot import CarPostingBot
+
+CORPUS_PATH = Path(__file__).parent / 'test_car_bot_corpus.json'
+
+
+def load_corpus():
+    with open(CORPUS_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_parse_matches_reference_corpus():
+    """Parser output must stay identical to the reference corpus (generated by the original parser)"""
+    bot = CarPostingBot()
+    mismatches = []
+    for entry in load_corpus():
+        parsed = bot.parse_car_description(entry['description'])
+        # Canonical gazetteer fields were added after the corpus was recorded
+        assert set(parsed) - set(entry['expected']) == {'brand', 'model', 'trim'}
+        parsed = {key: parsed[key] for key in entry['expected']}
+        if parsed != entry['expected']:
+            mismatches.append((entry['description'][:60], parsed, entry['expected']))
+    assert not mismatches, mismatches[:3]
+
+
+def test_parse_returns_canonical_names():
+    bot = CarPostingBot()
+    info = bot.parse_car_description("2019 NİSSAN x-trail SV GCC, 60,000 km, 55,000 AED")
+    assert (info['brand'], info['model'], info['trim']) == ('Nissan', 'X-Trail', 'SV')
+
+    # "Long Range" in the text must not be read as the Range Rover brand
+    info = bot.parse_car_description("Tesla Model 3 2021 Long Range\nAsking 120,000 AED")
+    assert info['brand'] is None
+
+
+def test_categorize_uses_catalogue_tags():
+    from car_bot import CarCategory
+
+    bot = CarPostingBot()
+    info = bot.parse_car_description("2019 bmw 5 Series, 80,000 km, 150,000 AED")
+    assert bot.categorize_car(info) == CarCategory.POPULAR
+    info = bot.parse_car_description("2019 Lexus ES350 Premium, 80,000 km, 150,000 AED")
+    assert bot.categorize_car(info) == CarCategory.PREMIUM
+    # Infos without canonical fields are identified from make_model
+    assert bot.categorize_car({**info, 'brand': None, 'model': None}) == CarCategory.PREMIUM
+
+
+def test_gazetteer_csv_catalogue(tmp_path):
+    from gazetteer import Gazetteer
+
+    path = tmp_path / 'catalogue.csv'
+    path.write_text('brand,model,trim,aliases,tags\n'
+                    'Land Rover,,,,premium\n'
+                    'Land Rover,Range Rover Sport,,RR Sport,popular\n'
+                    'Land Rover,Range Rover Sport,HSE,,\n'
+                    'Mitsubishi,Pajero,GLS,,\n', encoding='utf-8')
+    gazetteer = Gazetteer.load(path)
+    assert gazetteer.identify('2017 rr sport hse for sale') == \
+        {'brand': 'Land Rover', 'model': 'Range Rover Sport', 'trim': 'HSE'}
+    assert gazetteer.identify('Mitsubishi Pajero GLS') == {'brand': 'Mitsubishi', 'model': 'Pajero', 'trim': 'GLS'}
+    assert gazetteer.tags('Land Rover', 'Range Rover Sport') == {'premium', 'popular'}
+
+
+def test_generate_full_post_example():
+    bot = CarPostingBot()
+    result = bot.generate_full_post(
+        "2018 Jeep Compass TrailHawk GCC with a 2.4L 4-cylinder in Good Condition\n"
+        "Driven 103,000 kilometers, leather seats, cruise control. Selling for 30,000 AED."
+    )
+    assert result['success']
+    assert result['car_info']['make_model'] == 'Jeep Compass'
+    assert result['car_info']['asking_price'] == 30000
+    assert result['car_info']['features'] == ['Leather Seats', 'Cruise Control']
+
+    # Compact shape: same post, static scripts referenced by version
+    compact = bot.generate_full_post(result['car_info']['raw_input'], inline_scripts=False)
+    assert compact.pop('scripts_version') == bot.scripts_version
+    assert dict(compact, **bot.get_static_scripts()) == result
+
+
+def test_read_descriptions_all_formats(tmp_path):
+    from car_bot import read_descriptions
+
+    csv_path = tmp_path / 'inventory.csv'
+    csv_path.write_text('id,description\n1,"2018 Jeep Compass, 30,000 AED"\n2,\n3,Kia Sportage 2022\n', encoding='utf-8')
+    assert list(read_descriptions(csv_path)) == ['2018 Jeep Compass, 30,000 AED', 'Kia Sportage 2022']
+    with pytest.raises(ValueError, match=r"no 'listing' column \(columns: id, description\)"):
+        list(read_descriptions(csv_path, column='listing'))
+
+    jsonl_path = tmp_path / 'inventory.jsonl'
+    jsonl_path.write_text('{"description": "first"}\n\n"second"\n', encoding='utf-8')
+    assert list(read_descriptions(jsonl_path)) == ['first', 'second']
+    jsonl_path.write_text('{"description": "first"}\n{"description": \n"second"\n', encoding='utf-8')
+    skipped = []
+    assert list(read_descriptions(jsonl_path, skipped=skipped)) == ['first', 'second']
+    assert skipped == [2]
+
+    text_path = tmp_path / 'inventory.txt'
+    text_path.write_text('first line\n\nsame listing\n---\nsecond\n---\n', encoding='utf-8')
+    assert list(read_descriptions(text_path)) == ['first line\n\nsame listing', 'second']
+
+
+def test_stream_posts_writes_jsonl(tmp_path):
+    import io
+    from car_bot import write_posts_jsonl
+
+    entries = load_corpus()
+    path = tmp_path / 'inventory.jsonl'
+    path.write_text(''.join(json.dumps({'description': e['description']}) + '\n' for e in entries
+                            if e['description'].strip()), encoding='utf-8')
+
+    out = io.StringIO()
+    counts = write_posts_jsonl(CarPostingBot().stream_posts(path), out)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert counts['total'] == len(lines) == sum(1 for e in entries if e['description'].strip())
+    assert [line['index'] for line in lines] == list(range(len(lines)))
+    assert counts['success'] == sum(1 for line in lines if line['success'])
+
+
+def test_generate_posts_parallel_matches_sequential():
+    from car_bot import generate_posts_parallel
+
+    descriptions = [e['description'] for e in load_corpus()]
+    expected = list(CarPostingBot().generate_posts_batch(descriptions))
+
+    ordered = list(generate_posts_parallel(descriptions, workers=2, chunk_size=7))
+    assert [index for index, _ in ordered] == list(range(len(descriptions)))
+    assert [result for _, result in ordered] == expected
+
+    # Ordered mode reads ahead at most 2 chunks per worker (in flight + buffered) past what it yielded
+    pulled = []
+    def source():
+        for description in descriptions:
+            pulled.append(description)
+            yield description
+    for index, _ in generate_posts_parallel(source(), workers=2, chunk_size=7):
+        assert len(pulled) <= index + 2 * 2 * 7 + 7
+
+    unordered = dict(generate_posts_parallel(descriptions, workers=2, chunk_size=7, ordered=False))
+    assert [unordered[i] for i in range(len(descriptions))] == expected
+
+
+def test_post_cache_hits_and_invalidates(tmp_path):
+    from post_cache import PostCache
+
+    bot = CarPostingBot()
+    description = "2018 Jeep Compass TrailHawk GCC\nDriven 103,000 km. Selling for 30,000 AED."
+    db_path = str(tmp_path / 'posts.db')
+
+    cache = PostCache(max_entries=1, db_path=db_path)
+    first = cache.generate(bot, description)
+    assert first == bot.generate_full_post(description)
+    # CRLF / trailing whitespace variants of the same listing share one entry
+    variant = "  2018 Jeep Compass TrailHawk GCC  \r\nDriven 103,000 km. Selling for 30,000 AED.\n"
+    assert cache.generate(bot, variant) == bot.generate_full_post(variant)
+    assert cache.stats()['hits'] == 1 and cache.generate(bot, description) is first
+    cache.generate(bot, "Kia Sportage 2022, 80,000 AED")
+    assert cache.stats()['evictions'] == 1
+
+    restarted = PostCache(db_path=db_path)
+    assert restarted.generate(bot, description) == first
+    assert restarted.stats()['disk_hits'] == 1
+
+    changed = CarPostingBot()
+    changed.PARSER_VERSION = 'changed'
+    assert changed.content_version != bot.content_version
+    PostCache(db_path=db_path).generate(changed, description)
+    assert PostCache(db_path=db_path).stats()['disk_entries'] == 1
+
+    # The disk tier is capped by rows and age, pruned as entries are written
+    capped = PostCache(db_path=str(tmp_path / 'capped.db'), max_disk_entries=2)
+    for price in (10000, 20000, 30000):
+        capped.generate(bot, f"Kia Sportage 2022, {price} AED")
+    assert (capped.stats()['disk_entries'], capped.stats()['pruned']) == (2, 1)
+    expiring = PostCache(db_path=str(tmp_path / 'capped.db'), disk_ttl_seconds=0)
+    assert expiring.get(expiring.make_key(bot.content_version, "Kia Sportage 2022, 30000 AED"),
+                        bot.content_version) is None
+    expiring.generate(bot, description)
+    assert expiring.stats()['disk_entries'] <= 1
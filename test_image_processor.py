@@ -0,0 +1,400 @@
+import numpy as np
+from PIL import Image
+
+import image_processor
+from image_processor import CarImageProcessor
+
+
+def test_gradient_matches_per_pixel_formula():
+    processor = CarImageProcessor()
+    color1, color2 = (30, 60, 120), (100, 150, 220)
+    width, height = 37, 211
+    pixels = np.asarray(processor._create_gradient_background(width, height, color1, color2))
+
+    for y in range(height):
+        ratio = y / height
+        expected = tuple(int(c1 * (1 - ratio) + c2 * ratio) for c1, c2 in zip(color1, color2))
+        assert (pixels[y] == expected).all()
+
+
+def test_radial_effects_match_reference_and_fallback(monkeypatch):
+    processor = CarImageProcessor()
+    width, height = 161, 97
+    base = (120, 120, 140)
+
+    vignette = np.asarray(processor._add_vignette_effect(Image.new('RGB', (width, height), base)), dtype=int)
+    for x, y in [(0, 0), (width // 2, height // 2), (10, 50), (150, 3)]:
+        dist = ((abs(x - width // 2) / (width // 2)) ** 2 + (abs(y - height // 2) / (height // 2)) ** 2) ** 0.5
+        alpha = min(int(150 * dist), 150)
+        expected = [round(c * (255 - alpha) / 255) for c in base]
+        assert np.abs(vignette[y, x] - expected).max() <= 1
+
+    spotlight = np.asarray(processor._add_spotlight_effect(Image.new('RGB', (width, height), base)), dtype=int)
+    monkeypatch.setattr(image_processor, '_numpy_available', False)
+    assert np.abs(np.asarray(processor._add_vignette_effect(Image.new('RGB', (width, height), base)),
+                             dtype=int) - vignette).max() <= 3
+    assert np.abs(np.asarray(processor._add_spotlight_effect(Image.new('RGB', (width, height), base)),
+                             dtype=int) - spotlight).max() <= 3
+
+
+def test_background_cache_renders_once_and_copies():
+    renders = []
+
+    def render(width, height, preset, listing_id=None):
+        renders.append((preset, width, height))
+        return Image.new('RGB', (width, height), (10, 20, 30))
+
+    cache = image_processor.BackgroundCache(render, max_bytes=2 * 64 * 64 * 4, bucket=32)
+    first = cache.get('gradient_blue', 60, 50, mode='RGBA')
+    first.paste((255, 0, 0, 255), (0, 0, 60, 50))
+    second = cache.get('gradient_blue', 64, 64)
+    assert first.size == (60, 50) and first.mode == 'RGBA'
+    assert second.getpixel((0, 0)) == (10, 20, 30)  # caller's paste never reached the cached base
+    assert renders == [('gradient_blue', 64, 64)]
+
+    cache.get('vignette', 64, 64)
+    cache.get('spotlight', 64, 64)  # budget holds two 64x64 renders
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 3 and stats['evictions'] == 1
+    assert stats['bytes'] <= stats['max_bytes']
+
+
+def test_apply_background_reuses_render_across_batch():
+    processor = CarImageProcessor()
+    photos = [Image.new('RGB', (200, 150), (200, 0, 0)), Image.new('RGB', (196, 150), (0, 200, 0))]
+    results = [processor.apply_background_to_image(photo, 'gradient_gold') for photo in photos]
+    assert [r.size for r in results] == [(700, 525), (686, 525)]
+    assert processor.background_cache.stats()['hits'] == 1
+
+
+def test_textures_are_deterministic_per_listing():
+    import random
+    from image_processor import image_to_bytes, scatter_tile
+
+    photo = Image.new('RGB', (240, 200), (90, 90, 90))
+    state = random.getstate()
+    first = image_to_bytes(CarImageProcessor().apply_background_to_image(photo, 'villa_green', 'car-1'))
+    scatter_tile.cache_clear()
+    again = image_to_bytes(CarImageProcessor().apply_background_to_image(photo, 'villa_green', 'car-1'))
+    other = image_to_bytes(CarImageProcessor().apply_background_to_image(photo, 'villa_green', 'car-2'))
+    assert first == again
+    assert first != other
+    assert random.getstate() == state  # global RNG untouched
+
+
+def test_process_images_pipeline_keeps_order():
+    import io
+
+    def upload(color, size=(400, 300), fmt='JPEG'):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, color).save(buffer, fmt)
+        buffer.seek(0)
+        return buffer
+
+    files = [upload((200, 0, 0)), upload((0, 0, 0), size=(100, 100)), upload((0, 200, 0)),
+             upload((0, 0, 200), fmt='PNG')]
+    # Flat colours all share one perceptual hash - keep every upload here
+    result = CarImageProcessor(max_workers=3).process_images(files, 'gradient_blue', dedupe=False)
+
+    assert result['success'], result
+    assert result['processed_count'] == 3 and len(result['quality_scores']) == 3
+    assert result['warnings'] == ['Image 2: Too small (minimum 200×200px)']
+    sizes = [Image.open(io.BytesIO(data)).size for data in result['individual_images']]
+    assert sizes == [(1200, 630), (1080, 1080), (1080, 1080)]
+    # Centre pixel is the photo itself: input order survives the pool
+    centres = [Image.open(io.BytesIO(data)).getpixel((s[0] // 2, s[1] // 2))
+               for data, s in zip(result['individual_images'], sizes)]
+    assert [max(range(3), key=c.__getitem__) for c in centres] == [0, 1, 2]
+
+
+def test_duplicate_uploads_are_collapsed_and_remembered_per_dealer():
+    import io
+
+    scenes = [(-2.2, -1.2, 1.0, 1.2), (-0.8, -0.2, -0.4, 0.2), (-1.8, -0.1, -1.6, 0.1), (0.2, -0.6, 0.5, -0.3)]
+
+    def upload(scene, size=(400, 300), quality=90):
+        image = Image.effect_mandelbrot(size, scenes[scene], 64).convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=quality)
+        buffer.seek(0)
+        return buffer
+
+    processor = CarImageProcessor(max_workers=2)
+    files = [upload(0), upload(1), upload(0, size=(380, 285), quality=60), upload(2), upload(1)]
+    result = processor.process_images(files, listing_id='L1', dealer_id='dealer')
+
+    assert result['success'], result
+    assert result['processed_count'] == 3
+    assert [(d['image'], d['duplicate_of']) for d in result['duplicates']] == [(3, 1), (5, 2)]
+    assert result['warnings'] == ['Image 3: Duplicate of image 1 - skipped', 'Image 5: Duplicate of image 2 - skipped']
+    assert result['previously_seen'] == []
+
+    # The dealer reuses one photo in their next listing
+    again = processor.process_images([upload(2), upload(3)], listing_id='L2', dealer_id='dealer')
+    assert again['success'], again
+    assert [(s['image'], s['listing_id']) for s in again['previously_seen']] == [(1, 'L1')]
+
+
+def test_hash_index_matches_linear_scan():
+    import random
+
+    rng = random.Random(7)
+    codes = [rng.getrandbits(64) for _ in range(2000)]
+    index = image_processor.HashIndex(radius=6)
+    for i, code in enumerate(codes):
+        index.add(code, i)
+    for i in range(0, 2000, 50):
+        query = codes[i] ^ sum(1 << bit for bit in rng.sample(range(64), i % 7))
+        expected = sorted(j for j, code in enumerate(codes) if image_processor.hamming_distance(query, code) <= 6)
+        assert sorted(value for _, _, value in index.search(query)) == expected
+
+
+def test_decode_for_output_downscales_to_footprint():
+    import io
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (4000, 3000), (120, 60, 30)).save(buffer, 'JPEG')
+    processor = CarImageProcessor()
+
+    cover = processor.decode_for_output(Image.open(io.BytesIO(buffer.getvalue())), 0)
+    on_background = processor.decode_for_output(Image.open(io.BytesIO(buffer.getvalue())), 1, 'gradient_blue')
+    # Never below 2x the footprint (1200x630 cover; 1080/3.5 px on a background), never full size
+    assert 1680 <= cover.width < 4000 and cover.height >= 1260
+    assert 2 * 1080 / 3.5 <= on_background.width <= 1000
+
+    png = io.BytesIO()
+    Image.new('RGB', (6600, 6600), (0, 0, 0)).save(png, 'PNG')
+    reduced = processor.decode_for_output(Image.open(io.BytesIO(png.getvalue())), 1)
+    assert reduced.size == (2200, 2200)  # integer reduce(3), still >= 2 x 1080
+
+
+def test_fused_enhancement_matches_imageenhance_chain():
+    from PIL import ImageFilter
+
+    processor = CarImageProcessor()
+    photo = Image.effect_mandelbrot((320, 240), (-2.2, -1.2, 1.0, 1.2), 64).convert('RGB')
+    red, green, blue = photo.split()
+    photo = Image.merge('RGB', (red, green.point(lambda v: 255 - v), blue.point(lambda v: v * 3 % 256)))
+    photo = photo.filter(ImageFilter.GaussianBlur(1))
+
+    diff = np.abs(np.asarray(processor.enhance_image_professional(photo), dtype=int)
+                  - np.asarray(processor._enhance_image_reference(photo), dtype=int))
+    assert diff.max() <= 5
+    assert diff.mean() < 0.1
+
+
+def test_frugal_compositing_keeps_framing():
+    from PIL import ImageChops
+
+    photo = Image.new('RGB', (640, 480), (20, 20, 20))
+    boxes = []
+    for frugal in (False, True):
+        processor = CarImageProcessor(frugal_compositing=frugal)
+        output_size = processor.output_size(1) if frugal else None
+        composed = processor.apply_background_to_image(photo, 'simple_white', output_size=output_size)
+        assert composed.mode == 'RGB'
+        final = processor.optimize_for_facebook_professional(composed, 1)
+        boxes.append(ImageChops.invert(final.convert('L')).point(lambda v: 255 if v > 64 else 0).getbbox())
+
+    assert all(abs(a - b) <= 1 for a, b in zip(*boxes)), boxes
+
+
+def test_memory_budget_queues_and_bounds_in_flight():
+    import threading
+    import time
+    from image_processor import MemoryBudget
+
+    budget = MemoryBudget(100)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def task(nbytes):
+        with budget.reserve(nbytes):
+            with lock:
+                active[0] += nbytes
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= nbytes
+
+    threads = [threading.Thread(target=task, args=(n,)) for n in (60, 60, 30, 150, 40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = budget.stats()
+    assert peak[0] <= 150  # never above budget, except the oversized task running alone
+    assert stats['in_use_bytes'] == 0 and stats['queue_depth'] == 0
+    assert stats['admitted'] == 5 and stats['oversized'] == 1 and stats['queued'] >= 1
+    assert stats['peak_bytes'] <= 150
+
+
+def test_estimate_task_memory_uses_header_only():
+    import io
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (4000, 3000)).save(buffer, 'JPEG')
+    upload = Image.open(io.BytesIO(buffer.getvalue()))
+    processor = CarImageProcessor()
+
+    drafted = processor.estimate_task_memory(upload, 1, 'gradient_blue')
+    full = CarImageProcessor(draft_decode=False, frugal_compositing=False).estimate_task_memory(
+        upload, 1, 'gradient_blue')
+    assert drafted < full / 10
+    assert full > 4 * 4000 * 3000 * 3.5 ** 2  # the 3.5x RGBA canvas dominates the old path
+
+
+def test_quality_scoring_ranks_and_selects_best():
+    from PIL import ImageEnhance, ImageFilter
+
+    processor = CarImageProcessor()
+    sharp = Image.effect_noise((640, 480), 60).convert('RGB')
+    sharp = Image.merge('RGB', (sharp.getchannel(0), sharp.getchannel(0).point(lambda v: 255 - v),
+                                Image.new('L', sharp.size, 90)))
+    blurred = sharp.filter(ImageFilter.GaussianBlur(6))
+    dark = ImageEnhance.Brightness(sharp).enhance(0.2)
+
+    scoring = processor.score_images([processor.quality_proxy(image) for image in (blurred, sharp, dark)])
+    scores = [metrics['score'] for metrics in scoring['metrics']]
+    assert scores[1] > scores[0] and scores[1] > scores[2]
+    assert scoring['metrics'][1]['sharpness'] > scoring['metrics'][0]['sharpness']
+    assert set(scoring['timings_ms']) >= {'brightness', 'contrast', 'sharpness', 'saturation'}
+    assert processor.select_best_images(scores, 2)[0] == 1
+    assert processor.calculate_image_quality_score(sharp) == scores[1]
+
+    # One photo that can't be scored gets a neutral score instead of failing the listing
+    broken = sharp.copy()
+    broken.close()
+    scoring = processor.score_images([processor.quality_proxy(sharp), broken, Image.new('I;16', (1, 1))])
+    assert [metrics['score'] for metrics in scoring['metrics']][:2] == [scores[1], 50.0]
+    assert processor.calculate_image_quality_score(broken) == 50
+
+
+def test_image_store_serves_repeat_batches_without_decoding(tmp_path, monkeypatch):
+    import io
+    from image_store import ImageStore, hash_source
+
+    scenes = [(-2.2, -1.2, 1.0, 1.2), (-0.8, -0.2, -0.4, 0.2), (-1.8, -0.1, -1.6, 0.1)]
+    photos = []
+    for scene in scenes:
+        buffer = io.BytesIO()
+        Image.effect_mandelbrot((400, 300), scene, 64).convert('RGB').save(buffer, 'JPEG')
+        photos.append(buffer.getvalue())
+
+    processor = CarImageProcessor(max_workers=2, image_store=ImageStore(tmp_path))
+    first = processor.process_images([io.BytesIO(p) for p in photos], 'gradient_blue', listing_id='L1')
+    assert first['success'] and first['metadata']['store_hits'] == 0
+    assert all(type(data) is bytes for data in first['individual_images'] + first['best_images'])
+
+    # A restarted process finds the same entries on disk and never decodes
+    processor = CarImageProcessor(max_workers=2, image_store=ImageStore(tmp_path))
+    monkeypatch.setattr(processor, 'decode_for_output', lambda *args: 1 / 0)
+    monkeypatch.setattr(image_processor, 'fingerprint_upload', lambda source: 1 / 0)
+    again = processor.process_images([io.BytesIO(p) for p in photos], 'gradient_blue', listing_id='L1')
+    assert again['success'], again
+    assert again['metadata']['store_hits'] == 3
+    assert again['individual_images'] == first['individual_images']
+    assert again['quality_metrics'] == first['quality_metrics']
+
+    # Least recently used entries go first once the store is over its size limit
+    store = processor.image_store
+    sizes = sorted(len(data) for data in first['individual_images'])
+    assert store.collect(max_bytes=sizes[-1]) == 2 and store.stats()['entries'] == 1
+    assert len(list(tmp_path.glob('*/*/*'))) == 2  # image + sidecar
+    # Fingerprints leave with the last entry for their source
+    assert sum(store.fingerprint(source) is not None for source in map(hash_source, map(io.BytesIO, photos))) == 1
+    store.clear()
+
+    # save_for_web keys on the pixels and looks the key up before encoding
+    image = Image.open(io.BytesIO(photos[0])).convert('RGB')
+    path = processor.save_for_web(image, 'car.jpg')
+    edited = processor.save_for_web(image.rotate(180), 'car.jpg')
+    assert edited is not None and edited != path
+    monkeypatch.setattr(Image.Image, 'save', lambda *args, **kwargs: 1 / 0)
+    assert processor.save_for_web(image.copy(), 'car.jpg') == path
+
+
+def test_encode_image_targets_and_streaming_generator():
+    import io
+    from image_processor import encode_image
+
+    photo = Image.effect_mandelbrot((300, 200), (-2.2, -1.2, 1.0, 1.2), 64).convert('RGB')
+    view = encode_image(photo)
+    assert isinstance(view, memoryview)
+    stream = io.BytesIO()
+    assert encode_image(photo, stream) == len(view) and stream.getvalue() == view
+    buffer = bytearray(len(view) + 100)
+    assert encode_image(photo, buffer) == view and buffer[len(view):] == bytes(100)
+
+    scenes = [(-2.2, -1.2, 1.0, 1.2), (-0.8, -0.2, -0.4, 0.2), (-1.8, -0.1, -1.6, 0.1), (0.2, -0.6, 0.5, -0.3)]
+    files = []
+    for scene in scenes:
+        buffer = io.BytesIO()
+        Image.effect_mandelbrot((400, 300), scene, 64).convert('RGB').save(buffer, 'JPEG')
+        buffer.seek(0)
+        files.append(buffer)
+    files.insert(1, io.BytesIO(files[0].getvalue()))
+
+    records = list(CarImageProcessor(max_workers=2).iter_processed_images(files, 'gradient_blue'))
+    assert records[0] == {'success': False, 'error': 'Image 2: Duplicate of image 1 - skipped'}
+    photos = records[1:]
+    assert [r['image'] for r in photos] == [1, 3, 4, 5] and [r['position'] for r in photos] == [0, 1, 2, 3]
+    assert all(isinstance(r['data'], memoryview) and 0 < r['metrics']['score'] <= 100 for r in photos)
+    assert Image.open(io.BytesIO(photos[0]['data'])).size == (1200, 630)
+
+
+def test_encoder_hits_size_and_ssim_targets_and_caches_quality():
+    import io
+    from image_processor import ImageEncoder, encode_image, ssim
+
+    photo = Image.effect_mandelbrot((600, 400), (-2.2, -1.2, 1.0, 1.2), 64).convert('RGB')
+    encoder = ImageEncoder()
+    target = len(encode_image(photo, format='WEBP', quality=60)) + 50
+    first = encoder.encode(photo, 'webp', target_bytes=target, cache_key=('none', photo.size))
+    assert first['target_met'] and first['bytes'] <= target and first['mime'] == 'image/webp'
+    assert len(encode_image(photo, format='WEBP', quality=first['quality'] + 1, method=4)) > target
+    assert first['trials'] > 1
+
+    again = encoder.encode(photo, 'webp', target_bytes=target, cache_key=('none', photo.size))
+    assert again['trials'] == 1 and again['quality'] == first['quality']
+    assert encoder.stats()['webp']['cache_hits'] == 1
+
+    by_ssim = encoder.encode(photo, 'jpeg', target_ssim=0.99)
+    assert by_ssim['ssim'] >= 0.99
+    assert ssim(photo, Image.open(io.BytesIO(encode_image(photo, quality=by_ssim['quality'] - 1,
+                                                          progressive=True)))) < 0.99
+
+    result = CarImageProcessor(output_format='webp').process_images(
+        [io.BytesIO(encode_image(photo)), io.BytesIO(encode_image(photo.rotate(90, expand=True)))])
+    assert result['success'], result
+    assert Image.open(io.BytesIO(result['individual_images'][0])).format == 'WEBP'
+    assert result['metadata']['encoding']['mime'] == 'image/webp'
+
+
+def test_renditions_come_from_one_decode_and_match_direct_resizes(monkeypatch):
+    import io
+
+    buffer = io.BytesIO()
+    Image.effect_mandelbrot((1600, 1200), (-2.2, -1.2, 1.0, 1.2), 64).convert('RGB').save(buffer, 'JPEG')
+    processor = CarImageProcessor()
+    decodes = []
+    decode_to = processor._decode_to
+    monkeypatch.setattr(processor, '_decode_to', lambda *args: decodes.append(args) or decode_to(*args))
+
+    result = processor.render_renditions(io.BytesIO(buffer.getvalue()), 'gradient_blue', 'L1')
+    assert result['success'], result
+    assert len(decodes) == 1
+    renditions = result['renditions']
+    assert {name: r['size'] for name, r in renditions.items()} == processor.RENDITIONS
+    assert renditions['tiktok']['data'] == renditions['snapchat']['data']
+    for rendition in renditions.values():
+        assert Image.open(io.BytesIO(rendition['data'])).size == rendition['size']
+
+    # Pyramid levels vs. resampling every rendition straight from the master
+    master = Image.effect_mandelbrot((2400, 1800), (-2.2, -1.2, 1.0, 1.2), 64).convert('RGB')
+    pyramid = processor.build_renditions(master, {'thumb': (300, 225), 'story': (1080, 1920)}, fit='crop')
+    direct = master.resize((300, 225), Image.Resampling.LANCZOS)
+    difference = np.abs(np.asarray(pyramid['thumb'], dtype=np.int16) - np.asarray(direct, dtype=np.int16))
+    assert difference.mean() < 2
+    assert pyramid['story'].size == (1080, 1920)
@@ -0,0 +1,312 @@
+"""
+Upload Spool - streams photo uploads to disk in chunks
+Request bodies are read in CHUNK_SIZE pieces straight into a spool file while
+the SHA-256 is computed and the image header is sniffed on the fly, so a file
+that is not a photo we can use - or is too big - is rejected after its first
+few KB instead of after the whole body has arrived. Finished uploads are named
+by their content hash; uploading the same photo twice stores it once.
+
+Uploads can be sent in one request or resumed across several (see append):
+each request carries the byte offset it starts at and the total length.
+
+Layout:  <root>/partial/<upload_id>.part    uploads in progress
+         <root>/ab/<sha256>.<ext>           complete uploads
+Both are deleted once they are older than the TTL.
+"""
+
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_BYTES = 64 * 1024          # give up on a header that hasn't parsed by now
+MIN_DIMENSION = 200              # same bounds process_images applies
+MAX_DIMENSION = 10000
+
+# Magic bytes of the formats the app accepts (ALLOWED_EXTENSIONS)
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png', 'png'),
+    (b'GIF87a', 'gif', 'gif'),
+    (b'GIF89a', 'gif', 'gif'),
+)
+_DIGEST_RE = re.compile(r'[0-9a-f]{64}')
+_UPLOAD_ID_RE = re.compile(r'[0-9a-f]{32}')
+
+
+def sniff_format(header: bytes) -> Optional[tuple]:
+    """(format, extension) from an upload's first bytes, or None if it isn't an accepted image"""
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp', 'webp'
+    for magic, fmt, ext in _SIGNATURES:
+        if header.startswith(magic):
+            return fmt, ext
+    return None
+
+
+def _webp_size(header: bytes) -> Optional[tuple]:
+    """Canvas size from the first WebP chunk (Pillow needs the whole file to open WebP)"""
+    chunk = header[12:16]
+    if chunk == b'VP8X' and len(header) >= 30:
+        return (int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1)
+    if chunk == b'VP8 ' and len(header) >= 30 and header[23:26] == b'\x9d\x01\x2a':
+        return (int.from_bytes(header[26:28], 'little') & 0x3fff, int.from_bytes(header[28:30], 'little') & 0x3fff)
+    if chunk == b'VP8L' and len(header) >= 25 and header[20] == 0x2f:
+        bits = int.from_bytes(header[21:25], 'little')
+        return ((bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1)
+    return None
+
+
+def sniff_size(header: bytes, fmt: str) -> Optional[tuple]:
+    """(width, height) once enough of the header has arrived, else None - never decodes pixels"""
+    if fmt == 'webp':
+        return _webp_size(header)
+    try:
+        with Image.open(io.BytesIO(header)) as img:  # lazy - reads the header only
+            return img.size
+    except Exception:
+        return None  # header not complete yet
+
+
+class _Upload:
+    """One upload being written: spool file, running hash and header state"""
+
+    def __init__(self, path: Path, total: Optional[int] = None):
+        self.path = path
+        self.total = total   # declared length of a resumable upload
+        self.lock = threading.Lock()  # one piece at a time
+        self.digest = hashlib.sha256()
+        self.received = 0
+        self.head = b''
+        self.format = None   # (format, ext) once sniffed
+        self.size = None     # (width, height) once sniffed
+
+    def resume(self):
+        """Rebuild hash and header state from a partial file left by an earlier process"""
+        with open(self.path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                self.check(chunk)
+                self.digest.update(chunk)
+                self.received += len(chunk)
+
+    def check(self, chunk: bytes) -> Optional[str]:
+        """Sniff the header as it arrives; returns an error once the upload can be rejected"""
+        if self.size is not None:
+            return None
+        self.head += chunk[:SNIFF_BYTES - len(self.head)]
+        if self.format is None:
+            if len(self.head) < 12:
+                return None
+            self.format = sniff_format(self.head)
+            if self.format is None:
+                return 'Invalid format (JPG, PNG, GIF, WebP)'
+        self.size = sniff_size(self.head, self.format[0])
+        if self.size is None:
+            return 'Unreadable image header' if len(self.head) >= SNIFF_BYTES else None
+        self.head = b''
+        width, height = self.size
+        if width < MIN_DIMENSION or height < MIN_DIMENSION:
+            return f'Too small (minimum {MIN_DIMENSION}×{MIN_DIMENSION}px)'
+        if width > MAX_DIMENSION or height > MAX_DIMENSION:
+            return f'Too large (maximum {MAX_DIMENSION}×{MAX_DIMENSION}px)'
+        return None
+
+
+class UploadSpool:
+    """Content-hashed spool directory for streamed, optionally resumable, photo uploads"""
+
+    def __init__(self, root='uploads', max_bytes: int = 50 * 1024 * 1024, ttl_seconds: float = 24 * 3600):
+        self.root = Path(root)
+        self.partial_dir = self.root / 'partial'
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._uploads: Dict[str, _Upload] = {}  # upload id -> state of resumable uploads
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self.counters = {'accepted': 0, 'duplicates': 0, 'rejected': 0, 'resumed': 0, 'bytes': 0, 'expired': 0}
+
+    @classmethod
+    def from_env(cls, root='uploads') -> 'UploadSpool':
+        """Configure from CARBOT_UPLOAD_DIR / CARBOT_UPLOAD_MB (per photo, default 50) / CARBOT_UPLOAD_TTL_HOURS (default 24)"""
+        return cls(root=os.getenv('CARBOT_UPLOAD_DIR', root),
+                   max_bytes=int(os.getenv('CARBOT_UPLOAD_MB', '50')) * 1024 * 1024,
+                   ttl_seconds=float(os.getenv('CARBOT_UPLOAD_TTL_HOURS', '24')) * 3600)
+
+    # ==================== STREAMING ====================
+
+    def _reject(self, upload: _Upload, error: str, status: int) -> Dict:
+        upload.path.unlink(missing_ok=True)
+        with self._lock:
+            self.counters['rejected'] += 1
+        return {'success': False, 'error': error, 'status': status}
+
+    def _receive(self, upload: _Upload, stream, total: Optional[int]) -> Optional[Dict]:
+        """Copy stream into the spool file chunk by chunk; returns a rejection or None"""
+        start = upload.received
+        with open(upload.path, 'ab') as f:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                upload.received += len(chunk)
+                limit = self.max_bytes if total is None else min(total, self.max_bytes)
+                if upload.received > limit:
+                    f.close()
+                    if total is not None and upload.received > total:
+                        return self._reject(upload, 'Upload is longer than declared', 400)
+                    return self._reject(upload, f'File too large (maximum {self.max_bytes // (1024 * 1024)} MB)', 413)
+                error = upload.check(chunk)
+                if error:
+                    f.close()
+                    return self._reject(upload, error, 415)
+                upload.digest.update(chunk)
+                f.write(chunk)
+        with self._lock:
+            self.counters['bytes'] += upload.received - start
+        return None
+
+    def _finish(self, upload: _Upload) -> Dict:
+        """Move a complete upload to its content-hashed name"""
+        if upload.size is None:
+            return self._reject(upload, 'Unreadable image header', 415)
+        digest = upload.digest.hexdigest()
+        fmt, ext = upload.format
+        final = self.root / digest[:2] / f"{digest}.{ext}"
+        final.parent.mkdir(exist_ok=True)
+        duplicate = final.exists()
+        if duplicate:
+            upload.path.unlink()
+            os.utime(final)  # keep it alive for another TTL
+        else:
+            os.replace(upload.path, final)
+        with self._lock:
+            self.counters['duplicates' if duplicate else 'accepted'] += 1
+        return {'success': True, 'complete': True, 'upload_id': digest, 'format': fmt, 'size': list(upload.size),
+                'bytes': upload.received, 'duplicate': duplicate}
+
+    def spool(self, stream, content_length: Optional[int] = None) -> Dict:
+        """
+        Stream a whole upload to disk in one go
+        Returns {'success', 'upload_id' (SHA-256), 'format', 'size', 'bytes', 'duplicate'} or
+        {'success': False, 'error', 'status'} - oversized bodies are refused before reading
+        """
+        self.cleanup()
+        if content_length is not None and content_length > self.max_bytes:
+            with self._lock:
+                self.counters['rejected'] += 1
+            return {'success': False, 'error': f'File too large (maximum {self.max_bytes // (1024 * 1024)} MB)',
+                    'status': 413}
+        upload = _Upload(self.partial_dir / f"{uuid.uuid4().hex}.part")
+        rejection = self._receive(upload, stream, content_length)
+        return rejection or self._finish(upload)
+
+    # ==================== RESUMABLE ====================
+
+    def start(self, total: int) -> Dict:
+        """Open a resumable upload of total bytes; returns {'success', 'upload_id'}"""
+        self.cleanup()
+        if total > self.max_bytes:
+            with self._lock:
+                self.counters['rejected'] += 1
+            return {'success': False, 'error': f'File too large (maximum {self.max_bytes // (1024 * 1024)} MB)',
+                    'status': 413}
+        upload_id = uuid.uuid4().hex
+        upload = _Upload(self.partial_dir / f"{upload_id}.part", total)
+        upload.path.touch()
+        with self._lock:
+            self._uploads[upload_id] = upload
+        return {'success': True, 'upload_id': upload_id, 'offset': 0}
+
+    def _session(self, upload_id: str) -> Optional[_Upload]:
+        if not _UPLOAD_ID_RE.fullmatch(upload_id):
+            return None
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+        if upload is None:
+            path = self.partial_dir / f"{upload_id}.part"
+            if not path.is_file():
+                return None
+            upload = _Upload(path)  # started before a restart
+            upload.resume()
+            with self._lock:
+                upload = self._uploads.setdefault(upload_id, upload)
+                self.counters['resumed'] += 1
+        return upload
+
+    def offset(self, upload_id: str) -> Optional[int]:
+        """Bytes received so far for a resumable upload (where the client resumes), or None"""
+        upload = self._session(upload_id)
+        return None if upload is None else upload.received
+
+    def append(self, upload_id: str, stream, offset: int, total: int) -> Dict:
+        """
+        Write the next piece of a resumable upload, starting at offset of total bytes
+        A piece that doesn't start where the last one ended gets status 409 and the
+        current offset, one declaring a different total gets 400; the final piece
+        returns the same result as spool()
+        """
+        upload = self._session(upload_id)
+        if upload is None:
+            return {'success': False, 'error': 'Upload not found (it may have expired)', 'status': 404}
+        with upload.lock:
+            with self._lock:
+                current = self._uploads.get(upload_id) is upload
+            if not current:  # finished or rejected while this piece waited for the lock
+                return {'success': False, 'error': 'Upload not found (it may have expired)', 'status': 404}
+            if upload.total is None:
+                upload.total = total  # resumed after a restart - the first piece declares it again
+            if total != upload.total:
+                return {'success': False, 'error': 'Total length mismatch', 'total': upload.total, 'status': 400}
+            if offset != upload.received:
+                return {'success': False, 'error': 'Offset mismatch', 'offset': upload.received, 'status': 409}
+            rejection = self._receive(upload, stream, total)
+            if rejection is None and upload.received < total:
+                return {'success': True, 'complete': False, 'upload_id': upload_id, 'offset': upload.received}
+            with self._lock:
+                self._uploads.pop(upload_id, None)
+            return rejection or self._finish(upload)
+
+    # ==================== LOOKUP ====================
+
+    def path(self, digest: str) -> Optional[str]:
+        """File path of a complete upload by its SHA-256, or None"""
+        if not _DIGEST_RE.fullmatch(digest):
+            return None
+        for path in (self.root / digest[:2]).glob(f"{digest}.*"):
+            return str(path)
+        return None
+
+    def cleanup(self, force: bool = False) -> int:
+        """Delete uploads (complete or partial) older than the TTL (at most once a minute unless forced)"""
+        now = time.time()
+        if not force and now - self._last_cleanup < 60:
+            return 0
+        self._last_cleanup = now
+        expired = 0
+        for path in list(self.root.glob('??/*.*')) + list(self.partial_dir.glob('*.part')):
+            try:
+                if path.stat().st_mtime < now - self.ttl_seconds:
+                    path.unlink()
+                    expired += 1
+            except OSError:
+                pass
+        with self._lock:
+            for upload_id, upload in list(self._uploads.items()):
+                if not upload.path.exists():
+                    del self._uploads[upload_id]
+            self.counters['expired'] += expired
+        return expired
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats['in_progress'] = len(self._uploads)
+        stats['max_bytes'] = self.max_bytes
+        stats['ttl_seconds'] = self.ttl_seconds
+        return stats